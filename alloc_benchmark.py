@@ -0,0 +1,43 @@
+""" The microbenchmark of the master's server allocation at growing cluster sizes """
+from __future__ import print_function
+import random
+import time
+from clupy.master.registration import ServerRegistrationServiceSingleton
+from clupy.utils.config import MasterConfigure
+
+def registered_service(server_count):
+    """ a registration service with server_count servers of random resources """
+    service = ServerRegistrationServiceSingleton.ServerRegistrationService(\
+        MasterConfigure("clupy.master.yaml"))
+    for index in range(server_count):
+        service.register_server("clupy://node{}:8080".format(index), {
+            "cores": str(random.choice([8, 16, 32, 64])),
+            "workers": str(random.choice([8, 16, 32, 64])),
+            "free_memory": str(random.randint(1, 64) << 30),
+            "load_average": str(random.random() * 8),
+            "run_queue": str(random.randint(0, 4)),
+        })
+    return service
+
+def allocation_latency(server_count, request_count=10, rounds=1000):
+    """ the mean seconds of an allocation of request_count servers, the clients
+        release their servers after a while so that allocations both lease free
+        servers and share busy ones """
+    service = registered_service(server_count)
+    held = []
+    elapsed = 0.0
+    for round_index in range(rounds):
+        client_id = "client{}".format(round_index)
+        start = time.perf_counter()
+        _, server_list = service.allocate_server_resources(client_id, request_count)
+        elapsed = elapsed + time.perf_counter() - start
+        held.append((client_id, [server for server, _ in server_list]))
+        if len(held) > 50:
+            client_id, server_urls = held.pop(0)
+            service.retain_server_resources(client_id, server_urls, to_free=True)
+    return elapsed / rounds
+
+if __name__ == "__main__":
+    for count in (100, 10000, 100000):
+        print("{:>7} servers: {:8.1f} us per allocation".format(\
+            count, allocation_latency(count) * 1e6))
@@ -1,32 +1,140 @@
 """ the entry point of the CluPy package """
 from __future__ import print_function
-from .client.execution import RemoteExecutionServiceSingleton
+import time
+from concurrent.futures import FIRST_COMPLETED, FIRST_EXCEPTION, ALL_COMPLETED
+from .client.execution import RemoteExecutionServiceSingleton, CompletionWaiter
+from .client.aio import aparallel, amap, aclose, aservice
+from .client.cache import ResultCacheSingleton
+from .client.services import resolve_entry_point
+from .client.spool import load_result
 
 def set_master_url(master_url):
     """ set the master URL for remote methods invocation """
     RemoteExecutionServiceSingleton.master_url = master_url
 
-def parallel(func, server_count=0):
-    """ the routine to parallize the execution of func across the cluster """
+def parallel(func, server_count=0, cache=False, priority=0, weight=1):
+    """ the routine to parallize the execution of func across the cluster,
+        with cache set, results are memoized on the client, calls with a higher
+        priority are dispatched first, and busy functions share the servers
+        in proportion to their weights """
     remote_execution = RemoteExecutionServiceSingleton()
-    return remote_execution.execute(func, server_count)
+    return remote_execution.execute(func, server_count, cache, priority, weight)
+
+def map_reduce(map_fn, reduce_fn, items, server_count=0, priority=0, weight=1):
+    """ remotely apply map_fn to every item and combine the results with reduce_fn,
+        which must be associative and commutative, the results are reduced on the
+        servers, locally first and then pairwise across the servers in a tree, so
+        that only the final value reaches the client, returns its future """
+    remote_execution = RemoteExecutionServiceSingleton()
+    return remote_execution.map_reduce(map_fn, reduce_fn, items, server_count, priority, weight)
+
+def actor(cls, server_count=0):
+    """ the routine to construct instances of cls on the cluster, calling the
+        returned function constructs an instance on one of the servers and returns
+        its ActorHandle, the methods of the handle return futures, the calls of
+        an instance run one at a time in the order they were made """
+    remote_execution = RemoteExecutionServiceSingleton()
+    return remote_execution.actor(cls, server_count)
+
+def service(packages=None, entry_points=None, port=8080, server_count=1, \
+            max_batch_size=0, max_batch_wait=0):
+    """ publish the entry points, functions or "module.function" names, on port of
+        server_count servers, POST /<name> with a JSON input answers its JSON output,
+        the concurrent requests are coalesced into micro-batches of at most
+        max_batch_size inputs waiting at most max_batch_wait milliseconds, 0 for the
+        server nodes' defaults, an entry point is called with the list of the inputs
+        of a batch and returns the list of their outputs, the packages must be
+        installed on the server nodes, returns the URLs of the entry points """
+    remote_execution = RemoteExecutionServiceSingleton()
+    resolved = [resolve_entry_point(entry) for entry in entry_points or []]
+    future = remote_execution.publish(dict(resolved), {
+        "port": port,
+        "packages": list(packages or []),
+        "max_batch_size": max_batch_size,
+        "max_batch_wait": max_batch_wait,
+    }, server_count)
+    future.wait(0)
+    if not future.successful:
+        raise future.failure
+    remote_execution.published_endpoints.extend(future.value)
+    return future.value
+
+def speculation_info():
+    """ how often straggling calls were re-executed speculatively, per function """
+    remote_execution = RemoteExecutionServiceSingleton()
+    return remote_execution.speculation_info()
+
+def stats():
+    """ per function latency histograms of the queue, serialize, transfer, remote,
+        deserialize and total phases of the remote calls """
+    remote_execution = RemoteExecutionServiceSingleton()
+    return remote_execution.stats()
+
+def cache_info():
+    """ the hit/miss counters and sizes of the client side result cache """
+    remote_execution = RemoteExecutionServiceSingleton()
+    return ResultCacheSingleton(remote_execution.config).info()
 
 def wait_all(futures, time_out=0):
     """ waits for the completion of a list of Future objects """
-    if futures:
-        import time
-        wait_time = 0.0
-        while time_out == 0 or wait_time < float(time_out):
-            is_completed = True
-            for fut in futures:
-                if not fut.completed:
-                    is_completed = False
-                    break
-            if is_completed:
+    wait(futures, time_out, ALL_COMPLETED)
+
+def wait(futures, time_out=0, return_when=ALL_COMPLETED):
+    """ waits for the Future objects until return_when is met, i.e. FIRST_COMPLETED,
+        FIRST_EXCEPTION or ALL_COMPLETED, time_out of 0 waits forever,
+        returns a (done, not_done) pair of sets """
+    futures = set(futures)
+    waiter = CompletionWaiter()
+    done = set()
+    for fut in futures:
+        if not fut.add_waiter(waiter):
+            done.add(fut)
+    deadline = time.time() + time_out if time_out > 0 else None
+    with waiter.condition:
+        while True:
+            done.update(waiter.completed_futures)
+            waiter.completed_futures = []
+            if len(done) == len(futures) \
+                    or (return_when == FIRST_COMPLETED and done) \
+                    or (return_when == FIRST_EXCEPTION and \
+                        any(not fut.successful for fut in done)):
+                break
+            remaining = deadline - time.time() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
                 break
-            time.sleep(0.1)
-            if time_out > 0:
-                wait_time = wait_time + 0.1
+            waiter.condition.wait(remaining)
+    for fut in futures:
+        fut.remove_waiter(waiter)
+    return done, futures - done
+
+def as_completed(futures, time_out=0):
+    """ iterates over the Future objects in the order of their completion,
+        time_out of 0 waits forever, otherwise TimeoutError is raised once
+        time_out seconds have elapsed with futures still pending """
+    pending = set(futures)
+    waiter = CompletionWaiter()
+    deadline = time.time() + time_out if time_out > 0 else None
+    try:
+        for fut in list(pending):
+            if not fut.add_waiter(waiter):
+                pending.discard(fut)
+                yield fut
+        while pending:
+            with waiter.condition:
+                while not waiter.completed_futures:
+                    remaining = deadline - time.time() if deadline is not None else None
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError("{} futures are not completed".format(len(pending)))
+                    waiter.condition.wait(remaining)
+                completed = waiter.completed_futures
+                waiter.completed_futures = []
+            for fut in completed:
+                if fut in pending:
+                    pending.discard(fut)
+                    yield fut
+    finally:
+        for fut in pending:
+            fut.remove_waiter(waiter)
 
 def stop_remote_execution():
     """ stops all remote execution related stuff """
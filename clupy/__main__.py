@@ -8,10 +8,11 @@ MAIN_PARSER.add_argument('-m', '--master', action='store_true', help='to start a
 MAIN_PARSER.add_argument('-s', '--server', action='store_true', help='to start a server node')
 MAIN_PARSER.add_argument('--master-url', help='to specify master server url')
 MAIN_PARSER.add_argument('-c', '--client', help="to run in client mode")
+MAIN_PARSER.add_argument('-p', '--publish', help="to publish the services of a service file")
 
 MAIN_ARGS = MAIN_PARSER.parse_args()
 
-if MAIN_ARGS.client:
+if MAIN_ARGS.client or MAIN_ARGS.publish:
     MAIN_ARGS.server = False
     MAIN_ARGS.master = False
 if MAIN_ARGS.server:
@@ -31,4 +32,11 @@ if MAIN_ARGS.client:
             print("Error: must provide --master_url information")
         else:
             COMMAND_OBJ = commands.ClientCommand(MAIN_ARGS)
-            COMMAND_OBJ.query_master_info()
\ No newline at end of file
+            COMMAND_OBJ.query_master_info()
+
+if MAIN_ARGS.publish:
+    if MAIN_ARGS.master_url is None:
+        print("Error: must provide --master_url information")
+    else:
+        COMMAND_OBJ = commands.ClientCommand(MAIN_ARGS)
+        COMMAND_OBJ.publish_service()
\ No newline at end of file
@@ -0,0 +1,243 @@
+""" client side handles of actors, instances of a class living on a server node
+    whose methods are called remotely """
+import collections
+import inspect
+import json
+import time
+from datetime import datetime
+from tornado import gen
+from ..utils import wire
+from ..utils.binding import BindingPlan
+from .batching import OneExecutionRequestContext
+from .modules import FunctionModules
+
+def actor_wrapper(service_object, cls, server_count):
+    """ the function for wrapping cls, calling it constructs an instance on a
+        server node and returns its ActorHandle """
+    plan = BindingPlan(cls)
+
+    class ActorConstructor(object):
+        """ the wrapped class object """
+        def __call__(self, *args, **kwargs):
+            return service_object.create_actor(cls, plan.pack(args, kwargs), server_count)
+    return ActorConstructor()
+
+class ActorMethod(object):
+    """ a method of an actor, calling it returns the RemoteExecutionFuture of the call """
+
+    def __init__(self, handle, name, plan):
+        self._handle = handle
+        self._name = name
+        self._plan = plan
+
+    def __call__(self, *args, **kwargs):
+        return self._handle.service.call_actor(self._handle.actor_id, self._name, \
+                                               self._plan.pack(args, kwargs))
+
+class ActorHandle(object):
+    """ the handle of an actor, its methods are called like the instance's ones
+        and return futures, the calls run one at a time in the order they were
+        made, ready is the future of the construction """
+
+    def __init__(self, service, cls, actor_id, ready):
+        self.service = service
+        self.actor_id = actor_id
+        self.ready = ready
+        self._cls = cls
+        self._methods = {}
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        method = self._methods.get(name)
+        if method is None:
+            static_attr = inspect.getattr_static(self._cls, name)
+            attr = getattr(self._cls, name)
+            if not callable(attr):
+                raise AttributeError("{} is not a method of {}".format(name, self._cls.__name__))
+            method = ActorMethod(self, name, \
+                BindingPlan(attr, bound=not isinstance(static_attr, staticmethod)))
+            self._methods[name] = method
+        return method
+
+    def destroy(self):
+        """ drop the instance on the server, calls made afterwards fail, returns
+            the future of the destruction """
+        return self.service.destroy_actor(self.actor_id)
+
+class ClientActor(object):
+    """ the client side state of an actor, the calls not sent yet, the sequence
+        number of the next one, and the server the instance lives on, calls are
+        sent in batches of consecutive calls, up to a window of batches in flight """
+
+    def __init__(self, actor_id, modules, class_name, source_file):
+        self.actor_id = actor_id
+        self.modules = modules # the FunctionModules of the class
+        self.class_name = class_name
+        self.source_file = source_file
+        self.server = None # the RemoteServerInfo of the server the instance lives on
+        self.queue = collections.deque() # the OneExecutionRequestContexts not sent yet
+        self.next_seq = 0
+        self.in_flight = 0
+        self.failure = None # the failure that broke the actor, calls fail with it
+        self.destroyed = False
+
+    def request(self, batch, seq):
+        """ the fields of the request carrying a batch of calls starting at seq """
+        return {
+            "op": "actor",
+            "actor_id": self.actor_id,
+            "class_name": self.class_name,
+            "seq": seq,
+            "methods": [call_context.func_name for call_context in batch],
+        }
+
+class ActorRequestsMixin(object):
+    """ the part of the RemoteExecutionWorker placing the actors on the servers and
+        posting the calls of their methods in order """
+
+    def create_actor_request(self, cls, packed, actor_id, future_obj, server_count):
+        """ the callback function added when an actor is constructed, the
+            construction is the first call of the actor, the calls of an actor
+            are queued on the actor rather than in the scheduler, they are sent
+            to the server the actor is placed on in the order they were made """
+        self._logger.info("actor %s requested from the worker", actor_id)
+        file_name = inspect.getfile(cls)
+        func_key = file_name + ":" + cls.__name__ + "#" + actor_id
+        actor = ClientActor(actor_id, FunctionModules(cls), cls.__name__, file_name)
+        self._function_list[func_key] = self.new_function_context(actor.modules, \
+                                                                  actor=actor)
+        self._actors[actor_id] = func_key
+        actor.queue.append(OneExecutionRequestContext(future_obj, func_key, file_name, \
+            "__init__", packed))
+        self.request_servers(server_count)
+        self.carry_out_executions()
+        self.maintain_server_states()
+
+    def call_actor_request(self, actor_id, method, packed, future_obj):
+        """ the callback function added when a method of an actor is called,
+            "__destroy__" drops the instance after the calls made before """
+        func_key = self._actors.get(actor_id)
+        func_context = self._function_list[func_key] if func_key is not None else None
+        if func_context is None or func_context.actor.destroyed \
+                or func_context.actor.failure is not None:
+            self.complete_future(future_obj, None, \
+                func_context.actor.failure if func_context is not None \
+                and func_context.actor.failure is not None \
+                else RuntimeError("actor {} was destroyed".format(actor_id)))
+            return
+        actor = func_context.actor
+        if method == "__destroy__":
+            actor.destroyed = True
+        actor.queue.append(OneExecutionRequestContext(future_obj, func_key, \
+            actor.source_file, method, packed))
+        self.flush_actor(func_context)
+
+    def place_actor(self):
+        """ the server holding the fewest actors, the least loaded among those,
+            None if there is no server yet """
+        chosen = None
+        for server in self._server_list:
+            if chosen is None or (len(server.actors), server.load) \
+                    < (len(chosen.actors), chosen.load):
+                chosen = server
+        return chosen
+
+    def flush_actor(self, func_context):
+        """ send the queued calls of an actor in batches of consecutive calls, at
+            most actor_window batches are in flight, the server runs the calls
+            in the order of their sequence numbers """
+        actor = func_context.actor
+        if actor.server is None:
+            actor.server = self.place_actor()
+            if actor.server is None:
+                return
+            actor.server.actors.add(actor.actor_id)
+        while actor.queue and actor.in_flight < self._config.actor_window:
+            batch = []
+            while actor.queue and len(batch) < self._config.max_batch_size:
+                call_context = actor.queue.popleft()
+                call_context.seq = actor.next_seq + len(batch)
+                batch.append(call_context)
+            actor.next_seq = actor.next_seq + len(batch)
+            actor.in_flight = actor.in_flight + 1
+            actor.server.last_activity_time = datetime.now()
+            timing = {"dispatch": time.time()}
+            self.io_loop.add_future(self.execute_batch_call(batch, actor.server, timing), \
+                lambda fut, ctx=func_context, bat=batch, tim=timing: \
+                    self.complete_actor_batch(fut, ctx, bat, tim))
+
+    def complete_actor_batch(self, call_future, func_context, batch, timing):
+        """ mark the completion of a batch of calls of an actor, a failed request
+            breaks the actor since the server may have missed some of its calls """
+        actor = func_context.actor
+        actor.in_flight = actor.in_flight - 1
+        actor.server.last_activity_time = datetime.now()
+        try:
+            outcomes = call_future.result()
+            excep = None
+        except Exception as err: # pylint: disable=W0703
+            self._logger.error("calls of actor %s failed: %s", actor.actor_id, str(err))
+            outcomes = None
+            excep = err
+        for index, call_context in enumerate(batch):
+            call_context.record_timing(timing, index)
+            if outcomes is None:
+                self.complete_single_execution(None, excep, call_context)
+            else:
+                succeeded, value = outcomes[index]
+                if succeeded:
+                    self.complete_single_execution(value, None, call_context)
+                else:
+                    self.complete_single_execution(None, value, call_context)
+        if outcomes is None or actor.failure is not None:
+            self.break_actor(func_context, excep or actor.failure)
+        elif actor.destroyed and not actor.queue and not actor.in_flight:
+            self.remove_actor(func_context)
+        else:
+            self.flush_actor(func_context)
+
+    def break_actor(self, func_context, excep):
+        """ fail the queued calls and the later calls of an actor, and drop the
+            instance on its server """
+        actor = func_context.actor
+        if actor.failure is None:
+            actor.failure = excep
+        while actor.queue:
+            self.complete_single_execution(None, excep, actor.queue.popleft())
+        if actor.in_flight:
+            # dropped once the requests in flight completed
+            return
+        if actor.server is None or not actor.server.sandbox_id:
+            self.remove_actor(func_context)
+            return
+        self.io_loop.add_future(self.post_actor_destroy(func_context), \
+            lambda fut, ctx=func_context: self.remove_actor(ctx))
+
+    @gen.coroutine
+    def post_actor_destroy(self, func_context):
+        """ ask the server to drop an actor right away, whatever calls of it are
+            still due, failures are only logged """
+        actor = func_context.actor
+        if actor.server is None or not actor.server.sandbox_id:
+            return
+        server_url = actor.server.server_url.replace("clupy://", "http://").rstrip("/")
+        manifest, _ = func_context.manifest()
+        try:
+            yield self.post_frame(actor.server, \
+                server_url + "/exec/actor/" + actor.server.sandbox_id, \
+                wire.encode_request({"op": "destroy", "actor_id": actor.actor_id}), \
+                func_context.compression_stats, {}, \
+                {wire.MODULES_HEADER: json.dumps(manifest)})
+        except Exception as err: # pylint: disable=W0703
+            self._logger.info("destroying actor %s failed: %s", actor.actor_id, str(err))
+
+    def remove_actor(self, func_context):
+        """ forget a destroyed actor """
+        actor = func_context.actor
+        func_key = self._actors.pop(actor.actor_id, None)
+        if func_key is None:
+            return
+        self._function_list.pop(func_key, None)
+        if actor.server is not None:
+            actor.server.actors.discard(actor.actor_id)
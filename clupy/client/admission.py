@@ -0,0 +1,31 @@
+""" client side handling of the server nodes turning calls away when their run
+    queue is full """
+import time
+
+class ServerBusyError(RuntimeError):
+    """ raised when a server turned calls away since its run queue is full """
+
+class ServerAdmissionMixin(object):
+    """ the part of the RemoteExecutionWorker routing calls away from busy servers,
+        a busy server gets no further requests until its Retry-After passed """
+
+    def requeue_turned_away(self, batch, excep):
+        """ put the calls of a batch a server turned away before running it back at
+            the head of their queue, so that they go to another server, return
+            whether the batch was turned away """
+        if not isinstance(excep, ServerBusyError) or batch.completed or batch.copies:
+            return False
+        self._scheduler.requeue(batch.calls)
+        self.carry_out_executions()
+        return True
+
+    def busy_retry_time(self, retry_time):
+        """ the earlier of retry_time and the time the first busy server takes
+            requests again, while calls are waiting for a server """
+        if self._scheduler.empty():
+            return retry_time
+        for server in self._server_list:
+            if server.retry_time > time.time():
+                retry_time = server.retry_time if retry_time is None \
+                    else min(retry_time, server.retry_time)
+        return retry_time
@@ -0,0 +1,88 @@
+""" asyncio based client side remote execution, driven from the caller's running event loop """
+import asyncio
+import inspect
+import os
+import socket
+import weakref
+from .execution import RemoteExecutionServiceSingleton, RemoteExecutionFuture, func_wrapper
+from .streams import RemoteResultStream
+from ..utils.config import ClientConfigure
+
+class AsyncRemoteExecutionService(object):
+    """ the entry point service for remote execution from asyncio code, one
+        service per event loop, no worker thread is involved, the service holds
+        servers until it is closed, or used as an async context manager """
+
+    services = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def current(cls):
+        """ return the service bound to the running event loop """
+        loop = asyncio.get_event_loop()
+        if loop not in cls.services:
+            cls.services[loop] = AsyncRemoteExecutionService()
+        return cls.services[loop]
+
+    def __init__(self):
+        if RemoteExecutionServiceSingleton.client_id is None:
+            RemoteExecutionServiceSingleton.client_id = socket.gethostname() \
+                    + "_" + str(os.getpid())
+        self.config = ClientConfigure('clupy.client.yaml')
+        self._worker = RemoteExecutionServiceSingleton.\
+                        RemoteExecutionService.RemoteExecutionWorker(self)
+        self._worker.attach_to_current_loop()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.aclose(cancel=exc_type is not None)
+
+    async def aclose(self, cancel=False):
+        """ wait for the calls to complete, or with cancel set fail the ones not sent
+            yet, then release the servers to the master, the next call on the loop
+            starts a new service """
+        loop = asyncio.get_event_loop()
+        if AsyncRemoteExecutionService.services.get(loop) is self:
+            del AsyncRemoteExecutionService.services[loop]
+        await self._worker.close(cancel)
+
+    def func_wrapped(self, packed, func, server_count, priority=0, weight=1):
+        """ the wrapped function of the passed-in func to capture parameters,
+            the call is queued right away since we are already on the loop """
+        my_future = RemoteExecutionFuture(None, \
+            RemoteResultStream() if inspect.isgeneratorfunction(func) else None)
+        self._worker.remote_execution_request(func, packed, my_future, server_count, \
+                                              priority, weight)
+        return my_future
+
+    def execute(self, func, server_count, cache=False, priority=0, weight=1):
+        """ remotely execute the function with a specified maximum number of server involved
+            return a function to capture the input parameters, the returned futures
+            are awaitable
+        """
+        return func_wrapper(self, func, server_count, cache, priority, weight)
+
+def aparallel(func, server_count=0, cache=False, priority=0, weight=1):
+    """ the asyncio version of clupy.parallel, calls return awaitable futures """
+    return AsyncRemoteExecutionService.current().execute(func, server_count, cache, \
+                                                         priority, weight)
+
+def aservice():
+    """ the service of the running event loop, async with clupy.aservice(): releases
+        its servers once the block is left """
+    return AsyncRemoteExecutionService.current()
+
+async def aclose(cancel=False):
+    """ wait for the calls made on the running event loop, or with cancel set fail
+        the ones not sent yet, and release the servers, call it before the loop closes """
+    loop = asyncio.get_event_loop()
+    if loop in AsyncRemoteExecutionService.services:
+        await AsyncRemoteExecutionService.services[loop].aclose(cancel)
+
+async def amap(func, items, server_count=0, cache=False, priority=0, weight=1):
+    """ remotely apply func to every item, yielding the results in the order of items """
+    wrapped = aparallel(func, server_count, cache, priority, weight)
+    futures = [wrapped(item) for item in items]
+    for fut in futures:
+        yield await fut
@@ -0,0 +1,288 @@
+""" transparent batching of the calls of a wrapped function, the queued calls are
+    merged into requests whose size adapts to the measured round trip times """
+import json
+import time
+from datetime import datetime
+from tornado.httpclient import HTTPClientError
+from tornado import gen
+from ..utils import wire
+from .admission import ServerBusyError
+from .spool import SpooledRemoteResult
+
+class AdaptiveBatchSizer(object):
+    """ decides how many queued calls of one function are merged into a single
+        request, growing the batch until a request takes about target_time seconds
+    """
+
+    def __init__(self, target_time, max_batch_size, smoothing=0.3):
+        self.target_time = target_time
+        self.max_batch_size = max_batch_size
+        self.smoothing = smoothing
+        self.per_call_time = None # smoothed seconds spent per call, including overheads
+        self.last_batch_size = 1
+
+    def next_batch_size(self):
+        """ the number of calls to put into the next request """
+        if self.per_call_time is None:
+            # probe with a single call until we have a measurement
+            return 1
+        size = int(self.target_time / max(self.per_call_time, 1e-6))
+        # at most double at a time so that one noisy sample does not overshoot
+        size = min(size, self.last_batch_size * 2, self.max_batch_size)
+        return max(size, 1)
+
+    def record(self, batch_size, elapsed):
+        """ record the measured round trip time of a batch of batch_size calls """
+        per_call = elapsed / batch_size
+        if self.per_call_time is None:
+            self.per_call_time = per_call
+        else:
+            self.per_call_time = self.smoothing * per_call \
+                + (1.0 - self.smoothing) * self.per_call_time
+        self.last_batch_size = batch_size
+
+class InFlightBatch(object):
+    """ a batch of calls posted to one or more servers, there is more than one
+        copy once the batch is speculatively re-executed """
+
+    def __init__(self, calls):
+        self.calls = calls
+        self.copies = {} # RemoteServerInfo -> (dispatch time, whether it was pipelined)
+        self.speculated = False
+        self.completed = False
+
+class OneExecutionRequestContext(object):
+    """ context information for a single remote execution request """
+
+    def __init__(self, future_object, func_key, source_file, func_name, input_data, priority=0, \
+                 stream=None):
+        self.future_object = future_object
+        self.priority = priority
+        self.stream = stream # the RemoteResultStream of a generator function call
+        self.seq = None # the sequence number of a call of an actor
+        self.func_key = func_key
+        self.source_file = source_file
+        self.func_name = func_name
+        self.input_data = input_data
+        self.wire_input = None
+        self.blobs = {}
+        # the timestamps of the call going through the phases of its remote execution
+        self.enqueue_time = time.time()
+        self.dispatch_time = None
+        self.serialized_time = None
+        self.received_time = None
+        self.deserialized_time = None
+        self.completion_time = None
+        self.remote_time = 0.0 # seconds the server spent running the call
+        self.batch_remote_time = 0.0 # seconds the server spent running the whole batch
+
+    @property
+    def code_key(self):
+        """ the function the call runs, the calls of every map_reduce of a function
+            share it while their func_keys differ """
+        return self.source_file + ":" + self.func_name
+
+    def record_timing(self, timing, index):
+        """ take over the timestamps of the batch request that completed the call,
+            index is the position of the call in the batch """
+        self.dispatch_time = timing.get("dispatch")
+        self.serialized_time = timing.get("serialized")
+        self.received_time = timing.get("received")
+        self.deserialized_time = timing.get("deserialized")
+        remote_times = timing.get("remote", [])
+        if index < len(remote_times):
+            self.remote_time = remote_times[index]
+        self.batch_remote_time = sum(remote_times)
+
+    def prepare_input(self, blob_threshold):
+        """ the input data to send, with argument values whose encoded frames are
+            blob_threshold bytes or more replaced by BlobReferences, the encoded
+            frames are kept in blobs by their digests """
+        if self.wire_input is None:
+            self.wire_input = {}
+            for name, value in self.input_data.items():
+                # the values that can not be that large are not encoded to be measured
+                chunks = wire.encode_frame(value) \
+                    if wire.may_exceed(value, blob_threshold) else []
+                if wire.frame_length(chunks) >= blob_threshold:
+                    digest = wire.digest_chunks(chunks)
+                    self.blobs[digest] = chunks
+                    self.wire_input[name] = wire.BlobReference(digest)
+                else:
+                    self.wire_input[name] = value
+        return self.wire_input
+
+class BatchExecutionMixin(object):
+    """ the part of the RemoteExecutionWorker posting batches of calls to the servers
+        and fanning their outcomes out to the futures of the calls """
+
+    @gen.coroutine
+    def execute_batch_call(self, batch, server_entry, timing):
+        """ execute a batch of calls to the same function against one given server
+            in a single request, use tornado coroutine to simplify the asynchronous
+            programming logic
+            1. Ask the server to create a execution sandbox context if not yet done
+            2. Check file modifications and upload the source modules the server
+               does not hold yet, they are identified by their content digests
+            3. For tagged inputs, e.g. iteration source, transform and prepare the data,
+               large argument values are uploaded once per server and referenced
+               by their content digests
+            4. Post the data and request remote execution, wait for the result
+            5. For tagged outputs, transform and deposit the data
+            6. Ship over the logs/backtrack traces and other execution information
+            7. Return the calculated outputs, one (succeeded, value) pair per call,
+               the values the server spooled become SpooledRemoteResult handles
+            The times the request was serialized, the response received and
+            deserialized, and the server side execution times are put in timing
+            A call of a generator function is a batch of its own, its items are
+            fed to the call's RemoteResultStream as they arrive
+        """
+        self._logger.info("execute batch call invoked with %d calls", len(batch))
+
+        server_url = server_entry.server_url.replace("clupy://", "http://").rstrip("/")
+        server_url = server_url + "/exec"
+        func_context = self._function_list[batch[0].func_key]
+        calls = []
+        blobs = {}
+        for call_context in batch:
+            calls.append(call_context.prepare_input(self._config.blob_threshold))
+            blobs.update(call_context.blobs)
+        request = {
+            "op": "call",
+            "file_name": batch[0].source_file,
+            "module_name": func_context.modules.module_name,
+            "func_name": batch[0].func_name,
+            "blobs": list(blobs.keys())
+        }
+        if func_context.reduction is not None:
+            request.update(func_context.reduction.request("map_reduce"))
+        if func_context.actor is not None:
+            request.update(func_context.actor.request(batch, batch[0].seq))
+        stream = batch[0].stream
+        if stream is not None:
+            request["stream"] = self.start_stream(stream, server_url)
+        chunks = wire.encode_request(request, calls)
+        manifest, sources = func_context.manifest()
+        timing["serialized"] = time.time()
+        if not server_entry.sandbox_id:
+            yield self.create_sandbox(server_entry, server_url)
+        stats = func_context.compression_stats
+        retried = False
+        while True:
+            yield [self.upload_blobs(server_entry, server_url, sources, stats, "module"), \
+                   self.upload_blobs(server_entry, server_url, blobs, stats)]
+            headers = {wire.MODULES_HEADER: json.dumps(manifest)}
+            try:
+                if stream is None:
+                    body = yield self.post_frame(server_entry, server_url \
+                        + ("/run/" if func_context.actor is None else "/actor/") \
+                        + server_entry.sandbox_id, chunks, stats, timing, headers)
+                    outcomes = wire.decode_frame(body)
+                    timing["deserialized"] = time.time()
+                    return [(succeeded, self.fetchable(value, server_url)) \
+                            for succeeded, value in outcomes]
+                missing = yield self.post_stream(server_entry, \
+                    server_url + "/stream/" + server_entry.sandbox_id, chunks, stats, \
+                    timing, headers, stream)
+                if missing is None:
+                    return [(stream.failure is None, stream.failure)]
+            except HTTPClientError as err:
+                if err.code == 503:
+                    raise ServerBusyError("server {} turned the calls away".format(\
+                        server_entry.server_url)) from err
+                if err.code != 409:
+                    raise
+                missing = wire.decode_frame(err.response.body)
+            if retried:
+                raise RuntimeError("server {} lost uploaded content: {}".format(\
+                    server_entry.server_url, str(missing)))
+            # some blobs got evicted on the server, or the server lost some
+            # modules, upload them again
+            for digest in missing:
+                server_entry.blobs.discard(digest)
+            retried = True
+
+    def fetchable(self, value, server_url):
+        """ the handle fetching a result spooled on the server, or the value """
+        if isinstance(value, wire.SpooledResult):
+            return SpooledRemoteResult(server_url + "/spool/" + value.handle, \
+                                       value.size, value.digest, self._config)
+        return value
+
+    def complete_batch_execution(self, call_future, batch, server_entry, speculative, \
+                                 timing):
+        """ mark the completion of one copy of a batched request, the first copy
+            to return outcomes fans them out to the individual calls, the
+            outcomes of the other copies are ignored """
+        now = time.time()
+        start_time, pipelined = batch.copies.pop(server_entry)
+        server_entry.in_flight.remove(batch)
+        server_entry.last_activity_time = datetime.now()
+        if pipelined:
+            # the batch waited on the server until an earlier request completed
+            start_time = max(start_time, server_entry.last_completion_time)
+        server_entry.last_completion_time = now
+        try:
+            outcomes = call_future.result()
+            excep = None
+        except Exception as err: # pylint: disable=W0703
+            self._logger.error("batch execution failed: %s", str(err))
+            outcomes = None
+            excep = err
+        if self.requeue_turned_away(batch, excep):
+            return
+        if outcomes is not None:
+            # the server imported the function's modules and created its sandbox
+            server_entry.warm_functions[batch.calls[0].code_key] = now
+        func_context = self._function_list[batch.calls[0].func_key]
+        if batch.completed or (outcomes is None and batch.copies):
+            # another copy won already, or may still succeed
+            self.carry_out_executions()
+            return
+        batch.completed = True
+        if batch.speculated:
+            if speculative:
+                func_context.speculation.won = func_context.speculation.won + 1
+            else:
+                func_context.speculation.lost = func_context.speculation.lost + 1
+        if outcomes is not None:
+            if func_context.reduction is not None:
+                func_context.reduction.add_server(server_entry)
+            func_context.batch_sizer.record(len(batch.calls), now - start_time)
+            func_context.durations.record((now - start_time) / len(batch.calls))
+        for index, call_context in enumerate(batch.calls):
+            call_context.record_timing(timing, index)
+            if outcomes is None:
+                self.complete_single_execution(None, excep, call_context)
+            else:
+                succeeded, value = outcomes[index]
+                if succeeded:
+                    self.complete_single_execution(value, None, call_context)
+                else:
+                    self.complete_single_execution(None, value, call_context)
+        self.carry_out_executions()
+        self.maintain_server_states()
+
+    def complete_single_execution(self, result, excep, call_context):
+        """ mark the completion of a single execution"""
+        self._logger.info("completing a single execution: %s", call_context.func_key)
+        call_context.completion_time = time.time()
+        self._stats.record(call_context, excep is None)
+        if call_context.stream is not None:
+            call_context.stream.finish(excep)
+        if call_context.future_object is not None:
+            self.complete_future(call_context.future_object, result, excep)
+            return
+        # a map call of a map_reduce, its result was reduced on the server
+        reduction = self._function_list[call_context.func_key].reduction
+        if reduction.call_completed(excep):
+            self.io_loop.add_future(\
+                self.combine_partials(self._function_list[call_context.func_key]), \
+                lambda fut, key=call_context.func_key: self.complete_reduction(fut, key))
+
+    @staticmethod
+    def complete_future(future_object, result, excep):
+        """ set the outcome of a future and run its callbacks """
+        future_object.value = result
+        future_object.failure = excep
+        future_object.do_complete_callback(result, excep)
@@ -0,0 +1,165 @@
+""" client side memoization of remote execution results """
+from collections import OrderedDict
+import hashlib
+import inspect
+import logging
+import os
+import threading
+from ..utils import wire
+
+def function_digest(func):
+    """ hash the function's source and bytecode, so that editing the function
+        invalidates its cached results, changes to the functions it calls do not """
+    hasher = hashlib.blake2b(digest_size=20)
+    hasher.update((func.__module__ + "." + func.__name__).encode("utf-8"))
+    try:
+        hasher.update(inspect.getsource(func).encode("utf-8"))
+    except (OSError, TypeError):
+        pass
+    codes = [func.__code__]
+    while codes:
+        code = codes.pop()
+        hasher.update(code.co_code)
+        hasher.update(repr(code.co_names).encode("utf-8"))
+        for const in code.co_consts:
+            if inspect.iscode(const):
+                codes.append(const)
+            else:
+                hasher.update(repr(const).encode("utf-8"))
+    return hasher.hexdigest()
+
+class ResultCacheSingleton(object):
+    """ the singleton class for ResultCache """
+
+    instance = None
+    lock = threading.Lock()
+
+    def __new__(cls, config):
+        """ cache instance creation """
+        with ResultCacheSingleton.lock:
+            if not ResultCacheSingleton.instance:
+                ResultCacheSingleton.instance = ResultCacheSingleton.ResultCache(\
+                    config.result_cache_memory, config.result_cache_dir, config.result_cache_disk)
+        return ResultCacheSingleton.instance
+
+    def __getattr__(self, name):
+        return getattr(self.instance, name)
+
+    def __setattr__(self, name, val):
+        return setattr(self.instance, name, val)
+
+    class ResultCache(object):
+        """ a two tier cache of encoded results: an in-memory LRU bounded by memory_size
+            bytes, written through to files in disk_dir bounded by disk_size bytes """
+
+        def __init__(self, memory_size, disk_dir, disk_size):
+            self._logger = logging.getLogger("client")
+            self._lock = threading.Lock()
+            self._memory = OrderedDict()
+            self.memory_size = memory_size
+            self.memory_used = 0
+            self.disk_dir = disk_dir
+            self.disk_size = disk_size
+            self.disk_used = 0
+            self.memory_hits = 0
+            self.disk_hits = 0
+            self.misses = 0
+            self._function_digests = {}
+            if disk_dir:
+                if not os.path.isdir(disk_dir):
+                    os.makedirs(disk_dir)
+                for entry in os.listdir(disk_dir):
+                    self.disk_used = self.disk_used + \
+                        os.path.getsize(os.path.join(disk_dir, entry))
+
+        def make_key(self, func, packed):
+            """ the cache key of calling func with the packed arguments """
+            if func not in self._function_digests:
+                self._function_digests[func] = function_digest(func)
+            chunks = wire.encode_frame(sorted(packed.items()))
+            return wire.digest_chunks([self._function_digests[func].encode("utf-8")] + chunks)
+
+        def get(self, key):
+            """ return a (found, value) pair """
+            with self._lock:
+                data = self._memory.get(key)
+                if data is not None:
+                    self._memory.move_to_end(key)
+                    self.memory_hits = self.memory_hits + 1
+                else:
+                    data = self._read_disk(key)
+                    if data is None:
+                        self.misses = self.misses + 1
+                        return False, None
+                    self.disk_hits = self.disk_hits + 1
+                    self._put_memory(key, data)
+            return True, wire.decode_frame(data)
+
+        def put(self, key, value):
+            """ cache the result value of a successful call """
+            try:
+                data = b"".join(wire.encode_frame(value))
+            except Exception as err: # pylint: disable=W0703
+                self._logger.info("result is not cached: %s", str(err))
+                return
+            with self._lock:
+                self._put_memory(key, data)
+                self._write_disk(key, data)
+
+        def info(self):
+            """ the cache counters """
+            with self._lock:
+                return {
+                    "memory_hits": self.memory_hits,
+                    "disk_hits": self.disk_hits,
+                    "misses": self.misses,
+                    "memory_used": self.memory_used,
+                    "disk_used": self.disk_used,
+                }
+
+        def _put_memory(self, key, data):
+            """ add to the memory tier, evicting the least recently used entries """
+            if len(data) > self.memory_size or key in self._memory:
+                return
+            while self.memory_used + len(data) > self.memory_size:
+                _, evicted = self._memory.popitem(last=False)
+                self.memory_used = self.memory_used - len(evicted)
+            self._memory[key] = data
+            self.memory_used = self.memory_used + len(data)
+
+        def _read_disk(self, key):
+            """ read from the disk tier, None if not there """
+            if not self.disk_dir:
+                return None
+            path = os.path.join(self.disk_dir, key)
+            try:
+                with open(path, "rb") as stream:
+                    data = stream.read()
+                # the modification time orders the disk entries for eviction
+                os.utime(path, None)
+            except (IOError, OSError):
+                return None
+            return data
+
+        def _write_disk(self, key, data):
+            """ add to the disk tier, evicting the least recently used files """
+            if not self.disk_dir or len(data) > self.disk_size:
+                return
+            path = os.path.join(self.disk_dir, key)
+            if os.path.exists(path):
+                return
+            if self.disk_used + len(data) > self.disk_size:
+                entries = sorted(os.listdir(self.disk_dir), \
+                    key=lambda entry: os.path.getmtime(os.path.join(self.disk_dir, entry)))
+                for entry in entries:
+                    if self.disk_used + len(data) <= self.disk_size:
+                        break
+                    entry_path = os.path.join(self.disk_dir, entry)
+                    self.disk_used = self.disk_used - os.path.getsize(entry_path)
+                    os.remove(entry_path)
+            # write to a temporary file first so readers never see partial entries
+            temp_path = path + ".tmp"
+            with open(temp_path, "wb") as stream:
+                stream.write(data)
+            os.rename(temp_path, path)
+            self.disk_used = self.disk_used + len(data)
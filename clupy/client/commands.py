@@ -1,9 +1,16 @@
 """ client side commands support """
 from __future__ import print_function
 import logging
+import os
 import pickle
+import runpy
+import sys
+import threading
 from tornado.httpclient import HTTPClient, HTTPError
-import tornado.ioloop
+
+def wait_until_interrupted():
+    """ block the calling thread until the process is interrupted """
+    threading.Event().wait()
 
 class ClientCommand(object):
     """ the class that supports issue commands on the client side """
@@ -31,8 +38,36 @@ class ClientCommand(object):
                     print("      reserve_time: {}".format(val.reservation_time))
                     print("      reserve_update_time: {}".format(val.last_reservation_time))
                     print("      client_id: {}".format(val.client_id))
+                    print("      cores: {}, load: {}, run_queue: {}, free_memory: {}".format(\
+                        val.cores, val.load_average, val.run_queue, val.free_memory))
         except HTTPError as err:
             self._logger.error("stopping server node registration error: %s", str(err))
         except ConnectionRefusedError as conn_err: # pylint: disable=E0602
             self._logger.error("Connection error: %s", str(conn_err))
         http_client.close()
+
+    def publish_service(self):
+        """ run the service file, whose clupy.service calls publish its entry points
+            on the cluster, print the URLs they are served at and keep holding the
+            leases of their servers until interrupted """
+        import clupy
+        clupy.set_master_url(self._master_url)
+        path = os.path.abspath(self._args.publish)
+        # the entry points are imported by name relative to the service file
+        sys.path.insert(0, os.path.dirname(path))
+        try:
+            runpy.run_path(path, run_name="__main__")
+            endpoints = clupy.RemoteExecutionServiceSingleton().published_endpoints
+            for url in endpoints:
+                print("published: {}".format(url))
+            if endpoints:
+                print("serving until interrupted (ctrl + C)")
+                sys.stdout.flush()
+                # the worker thread of the remote execution service renews the leases
+                wait_until_interrupted()
+        except KeyboardInterrupt:
+            self._logger.info("stopped publishing %s", path)
+        except Exception as err: # pylint: disable=W0703
+            self._logger.error("publishing %s failed: %s", path, str(err))
+        finally:
+            clupy.stop_remote_execution()
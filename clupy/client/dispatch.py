@@ -0,0 +1,110 @@
+""" the dispatch of the queued remote calls, the FairShareScheduler picks the
+    function to serve and its queued calls are merged into a batch for the server
+    chosen for it """
+import inspect
+import time
+from datetime import datetime
+from .batching import InFlightBatch, OneExecutionRequestContext
+from .modules import FunctionModules
+
+class DispatchMixin(object):
+    """ the part of the RemoteExecutionWorker queueing the calls and dispatching
+        their batches to the servers with free slots """
+
+    def remote_execution_request(self, func, packed, future_obj, server_count, \
+                                 priority=0, weight=1):
+        """ the callback function added when there is a remote excution request
+            1. For the remtely executed function, asynchronously rquest servers
+               from the master node if the client wide server pool is short of
+               server_count. Each server's information is kept in a
+               RemoteServerInfo structure, the pool is shared by all functions.
+            2. Pack the request information into a OneExecutionRequestContext structure,
+               and queue it into the FairShareScheduler
+            3. Carryout execution if opptunities exist
+            4. Maintain server status: refresh server list if active, deregister if inactive
+        """
+        self._logger.info("remote execution request received by the worker")
+
+        file_name = inspect.getfile(func)
+        func_key = file_name + ":" + func.__name__
+        if not func_key in self._function_list.keys():
+            # every call of a generator function streams its items in its own request
+            self._function_list[func_key] = self.new_function_context(\
+                FunctionModules(func), 1 if future_obj.stream is not None else None)
+        self._scheduler.set_weight(func_key, weight)
+
+        # 1. now we are ready to create a single invocation context
+        invocation_context = OneExecutionRequestContext(future_obj, func_key, file_name, \
+            func.__name__, packed, priority, future_obj.stream)
+        # 2. Stick the invocation context into the scheduler, calls queued up while
+        #    the servers are being allocated are batched together later on
+        self._scheduler.push(invocation_context)
+
+        self.request_servers(server_count)
+
+        self.carry_out_executions()
+
+        self.maintain_server_states()
+
+    def carry_out_executions(self):
+        """ Check to carry out any permissible remote executions
+            # break out in the middle any time if the system is exiting
+            # 1. Check if we have a server slot that is available for execution
+            #    Check if we have a task waiting in the scheduler
+            #    Loop until one of the above is False
+            #    1.1. Let the FairShareScheduler pick the function to serve, and
+            #         merge its queued calls into one batch sized by the function's
+            #         AdaptiveBatchSizer
+            #    1.2. Issue the execution of the batch against the warmest, least loaded
+            #         server with a free slot, if only cold servers are free while a busy
+            #         server is warm for the function, hold the function back for
+            #         locality_delay milliseconds and serve the next one, servers that
+            #         turned a request away get no requests until their Retry-After
+            #         passed, record the future object
+            # 2. Mark all completed future objects for completion (one execuition is done)
+            # 3. For remote function contexts that are 30 seconds or more idel, release them
+            # 4. For remote function contexts that are expiring, and were active in the
+            #    past 30 seconds, renew the lease
+        """
+        held_back = set()
+        retry_time = None
+        for func_key in list(self._actors.values()):
+            if self._function_list[func_key].actor.server is None:
+                self.flush_actor(self._function_list[func_key])
+        while not self._scheduler.empty():
+            func_key = self._scheduler.next_func_key(held_back)
+            if func_key is None:
+                break
+            head = self._scheduler.head(func_key)
+            digests = self.blob_digests(head)
+            server, warmth = self.pick_server(head, digests)
+            if server is None:
+                break
+            # Got a free server slot along with requests
+            if warmth == 0 and self.is_warm_elsewhere(head, digests):
+                ready_time = head.enqueue_time + self._config.locality_delay / 1000.0
+                if time.time() < ready_time:
+                    # wait a little for a warm server to free up before cold starting
+                    held_back.add(func_key)
+                    retry_time = ready_time if retry_time is None \
+                        else min(retry_time, ready_time)
+                    continue
+            func_context = self._function_list[func_key]
+            batch = InFlightBatch(self._scheduler.take(\
+                func_key, func_context.batch_sizer.next_batch_size()))
+            self.dispatch_batch(batch, server)
+        retry_time = self.busy_retry_time(retry_time)
+        if retry_time is not None:
+            self.retry_held_back(retry_time)
+
+    def dispatch_batch(self, batch, server, speculative=False):
+        """ post a copy of an InFlightBatch to the server """
+        timing = {"dispatch": time.time()}
+        batch.copies[server] = (timing["dispatch"], \
+                                len(server.in_flight) >= server.slot_count)
+        server.in_flight.append(batch)
+        call_future = self.execute_batch_call(batch.calls, server, timing)
+        server.last_activity_time = datetime.now()
+        self.io_loop.add_future(call_future, lambda fut, bat=batch, srv=server, \
+            spec=speculative, tim=timing: self.complete_batch_execution(\
+                fut, bat, srv, spec, tim))
@@ -1,43 +1,73 @@
 """ The client side remote execution engine """
 from __future__ import print_function
 import inspect
+import json
 import logging
-import pickle
 import socket
 import os
+import asyncio
 import threading
+import concurrent.futures
+import itertools
 from datetime import datetime
-import queue
-import urllib
-import base64
-from tornado.httpclient import HTTPClient, HTTPError, AsyncHTTPClient
-from tornado.ioloop import IOLoop
+from tornado.httpclient import AsyncHTTPClient
+from tornado.ioloop import IOLoop, PeriodicCallback
 from tornado import gen
-
-def func_wrapper(service_object, func, server_count):
-    """ the function for wrapping func """
-    argspec = inspect.getargspec(func)
+from ..utils.config import ClientConfigure
+from ..utils import wire, compression
+from ..utils.binding import BindingPlan
+from .actors import ActorHandle, ActorRequestsMixin, actor_wrapper
+from .admission import ServerAdmissionMixin
+from .batching import AdaptiveBatchSizer, BatchExecutionMixin
+from .cache import ResultCacheSingleton
+from .dispatch import DispatchMixin
+from .leases import ServerLeasesMixin
+from .locality import LocalityMixin
+from .modules import FunctionModules
+from .reductions import MapReduceMixin
+from .scheduler import FairShareScheduler
+from .servers import ServerRequestsMixin
+from .services import endpoint_url
+from .speculation import DurationTracker, SpeculationCounters, StragglerSpeculationMixin
+from .spool import SpooledRemoteResult
+from .stats import LatencyStatsSingleton
+from .streams import RemoteResultStream, StreamRequestsMixin
+
+def func_wrapper(service_object, func, server_count, cache=False, priority=0, weight=1):
+    """ the function for wrapping func, with cache set, results are memoized
+        by the client side ResultCache, priority and weight are passed on to
+        the FairShareScheduler """
+    plan = BindingPlan(func)
+    # the items of generator functions are streamed, they are not cached
+    streaming = inspect.isgeneratorfunction(func)
 
     class MyWrapper(object):
         """ the wrapped function object """
         def __call__(self, *args, **kwargs):
-            packed = {}
-            index = 0
-            if argspec.args:
-                for arg in argspec.args:
-                    packed[arg] = args[index]
-                    index = index + 1
-            if argspec.varargs:
-                for arg in argspec.varargs:
-                    packed[arg] = args[index]
-                    index = index + 1
-            if argspec.keywords:
-                for arg in argspec.keywords:
-                    packed[arg] = argspec.defaults[index] if args[index] is None else args[index]
-                    index = index + 1
-            return service_object.func_wrapped(packed, func, server_count)
+            packed = plan.pack(args, kwargs)
+            if cache and not streaming:
+                return cached_call(service_object, packed, func, server_count, priority, weight)
+            return service_object.func_wrapped(packed, func, server_count, priority, weight)
     return MyWrapper()
 
+def cached_call(service_object, packed, func, server_count, priority, weight):
+    """ return an already completed future upon a result cache hit, without
+        contacting the master or any server, otherwise invoke the function
+        remotely and cache its result once it succeeds """
+    result_cache = ResultCacheSingleton(service_object.config)
+    key = result_cache.make_key(func, packed)
+    found, value = result_cache.get(key)
+    if found:
+        my_future = RemoteExecutionFuture(None)
+        my_future.value = value
+        my_future.do_complete_callback(value, None)
+        return my_future
+    my_future = service_object.func_wrapped(packed, func, server_count, priority, weight)
+    # spooled results are too large to be cached, they are fetched once
+    my_future.add_done_callback(lambda fut: result_cache.put(key, fut.value) \
+        if fut.successful and fut.spooled is None else None)
+    return my_future
+
 class RemoteExecutionServiceSingleton(object):
     """ make RemoteExecutionService a singleton object """
 
@@ -63,169 +93,220 @@ class RemoteExecutionServiceSingleton(object):
     class RemoteExecutionService(object):
         """ the entry point service for remote execution """
 
-        class RemoteExecutionWorker(threading.Thread):
+        class RemoteExecutionWorker(DispatchMixin, LocalityMixin, BatchExecutionMixin, \
+                                    ServerRequestsMixin, ServerLeasesMixin, StreamRequestsMixin, \
+                                    MapReduceMixin, ActorRequestsMixin, StragglerSpeculationMixin, \
+                                    ServerAdmissionMixin, threading.Thread):
             """ the worker thread for RemoteExecutionService """
             def __init__(self, service_object):
                 threading.Thread.__init__(self)
                 self._function_list = {}
+                self._server_list = [] # the servers allocated to this client, shared by functions
+                self._allocating = False
+                self._requested_server_count = 0
+                self._scheduler = FairShareScheduler()
+                self._config = service_object.config
+                self._stats = LatencyStatsSingleton(self._config)
                 self._logger = logging.getLogger("worker")
-
-            def remote_execution_request(self, func, packed, future_obj, server_count):
-                """ the callback function added when there is a remote excution request
-                    1. For the remtely executed function, synchronously rquest the list of
-                       servers from the master node (if has not). Each server's information
-                       is kept in a RemoteServerInfo structure. The list of the servers is
-                       saved in the RemoteFunctionContext structure.
-                    2. Pack the request information into a OneExecutionRequestContext structure,
-                       and save it as a queue element inside the RemoteFunctionContext structure
-                    3. Carryout execution if opptunities exist
-                    4. Maintain server status: refresh server list if active, deregister if inactive
-                """
-                self._logger.info("remote execution request received by the worker")
-
-                file_name = inspect.getfile(func)
-                func_key = file_name + ":" + func.__name__
-                if not func_key in self._function_list.keys() \
-                        or len(self._function_list[func_key].server_list) == 0: #pylint: disable=C1801
-                    # need to request for a list of servers to remotely execute this function
-                    master_url = RemoteExecutionServiceSingleton.master_url.replace(\
-                        "clupy://", "http://")
-                    master_url = master_url.rstrip('/')
-                    master_url = master_url + "/alloc/" + RemoteExecutionServiceSingleton.client_id \
-                        + "/" + str(server_count)
-                    http_client = HTTPClient()
-                    try:
-                        response = http_client.fetch(master_url)
-                        if response.error:
-                            self._logger.error("request servers from master got error: %s", \
-                                                str(response.error))
-                        else:
-                            function_context = RemoteFunctionContext()
-                            server_list = pickle.loads(response.body)
-                            function_context.server_list = []
-                            for server in server_list:
-                                function_context.server_list.append(RemoteServerInfo(server))
-                            self._function_list[func_key] = function_context
-                            self._logger.info("master returned server list: %s", \
-                                                str(server_list))
-                    except HTTPError as err:
-                        self._logger.error("request servers from master got HTTP error: %s", str(err))
-                    except ConnectionRefusedError as conn_err: # pylint: disable=E0602
-                        self._logger.error("Connection error: %s", str(conn_err))
-                    http_client.close()
-
-                # raise HTTPError in case we still do not have the server list
-                if not func_key in self._function_list.keys():
-                    raise HTTPError("could not get server list from the master at {}".\
-                            format(RemoteExecutionServiceSingleton.master_url))
-                function_context = self._function_list[func_key]
-
-                # 1. now we are ready to create a single invocation context
-                invocation_context = OneExecutionRequestContext(future_obj, func_key, file_name, func.__name__, packed)
-                # 2. Stick the invocation context into a rquest queue
-                if function_context.task_queue is None:
-                    function_context.task_queue = queue.Queue()
-                function_context.task_queue.put(invocation_context)
-
-                self.carry_out_executions()
-
-                self.maintain_server_states()
+                self._loop_ready = threading.Event()
+                self._straggler_check = None
+                self._stream_ids = itertools.count()
+                self._reduction_ids = itertools.count()
+                self._actors = {} # actor id -> func_key of the actor's RemoteFunctionContext
+                self._lease_check = None
+                self._lease_request = None
+                self._locality_retry = None # the timeout dispatching calls held back for warm servers
+                self._last_renewal_time = datetime.now()
+                self.io_loop = None
+
+            @property
+            def client_id(self):
+                """ the id this client is known by to the master and the servers """
+                return RemoteExecutionServiceSingleton.client_id
+
+            @property
+            def master_url(self):
+                """ the URL of the master node allocating the servers """
+                return RemoteExecutionServiceSingleton.master_url
+
+            def wait_until_ready(self):
+                """ block the caller until the worker's IOLoop is available """
+                self._loop_ready.wait()
+
+            def new_function_context(self, modules, max_batch_size=None, reduction=None, \
+                                     actor=None):
+                """ the RemoteFunctionContext of a function, whose batches grow up to
+                    max_batch_size calls, the configured max_batch_size by default """
+                return RemoteFunctionContext(AdaptiveBatchSizer(\
+                    self._config.batch_target_time / 1000.0, \
+                    max_batch_size or self._config.max_batch_size), \
+                    PayloadCompressionStats(self._config.network_bandwidth), modules, \
+                    reduction, actor)
 
             def stop_worker_request(self):
-                """ called from the main thread to stop the worker"""
-                IOLoop.current().stop()
+                """ called from the main thread to stop the worker, the allocated servers
+                    are released back to the master before the IOLoop stops """
+                if self._straggler_check is not None:
+                    self._straggler_check.stop()
+                if self._lease_check is not None:
+                    self._lease_check.stop()
+                self._stats.flush()
+                if not self._server_list:
+                    self.io_loop.stop()
+                    return
+                server_urls = [server.server_url for server in self._server_list]
+                self._server_list = []
+                self.io_loop.add_future(self.release_all_servers(server_urls), \
+                    lambda fut: self.complete_final_release(fut, server_urls))
+
+            def busy(self):
+                """ whether calls are queued, waiting for servers or in flight, or
+                    map_reduce results are still being combined """
+                return not self._scheduler.empty() or self._allocating \
+                    or any(server.in_flight for server in self._server_list) \
+                    or any(func_context.reduction is not None \
+                           or (func_context.actor is not None \
+                               and (func_context.actor.queue or func_context.actor.in_flight)) \
+                           for func_context in self._function_list.values())
+
+            @gen.coroutine
+            def close(self, cancel=False):
+                """ the asyncio counterpart of stop_worker_request, the IOLoop belongs to
+                    the caller and keeps running: wait for the calls to complete, with
+                    cancel set the calls not sent yet fail instead, then stop the periodic
+                    callbacks, drop the actors and release the servers to the master """
+                if cancel:
+                    for func_key in list(self._function_list.keys()):
+                        for call_context in self._scheduler.drain(func_key):
+                            self.complete_single_execution(None, \
+                                RuntimeError("the call was cancelled"), call_context)
+                while self.busy():
+                    yield gen.sleep(0.05)
+                if self._straggler_check is not None:
+                    self._straggler_check.stop()
+                self._lease_check.stop()
+                if self._locality_retry is not None:
+                    self.io_loop.remove_timeout(self._locality_retry)
+                    self._locality_retry = None
+                if self._lease_request is not None:
+                    try:
+                        yield self._lease_request
+                    except Exception: # pylint: disable=W0703
+                        pass # logged by complete_lease_request
+                self._stats.flush()
+                server_urls = [server.server_url for server in self._server_list]
+                self._server_list = []
+                if server_urls:
+                    lease_future = self.release_all_servers(server_urls)
+                    try:
+                        yield lease_future
+                    except Exception: # pylint: disable=W0703
+                        pass # logged by complete_lease_request
+                    self.complete_lease_request(lease_future, server_urls, True)
+
+            def publish_request(self, entry_points, options, server_count, future_obj):
+                """ the callback function added when a service is published, the
+                    future completes with the URLs of the published entry points """
+                self._logger.info("publishing %s on %d servers", str(list(entry_points)), \
+                                  server_count)
+                self.io_loop.add_future(\
+                    self.publish_service(entry_points, options, server_count), \
+                    lambda fut: self.complete_publish(fut, future_obj))
+
+            def complete_publish(self, publish_future, future_obj):
+                """ complete the future of a publish request with the URLs """
+                try:
+                    urls = publish_future.result()
+                    excep = None
+                except Exception as err: # pylint: disable=W0703
+                    self._logger.error("publishing the service failed: %s", str(err))
+                    urls = None
+                    excep = err
+                self.complete_future(future_obj, urls, excep)
 
             @gen.coroutine
-            def execute_single_call(self, call_context, server_entry):
-                """ execute one function call against one given server,
-                    use tornado coroutine to simplify the asynchronous
-                    programming logic
-                    1. Ask the server to create a execution sandbox context if not yet done
-                    2. Check file modifications and upload all modified source codes
-                    3. For tagged inputs, e.g. iteration source, transform and prepare the data
-                    4. Post the data and request remote execution, wait for the result
-                    5. For tagged outputs, transform and deposit the data
-                    6. Ship over the logs/backtrack traces and other execution information
-                    7. Return the calculated outputs
-                """
-                self._logger.info("execute single call invoked")
+            def publish_service(self, entry_points, options, server_count):
+                """ publish the entry points, a dictionary of functions by name, on
+                    server_count servers, all allocated ones if 0, the source modules
+                    of the entry points are shipped like the ones of remote functions,
+                    return the URLs of the published entry points """
+                if not self._server_list or server_count > len(self._server_list):
+                    server_list = yield self.allocate_servers(\
+                        server_count - len(self._server_list) if server_count else 0)
+                    self.add_servers(server_list)
+                servers = self._server_list[:server_count] if server_count \
+                    else list(self._server_list)
+                manifest = {}
+                sources = {}
+                request = dict(options)
+                request["op"] = "publish"
+                request["entry_points"] = []
+                for name, func in entry_points.items():
+                    modules = FunctionModules(func)
+                    func_manifest, func_sources = modules.manifest()
+                    manifest.update(func_manifest)
+                    sources.update(func_sources)
+                    request["entry_points"].append((name, modules.module_name, func.__name__))
+                stats = PayloadCompressionStats(self._config.network_bandwidth)
+                yield [self.publish_on_server(server_entry, request, manifest, sources, stats) \
+                       for server_entry in servers]
+                return [endpoint_url(server_entry.server_url, options["port"], name) \
+                        for server_entry in servers for name in entry_points]
 
+            @gen.coroutine
+            def publish_on_server(self, server_entry, request, manifest, sources, stats):
+                """ upload the modules of a service the server misses and publish its
+                    entry points there, the server is kept until the client stops """
                 server_url = server_entry.server_url.replace("clupy://", "http://").rstrip("/")
                 server_url = server_url + "/exec"
-                http_client = AsyncHTTPClient()
                 if not server_entry.sandbox_id:
-                    request_url = server_url + "/create/" + urllib.parse.quote(\
-                            RemoteExecutionServiceSingleton.client_id) + "/1"
-                    response = yield http_client.fetch(request_url)
-                    server_entry.sandbox_id = response.body.decode("utf-8")
-                request_url = server_url + "/run/" + server_entry.sandbox_id
-                body_val = {
-                    "file_name": call_context.source_file,
-                    "func_name": call_context.func_name,
-                    "input_data": base64.standard_b64encode(pickle.dumps(call_context.input_data))
-                }
-                body = urllib.parse.urlencode(body_val)
-                response = yield http_client.fetch(request_url, method="POST", body=body)
-                return pickle.loads(base64.standard_b64decode(response.body))
-
-            def complete_single_execution(self, result, excep, call_context, server_entry):  # pylint: disable=W0613
-                """ mark the completion of a single execution"""
-                self._logger.info("completing a single execution: %s", call_context.func_key)
-                call_context.future_object.value = result if not result is None else excep
-                call_context.future_object.do_complete_callback(result, excep)
-                server_entry.one_execution_context = None
-                self.carry_out_executions()
-                self.maintain_server_states()
-
-            def carry_out_executions(self):
-                """ Check to carry out any permissible remote executions
-                    # break out in the middle any time if the system is exiting
-                    # 1. Check if we have a server resource that is available for execution
-                    #    Check if we have a task waiting in the queue
-                    #    Loop until one of the above is False
-                    #    1.1. Issue the execution of one async task against one serve,
-                    #         record the future object
-                    # 2. Mark all completed future objects for completion (one execuition is done)
-                    # 3. For remote function contexts that are 30 seconds or more idel, release them
-                    # 4. For remote function contexts that are expiring, and were active in the
-                    #    past 30 seconds, renew the lease
-                """
-                for _, func_context in self._function_list.items():
-                    if not func_context.task_queue.empty():
-                        available_server = None
-                        for server in func_context.server_list:
-                            if server.one_execution_context is None:
-                                available_server = server
-                                break
-                        if available_server:
-                            # Got a free server along as a request
-                            available_server.one_execution_context = func_context.task_queue.get()
-                            call_future = self.execute_single_call(\
-                                    available_server.one_execution_context, available_server)
-                            available_server.last_activity_time = datetime.now()
-                            IOLoop.current().add_future(call_future, lambda fut, av=\
-                                available_server: self.complete_single_execution(\
-                                    fut.result(), None, av.one_execution_context, av))
-
-            def maintain_server_states(self):
-                """ renew server lease for active servers, release idel servers """
-                pass
+                    yield self.create_sandbox(server_entry, server_url)
+                yield self.upload_blobs(server_entry, server_url, sources, stats, "module")
+                body = yield self.post_frame(server_entry, \
+                    server_url + "/publish/" + server_entry.sandbox_id, \
+                    wire.encode_request(request), stats, {}, \
+                    {wire.MODULES_HEADER: json.dumps(manifest)})
+                succeeded, err = wire.decode_frame(body)
+                if not succeeded:
+                    raise err
+                server_entry.services.update(name for name, _, _ in request["entry_points"])
+
+            def attach_to_current_loop(self):
+                """ drive the remote executions from the current thread's IOLoop,
+                    which wraps the running asyncio event loop if there is one """
+                self.io_loop = IOLoop.current()
+                # every server slot may hold a request in flight
+                AsyncHTTPClient.configure(None, max_clients=self._config.max_connections, \
+                                          max_body_size=self._config.max_body_size)
+                if self._config.speculation:
+                    self._straggler_check = PeriodicCallback(self.check_stragglers, \
+                                                             self._config.speculation_interval)
+                    self._straggler_check.start()
+                # idle servers are noticed within a second even without any other activity
+                self._lease_check = PeriodicCallback(self.maintain_server_states, 1000)
+                self._lease_check.start()
+                self._loop_ready.set()
 
             def run(self):
                 self._logger.info("the remote execution worker thread started")
-                IOLoop.current().start()
+                self.attach_to_current_loop()
+                self.io_loop.start()
                 self._logger.info("the remote execution worker thread is exiting")
 
         def __init__(self):
             self._logger = logging.getLogger('client')
+            self.config = ClientConfigure('clupy.client.yaml')
             self._thread = RemoteExecutionServiceSingleton.\
                             RemoteExecutionService.RemoteExecutionWorker(self)
             self._thread.start()
+            self._thread.wait_until_ready()
+            self._actor_ids = itertools.count()
+            self.published_endpoints = [] # the URLs of the entry points published by clupy.service
 
         def stop_work(self):
             """ stop the worker thread """
             if self._thread:
-                IOLoop.current().add_callback(
+                self._thread.io_loop.add_callback(
                     RemoteExecutionServiceSingleton.RemoteExecutionService.\
                                 RemoteExecutionWorker.stop_worker_request,
                     self._thread
@@ -233,96 +314,305 @@ class RemoteExecutionServiceSingleton(object):
                 self._thread.join()
                 self._thread = None
 
-        def func_wrapped(self, packed, func, server_count):
+        def func_wrapped(self, packed, func, server_count, priority=0, weight=1):
             """ the wrapped function of the passed-in func to capture parameters """
 
-            my_future = RemoteExecutionFuture(None)
-            IOLoop.current().add_callback(\
+            my_future = RemoteExecutionFuture(None, \
+                RemoteResultStream() if inspect.isgeneratorfunction(func) else None)
+            self._thread.io_loop.add_callback(\
                     RemoteExecutionServiceSingleton.RemoteExecutionService.\
                             RemoteExecutionWorker.remote_execution_request,
-                    self._thread, func, packed, my_future, server_count)
+                    self._thread, func, packed, my_future, server_count, priority, weight)
             return my_future
 
-        def execute(self, func, server_count):
+        def speculation_info(self):
+            """ the speculative re-execution counters of every function """
+            return self._thread.speculation_info()
+
+        def stats(self):
+            """ the latency histograms of every function """
+            return LatencyStatsSingleton(self.config).summary()
+
+        def execute(self, func, server_count, cache=False, priority=0, weight=1):
             """ remotely execute the function with a specified maximum number of server involved
                 return a function to capture the input parameters, passing along the context
             """
-            return func_wrapper(self, func, server_count)
+            return func_wrapper(self, func, server_count, cache, priority, weight)
+
+        def actor(self, cls, server_count):
+            """ return a function constructing instances of cls on the servers """
+            return actor_wrapper(self, cls, server_count)
+
+        def create_actor(self, cls, packed, server_count):
+            """ construct an instance of cls on a server, return its ActorHandle """
+            actor_id = RemoteExecutionServiceSingleton.client_id + "-actor-" \
+                + str(next(self._actor_ids))
+            my_future = RemoteExecutionFuture(None)
+            self._thread.io_loop.add_callback(\
+                    RemoteExecutionServiceSingleton.RemoteExecutionService.\
+                            RemoteExecutionWorker.create_actor_request,
+                    self._thread, cls, packed, actor_id, my_future, server_count)
+            return ActorHandle(self, cls, actor_id, my_future)
 
-class RemoteServerInfo(object):
-    """ the server information structure represented a remote server
-        containing server URL as well as an outstanding RemoteExecutionFuture object
-        if any
-    """
+        def call_actor(self, actor_id, method, packed):
+            """ call a method of an actor, return the future of the call """
+            my_future = RemoteExecutionFuture(None)
+            self._thread.io_loop.add_callback(\
+                    RemoteExecutionServiceSingleton.RemoteExecutionService.\
+                            RemoteExecutionWorker.call_actor_request,
+                    self._thread, actor_id, method, packed, my_future)
+            return my_future
+
+        def destroy_actor(self, actor_id):
+            """ drop an actor once the calls made before completed """
+            return self.call_actor(actor_id, "__destroy__", {})
+
+        def publish(self, entry_points, options, server_count):
+            """ publish the entry points, a dictionary of functions by name, with the
+                options of the publish request, return the future of their URLs """
+            my_future = RemoteExecutionFuture(None)
+            self._thread.io_loop.add_callback(\
+                    RemoteExecutionServiceSingleton.RemoteExecutionService.\
+                            RemoteExecutionWorker.publish_request,
+                    self._thread, entry_points, options, server_count, my_future)
+            return my_future
 
-    def __init__(self, url):
-        self.server_url = url
-        self.one_execution_context = None
-        self.sandbox_id = None
-        self.last_activity_time = datetime.now()
+        def map_reduce(self, map_fn, reduce_fn, items, server_count, priority=0, weight=1):
+            """ remotely apply map_fn to every item and reduce the results with reduce_fn
+                on the servers, return the future of the final result """
+            plan = BindingPlan(map_fn)
+            packed_list = [plan.pack((item,), {}) for item in items]
+            my_future = RemoteExecutionFuture(None)
+            self._thread.io_loop.add_callback(\
+                    RemoteExecutionServiceSingleton.RemoteExecutionService.\
+                            RemoteExecutionWorker.map_reduce_request,
+                    self._thread, map_fn, reduce_fn, packed_list, my_future, server_count, \
+                    priority, weight)
+            return my_future
+
+class PayloadCompressionStats(object):
+    """ compression statistics of a function's requests and responses """
+
+    def __init__(self, bandwidth):
+        self.request = compression.CompressionStats(bandwidth)
+        self.response = compression.CompressionStats(bandwidth)
 
 class RemoteFunctionContext(object):
     """ context information for a function that is to be remotedly invoked """
 
-    def __init__(self):
-        self.server_list = []
-        self.task_queue = None
+    def __init__(self, batch_sizer, compression_stats, modules, reduction=None, actor=None):
+        self.batch_sizer = batch_sizer
+        self.compression_stats = compression_stats
+        self.modules = modules
+        self.reduction = reduction # the Reduction the calls are the map calls of
+        self.actor = actor # the ClientActor the calls are the method calls of
+        self.durations = DurationTracker()
+        self.speculation = SpeculationCounters()
+
+    def manifest(self):
+        """ the (manifest, sources) pair of the modules of the function, and of the
+            reduce function if the calls are the map calls of a reduction """
+        manifest, sources = self.modules.manifest()
+        if self.reduction is not None:
+            reduce_manifest, reduce_sources = self.reduction.modules.manifest()
+            manifest.update(reduce_manifest)
+            sources.update(reduce_sources)
+        return manifest, sources
+
+class CompletionWaiter(object):
+    """ collects futures as they complete, used to wait on many futures at once
+        without polling them """
 
-class OneExecutionRequestContext(object):
-    """ context information for a single remote execution request """
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.completed_futures = []
 
-    def __init__(self, future_object, func_key, source_file, func_name, input_data):
-        self.future_object = future_object
-        self.func_key = func_key
-        self.source_file = source_file
-        self.func_name = func_name
-        self.input_data = input_data
+    def add_completed(self, future):
+        """ called by a future upon its completion """
+        with self.condition:
+            self.completed_futures.append(future)
+            self.condition.notify_all()
 
 class RemoteExecutionFuture(object):
-    """ the Future object for a single remote invocation """
+    """ the Future object for a single remote invocation, the future of a generator
+        function call iterates over the yielded items, and completes once all were
+        received, a result the server spooled is fetched when value is first read,
+        or written to a file without decoding it by save """
 
-    def __init__(self, one_execution_request_context):
+    def __init__(self, one_execution_request_context, stream=None):
         self._execution_context = one_execution_request_context
+        self.stream = stream
         self.successful = False
         self.completed = False
-        self.value = None
+        self._value = None
+        self._load_lock = threading.Lock()
         self.failure = None
         self._suceed_callback = None
         self._fail_clallback = None
+        self._condition = threading.Condition()
+        self._waiters = []
+        self._done_callbacks = []
+
+    @property
+    def value(self):
+        """ the result, fetched from the server upon first access if it was spooled """
+        with self._load_lock:
+            if isinstance(self._value, SpooledRemoteResult):
+                self._value = self._value.load()
+            return self._value
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+
+    @property
+    def spooled(self):
+        """ the SpooledRemoteResult of a result not fetched yet, None otherwise """
+        value = self._value
+        return value if isinstance(value, SpooledRemoteResult) else None
+
+    def save(self, path):
+        """ write the encoded result to the file at path, a spooled result is fetched
+            there without being decoded, clupy.load_result(path) reads it back """
+        if not self.successful:
+            raise RuntimeError("the execution did not succeed")
+        spooled = self.spooled
+        if spooled is not None:
+            spooled.save(path)
+            return
+        with open(path, "wb") as stream:
+            for chunk in wire.encode_frame(self.value):
+                stream.write(chunk)
 
     def wait(self, time_out=10):
-        """ wait for the completion of the execution """
-        import time
-        wait_time = 0.0
-        while not self.completed and (time_out == 0 or wait_time < float(time_out)):
-            time.sleep(0.1)
-            if time_out > 0:
-                wait_time = wait_time + 0.1
+        """ wait for the completion of the execution, time_out of 0 waits forever,
+            returns whether the execution has completed """
+        with self._condition:
+            return self._condition.wait_for(lambda: self.completed, \
+                                            time_out if time_out > 0 else None)
+
+    def add_waiter(self, waiter):
+        """ register a CompletionWaiter, returns False if already completed """
+        with self._condition:
+            if self.completed:
+                return False
+            self._waiters.append(waiter)
+            return True
+
+    def remove_waiter(self, waiter):
+        """ unregister a CompletionWaiter """
+        with self._condition:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def add_done_callback(self, done_callback):
+        """ call done_callback(future) upon completion, or right away if already completed """
+        with self._condition:
+            if not self.completed:
+                self._done_callbacks.append(done_callback)
+                return
+        done_callback(self)
+
+    def __iter__(self):
+        """ iterate over the items of a generator function call as they arrive """
+        if self.stream is None:
+            raise TypeError("only calls of generator functions can be iterated")
+        return iter(self.stream)
+
+    def __aiter__(self):
+        """ iterate over the items of a generator function call from asyncio code """
+        if self.stream is None:
+            raise TypeError("only calls of generator functions can be iterated")
+        return self.stream.__aiter__()
+
+    def __await__(self):
+        """ make the future awaitable from an asyncio coroutine, the result is handed
+            over directly when the future completes on the awaiting loop's thread, a
+            spooled result is fetched by an executor thread """
+        loop = asyncio.get_event_loop()
+        loop_thread = threading.get_ident()
+        aio_future = loop.create_future()
+        def set_outcome(future):
+            if aio_future.done():
+                return
+            if future.successful:
+                aio_future.set_result(future._value) # pylint: disable=W0212
+            else:
+                failure = future.failure
+                aio_future.set_exception(failure if isinstance(failure, BaseException) \
+                    else RuntimeError(str(failure)))
+        def transfer(future):
+            if threading.get_ident() == loop_thread:
+                set_outcome(future)
+            else:
+                loop.call_soon_threadsafe(set_outcome, future)
+        self.add_done_callback(transfer)
+        value = yield from aio_future.__await__()
+        if isinstance(value, SpooledRemoteResult):
+            value = yield from loop.run_in_executor(None, lambda: self.value).__await__()
+        return value
+
+    def as_concurrent_future(self):
+        """ return a concurrent.futures.Future that completes along with this object,
+            so that it can be used where a standard future is expected """
+        std_future = concurrent.futures.Future()
+        std_future.set_running_or_notify_cancel()
+        def load(future):
+            try:
+                std_future.set_result(future.value)
+            except Exception as err: # pylint: disable=W0703
+                std_future.set_exception(err)
+        def transfer(future):
+            if future.spooled is not None:
+                # not fetched on the thread completing the future, it runs the IO loop
+                threading.Thread(target=load, args=(future,), daemon=True).start()
+            elif future.successful:
+                std_future.set_result(future.value)
+            else:
+                failure = future.failure
+                std_future.set_exception(failure if isinstance(failure, BaseException) \
+                    else RuntimeError(str(failure)))
+        self.add_done_callback(transfer)
+        return std_future
 
     def succeed(self, suceed_callback):
-        """ setting the suceed_callback function """
+        """ setting the suceed_callback function, it receives the SpooledRemoteResult
+            of a spooled result, fetching the result is up to the callback """
         self._suceed_callback = suceed_callback
+        if self.completed and self.successful:
+            suceed_callback(self._value)
         return self
 
     def fail(self, fail_callback):
         """ setting the fail_callback function """
         self._fail_clallback = fail_callback
+        if self.completed and not self.successful:
+            fail_callback(self.failure)
         return self
 
     def complete(self, succeed_callback, fail_callback):
         """ setting the completion callback functions """
-        self._suceed_callback = succeed_callback
-        self._fail_clallback = fail_callback
+        self.succeed(succeed_callback)
+        self.fail(fail_callback)
         return self
 
     def do_complete_callback(self, result, excep):
         """ notify client about async results """
-        self.completed = True
-        if result:
-            self.successful = True
+        with self._condition:
+            self.successful = excep is None
+            self.completed = True
+            self._condition.notify_all()
+            waiters = self._waiters
+            done_callbacks = self._done_callbacks
+            self._waiters = []
+            self._done_callbacks = []
+        for waiter in waiters:
+            waiter.add_completed(self)
+        if excep is None:
             if self._suceed_callback:
                 self._suceed_callback(result)
-        if excep:
-            self.successful = False
+        else:
             if self._fail_clallback:
-                self._fail_clallback(excep)
\ No newline at end of file
+                self._fail_clallback(excep)
+        for done_callback in done_callbacks:
+            done_callback(self)
@@ -0,0 +1,154 @@
+""" the leases of the servers the master allocated to a client, renewed in batched
+    requests while the servers are in use and released once they are idle """
+import pickle
+from datetime import datetime, timedelta
+from tornado.httpclient import AsyncHTTPClient
+from tornado import gen
+from .servers import RemoteServerInfo
+
+class ServerLeasesMixin(object):
+    """ the part of the RemoteExecutionWorker allocating servers from the master,
+        renewing their leases and releasing them """
+
+    def request_servers(self, server_count):
+        """ asynchronously request servers from the master node if the pool is
+            short of server_count servers """
+        if not self._allocating and (not self._server_list \
+                                     or server_count > self._requested_server_count):
+            # need to request for more servers to remotely execute this function
+            self._allocating = True
+            self._requested_server_count = max(self._requested_server_count, server_count)
+            request_count = server_count - len(self._server_list) if server_count else 0
+            self.io_loop.add_future(self.allocate_servers(request_count), \
+                self.complete_allocation)
+
+    def master_endpoint(self, path):
+        """ the URL of a master node endpoint taking the client id """
+        master_url = self.master_url.replace("clupy://", "http://")
+        master_url = master_url.rstrip('/')
+        return master_url + "/" + path + "/" + self.client_id
+
+    @gen.coroutine
+    def allocate_servers(self, server_count):
+        """ request a list of servers from the master node, (server url,
+            capacity weight) pairs """
+        master_url = self.master_endpoint("alloc") + "/" + str(server_count)
+        http_client = AsyncHTTPClient()
+        response = yield http_client.fetch(master_url)
+        server_list = pickle.loads(response.body)
+        self._logger.info("master returned server list: %s", str(server_list))
+        return server_list
+
+    def complete_allocation(self, alloc_future):
+        """ add the allocated servers to the pool, or fail all queued calls in case
+            we could not get any server from the master """
+        self._allocating = False
+        try:
+            server_list = alloc_future.result()
+        except Exception as err: # pylint: disable=W0703
+            self._logger.error("request servers from master at %s got error: %s", \
+                self.master_url, str(err))
+            if not self._server_list:
+                for func_key in self._function_list:
+                    for call_context in self._scheduler.drain(func_key):
+                        self.complete_single_execution(None, err, call_context)
+                for func_key in list(self._actors.values()):
+                    self.break_actor(self._function_list[func_key], err)
+            return
+        self.add_servers(server_list)
+        self.carry_out_executions()
+        self.maintain_server_states()
+
+    def add_servers(self, server_list):
+        """ add the (server url, capacity weight) pairs allocated by the master
+            to the pool, the weights of known servers are updated """
+        known_servers = dict((server.server_url, server) for server in self._server_list)
+        for server, weight in server_list:
+            if server in known_servers:
+                known_servers[server].weight = weight
+            else:
+                self._server_list.append(RemoteServerInfo(server, weight))
+
+    @gen.coroutine
+    def release_all_servers(self, server_urls):
+        """ drop the remaining actors and release all servers to the master """
+        yield [self.post_actor_destroy(self._function_list[func_key]) \
+               for func_key in self._actors.values()]
+        held_servers = yield self.retain_servers(server_urls, True)
+        return held_servers
+
+    def complete_final_release(self, lease_future, server_urls):
+        """ stop the IOLoop once the servers are released """
+        self.complete_lease_request(lease_future, server_urls, True)
+        self.io_loop.stop()
+
+    def maintain_server_states(self):
+        """ renew the leases of the servers that were active since the previous
+            renewal in one batched request every lease_renewal_period seconds,
+            release the servers idle for server_idle_time seconds to the master,
+            at most one lease request is outstanding at any time """
+        if self._lease_request is not None \
+                or self.master_url is None:
+            return
+        now = datetime.now()
+        # the servers holding partial results of map_reduce calls to be combined
+        reducing = set(id(server) for func_context in self._function_list.values() \
+                       if func_context.reduction is not None \
+                       for server in func_context.reduction.servers)
+        if self._scheduler.empty() and not self._allocating:
+            idle_since = now - timedelta(seconds=self._config.server_idle_time)
+            idle_servers = [server for server in self._server_list \
+                            if not server.in_flight and not server.actors \
+                            and not server.services and id(server) not in reducing \
+                            and server.last_activity_time < idle_since]
+            if idle_servers:
+                for server in idle_servers:
+                    self._server_list.remove(server)
+                self._requested_server_count = min(self._requested_server_count, \
+                                                   len(self._server_list))
+                self.send_lease_request([server.server_url for server in idle_servers], \
+                                        True)
+                return
+        if now - self._last_renewal_time \
+                < timedelta(seconds=self._config.lease_renewal_period):
+            return
+        active_servers = [server.server_url for server in self._server_list \
+                          if server.in_flight or server.actors or server.services \
+                          or id(server) in reducing \
+                          or server.last_activity_time >= self._last_renewal_time]
+        self._last_renewal_time = now
+        if active_servers:
+            self.send_lease_request(active_servers, False)
+
+    def send_lease_request(self, server_urls, to_free):
+        """ renew or release the leases of a list of servers """
+        self._logger.info("%s the leases of %s", "releasing" if to_free else "renewing", \
+                          str(server_urls))
+        self._lease_request = self.retain_servers(server_urls, to_free)
+        self.io_loop.add_future(self._lease_request, \
+            lambda fut: self.complete_lease_request(fut, server_urls, to_free))
+
+    @gen.coroutine
+    def retain_servers(self, server_urls, to_free):
+        """ post a batch of servers to renew or release to the master node,
+            the master returns the servers whose leases this client holds """
+        master_url = self.master_endpoint("retain") + "/" + ("1" if to_free else "0")
+        http_client = AsyncHTTPClient()
+        response = yield http_client.fetch(master_url, method="POST", \
+                                           body=pickle.dumps(server_urls))
+        return pickle.loads(response.body)
+
+    def complete_lease_request(self, lease_future, server_urls, to_free):
+        """ log the outcome of a lease request """
+        self._lease_request = None
+        try:
+            held_urls = lease_future.result()
+        except Exception as err: # pylint: disable=W0703
+            self._logger.error("lease request to master at %s got error: %s", \
+                self.master_url, str(err))
+            return
+        if not to_free:
+            lost_urls = [url for url in server_urls if url not in held_urls]
+            if lost_urls:
+                self._logger.warning("the leases of %s are held by other clients", \
+                                     str(lost_urls))
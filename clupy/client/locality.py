@@ -0,0 +1,68 @@
+""" locality aware dispatch, the calls go to the servers that already ran their
+    function or hold their large arguments """
+import time
+
+class LocalityMixin(object):
+    """ the part of the RemoteExecutionWorker picking the warmest server for a batch
+        and holding calls back for a while when only cold servers are free """
+
+    def blob_digests(self, call_context):
+        """ the digests of the large arguments of the call heading a batch,
+            computed once to score every server by """
+        if len(self._server_list) < 2:
+            # no choice to make, save preparing the input before dispatching
+            return frozenset()
+        call_context.prepare_input(self._config.blob_threshold)
+        return frozenset(call_context.blobs)
+
+    def pick_server(self, call_context, digests=frozenset()):
+        """ the warmest server for the call among the ones with free slots, the
+            least loaded one among equally warm ones, then the one with the most
+            spare capacity reported by the master and the most free slots, returns
+            the server and its warmth, None if all slots are taken, digests are
+            the blob_digests of the call """
+        chosen = None
+        chosen_rank = None
+        for server in self._server_list:
+            free_slots = server.free_slots(self._config.pipeline_depth)
+            if free_slots <= 0:
+                continue
+            rank = (self.warmth(server, call_context, digests), -server.load, \
+                    server.weight, free_slots)
+            if chosen_rank is None or rank > chosen_rank:
+                chosen = server
+                chosen_rank = rank
+        return chosen, chosen_rank[0] if chosen_rank is not None else 0
+
+    def warmth(self, server, call_context, digests):
+        """ how much of the work to start the call the server already did, one for
+            having run the function and one for each of the large arguments of
+            the digests it holds """
+        if len(self._server_list) < 2:
+            return 0
+        warmth = 1 if call_context.code_key in server.warm_functions else 0
+        return warmth + len(digests & server.blobs)
+
+    def is_warm_elsewhere(self, call_context, digests):
+        """ whether a server without a free slot would be warm for the call """
+        if not self._config.locality:
+            return False
+        for server in self._server_list:
+            if self.warmth(server, call_context, digests) > 0:
+                return True
+        return False
+
+    def retry_held_back(self, retry_time):
+        """ dispatch the calls held back for warm servers once they waited
+            locality_delay milliseconds, or for busy servers once their
+            Retry-After passed, unless slots free up before """
+        if self._locality_retry is not None:
+            self.io_loop.remove_timeout(self._locality_retry)
+        self._locality_retry = self.io_loop.call_at(\
+            self.io_loop.time() + max(retry_time - time.time(), 0.0), \
+            self.complete_locality_retry)
+
+    def complete_locality_retry(self):
+        """ the locality_delay of a held back function expired """
+        self._locality_retry = None
+        self.carry_out_executions()
@@ -0,0 +1,99 @@
+""" find the source modules a remotely executed function depends on, so that
+    server nodes can import them from a code cache keyed by content digest """
+import inspect
+import os
+import sys
+import sysconfig
+from ..utils import wire
+
+def shipped_name(module):
+    """ the name the module is imported by on server nodes, a script run as
+        __main__ is imported by its file name """
+    if module.__name__ == "__main__":
+        return os.path.splitext(os.path.basename(module.__file__))[0]
+    return module.__name__
+
+def is_package(module):
+    """ whether the module is a package, i.e. loaded from an __init__ file """
+    return hasattr(module, "__path__")
+
+def module_root(module):
+    """ the sys.path entry the module was imported from """
+    root = os.path.dirname(os.path.abspath(module.__file__))
+    depth = shipped_name(module).count(".") + (1 if is_package(module) else 0)
+    for _ in range(depth):
+        root = os.path.dirname(root)
+    return root
+
+def library_paths():
+    """ the directories of the standard library and the installed packages """
+    paths = set()
+    for name in ("stdlib", "platstdlib", "purelib", "platlib"):
+        path = sysconfig.get_paths().get(name)
+        if path:
+            paths.add(os.path.abspath(path) + os.sep)
+    return tuple(paths)
+
+class FunctionModules(object):
+    """ the function's module along with the modules of the same source tree it
+        uses, found through the module globals, and the packages containing them,
+        modules living in the standard library or site-packages, and the modules
+        of the framework itself, are not shipped
+    """
+
+    def __init__(self, func):
+        self._digests = {} # path -> ((mtime, size), digest, source)
+        module = sys.modules.get(func.__module__)
+        self.module_name = shipped_name(module) if module is not None else func.__module__
+        self.modules = {} # shipped name -> (path, is package)
+        if module is None or not self.is_source(module) \
+                or wire.is_framework_module(module.__name__):
+            return
+        root = module_root(module) + os.sep
+        excluded = library_paths()
+        to_visit = [module]
+        while to_visit:
+            current = to_visit.pop()
+            name = shipped_name(current)
+            if name in self.modules:
+                continue
+            self.modules[name] = (os.path.abspath(current.__file__), is_package(current))
+            # the packages the module lives in are imported first on the server
+            parent_name = current.__name__.rpartition(".")[0]
+            if parent_name in sys.modules:
+                to_visit.append(sys.modules[parent_name])
+            for value in list(vars(current).values()):
+                used = value if inspect.ismodule(value) \
+                    else sys.modules.get(getattr(value, "__module__", None) or "")
+                if used is None or not self.is_source(used) \
+                        or wire.is_framework_module(used.__name__):
+                    continue
+                path = os.path.abspath(used.__file__)
+                if path.startswith(root) and not path.startswith(excluded):
+                    to_visit.append(used)
+
+    @staticmethod
+    def is_source(module):
+        """ whether the module was loaded from a python source file """
+        return getattr(module, "__file__", None) is not None and module.__file__.endswith(".py")
+
+    def manifest(self):
+        """ a (manifest, sources) pair, the manifest maps the shipped module names to
+            [digest, is package], the sources map the digests to the source chunks,
+            sources are hashed again only once their files change """
+        manifest = {}
+        sources = {}
+        for name, (path, package) in self.modules.items():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            version = (stat.st_mtime_ns, stat.st_size)
+            if path not in self._digests or self._digests[path][0] != version:
+                with open(path, "rb") as stream:
+                    source = stream.read()
+                self._digests[path] = (version, wire.digest_chunks([source]), source)
+            _, digest, source = self._digests[path]
+            manifest[name] = [digest, package]
+            sources[digest] = [source]
+        return manifest, sources
@@ -0,0 +1,129 @@
+""" cluster side tree reduction of the results of map_reduce calls, every server
+    reduces the results of its batches into a partial result, the partial results
+    are merged pairwise across the servers """
+import inspect
+import json
+from tornado import gen
+from ..utils import wire
+from .batching import OneExecutionRequestContext
+from .modules import FunctionModules
+
+class Reduction(object):
+    """ the state of a map_reduce call, the map calls still to complete and the
+        servers holding partial results """
+
+    def __init__(self, reduction_id, modules, func_name, future_object, call_count):
+        self.reduction_id = reduction_id
+        self.modules = modules # the FunctionModules of the reduce function
+        self.func_name = func_name
+        self.future_object = future_object
+        self.pending = call_count
+        self.failure = None
+        self.servers = [] # the RemoteServerInfo of the servers holding partial results
+
+    def request(self, op):
+        """ the fields of a request carrying out op on the partial results """
+        return {
+            "op": op,
+            "reduction_id": self.reduction_id,
+            "reduce_module": self.modules.module_name,
+            "reduce_func": self.func_name,
+        }
+
+    def add_server(self, server_entry):
+        """ the server reduced a batch of map calls into its partial result """
+        if server_entry not in self.servers:
+            self.servers.append(server_entry)
+
+    def call_completed(self, excep):
+        """ count a completed map call, the first failure fails the reduction,
+            return whether all map calls completed """
+        if excep is not None and self.failure is None:
+            self.failure = excep
+        self.pending = self.pending - 1
+        return self.pending == 0
+
+class MapReduceMixin(object):
+    """ the part of the RemoteExecutionWorker queueing the map calls of map_reduce
+        calls and combining the partial results of the servers """
+
+    def map_reduce_request(self, map_fn, reduce_fn, packed_list, future_obj, \
+                           server_count, priority=0, weight=1):
+        """ the callback function added when there is a map_reduce request, the map
+            calls are queued like any other calls under a function key of their
+            own, so that a batch never mixes calls of different reductions, the
+            servers reduce the results of their batches into partial results
+            that are merged once all map calls completed """
+        self._logger.info("map_reduce request of %d calls received by the worker", \
+                          len(packed_list))
+        if not packed_list:
+            self.complete_future(future_obj, None, \
+                TypeError("map_reduce of an empty sequence with no initial value"))
+            return
+        reduction_id = self.client_id + "-reduce-" + str(next(self._reduction_ids))
+        file_name = inspect.getfile(map_fn)
+        func_key = file_name + ":" + map_fn.__name__ + "#" + reduction_id
+        self._function_list[func_key] = self.new_function_context(\
+            FunctionModules(map_fn), reduction=Reduction(reduction_id, \
+                FunctionModules(reduce_fn), reduce_fn.__name__, future_obj, \
+                len(packed_list)))
+        self._scheduler.set_weight(func_key, weight)
+        for packed in packed_list:
+            self._scheduler.push(OneExecutionRequestContext(None, func_key, file_name, \
+                map_fn.__name__, packed, priority))
+        self.request_servers(server_count)
+        self.carry_out_executions()
+        self.maintain_server_states()
+
+    @gen.coroutine
+    def combine_partials(self, func_context):
+        """ merge the partial results the servers hold pairwise, halving the
+            number of servers holding one every round, and return the final
+            result, the partial results are discarded if any map call failed """
+        reduction = func_context.reduction
+        if reduction.failure is not None:
+            yield [self.post_reduction_op(server_entry, func_context, "discard") \
+                   for server_entry in reduction.servers]
+            raise reduction.failure
+        servers = list(reduction.servers)
+        while len(servers) > 1:
+            merges = []
+            for index in range(0, len(servers) - 1, 2):
+                merges.append(self.post_reduction_op(servers[index], func_context, \
+                                                     "merge", servers[index + 1]))
+            yield merges
+            servers = servers[::2]
+        value = yield self.post_reduction_op(servers[0], func_context, "take")
+        return value
+
+    @gen.coroutine
+    def post_reduction_op(self, server_entry, func_context, op, peer_entry=None):
+        """ ask a server to merge the partial result of peer_entry into its own,
+            take its partial result or discard it, return the value taken """
+        server_url = server_entry.server_url.replace("clupy://", "http://").rstrip("/")
+        request = func_context.reduction.request(op)
+        if peer_entry is not None:
+            request["peer"] = peer_entry.server_url.replace("clupy://", "http://")\
+                .rstrip("/") + "/exec/run/" + peer_entry.sandbox_id
+        manifest, _ = func_context.manifest()
+        body = yield self.post_frame(server_entry, \
+            server_url + "/exec/run/" + server_entry.sandbox_id, \
+            wire.encode_request(request), func_context.compression_stats, {}, \
+            {wire.MODULES_HEADER: json.dumps(manifest)})
+        succeeded, value = wire.decode_frame(body)
+        if not succeeded:
+            raise value
+        return value
+
+    def complete_reduction(self, combine_future, func_key):
+        """ complete the future of a map_reduce call with the combined result """
+        func_context = self._function_list.pop(func_key)
+        self._scheduler.remove(func_key)
+        try:
+            value = combine_future.result()
+            excep = None
+        except Exception as err: # pylint: disable=W0703
+            self._logger.error("map_reduce failed: %s", str(err))
+            value = None
+            excep = err
+        self.complete_future(func_context.reduction.future_object, value, excep)
@@ -0,0 +1,127 @@
+""" client wide scheduling of queued remote calls across the wrapped functions """
+import heapq
+import itertools
+
+class FunctionQueue(object):
+    """ the queued calls of one function, ordered by priority then arrival """
+
+    def __init__(self, func_key, weight):
+        self.func_key = func_key
+        self.weight = float(weight)
+        self.start_tag = 0.0 # virtual time at which the function's next batch starts
+        self._heap = []
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, call_context, sequence):
+        """ queue a call, higher priorities first, FIFO within a priority """
+        heapq.heappush(self._heap, (-call_context.priority, sequence, call_context))
+
+    def pop(self):
+        """ take the next call off the queue """
+        return heapq.heappop(self._heap)[2]
+
+    def head_priority(self):
+        """ the priority of the next call """
+        return -self._heap[0][0]
+
+    def head(self):
+        """ the next call """
+        return self._heap[0][2]
+
+class FairShareScheduler(object):
+    """ start-time fair queuing over the wrapped functions: among the functions
+        whose next call has the highest priority, the one with the smallest
+        virtual start tag is served, and serving n calls advances its tag by
+        n / weight, so that busy functions share the servers in proportion to
+        their weights and a function with a short queue is never starved
+    """
+
+    def __init__(self):
+        self._queues = {}
+        self._virtual_time = 0.0
+        self._sequence = itertools.count()
+        self._requeued = itertools.count(-1, -1) # put back calls go ahead of the queued ones
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def empty(self):
+        """ whether no call is queued """
+        return self._size == 0
+
+    def queued(self, func_key):
+        """ the number of queued calls of a function """
+        return len(self._queues[func_key]) if func_key in self._queues else 0
+
+    def set_weight(self, func_key, weight):
+        """ set the share of a function """
+        self._get_queue(func_key).weight = float(max(weight, 1e-6))
+
+    def push(self, call_context):
+        """ queue a call of call_context.func_key """
+        queue = self._get_queue(call_context.func_key)
+        if not queue:
+            # a function becoming busy again does not get credit for its idle time
+            queue.start_tag = max(queue.start_tag, self._virtual_time)
+        queue.push(call_context, next(self._sequence))
+        self._size = self._size + 1
+
+    def next_func_key(self, skipped=()):
+        """ the function to serve next, None if nothing is queued, the functions in
+            skipped are passed over """
+        chosen = None
+        for queue in self._queues.values():
+            if not queue or queue.func_key in skipped:
+                continue
+            if chosen is None or queue.head_priority() > chosen.head_priority() \
+                    or (queue.head_priority() == chosen.head_priority() \
+                        and queue.start_tag < chosen.start_tag):
+                chosen = queue
+        return chosen.func_key if chosen is not None else None
+
+    def head(self, func_key):
+        """ the next call of a function """
+        return self._queues[func_key].head()
+
+    def take(self, func_key, count):
+        """ take up to count calls of a function off the queue and charge them """
+        queue = self._queues[func_key]
+        calls = []
+        while queue and len(calls) < count:
+            calls.append(queue.pop())
+        self._size = self._size - len(calls)
+        self._virtual_time = queue.start_tag
+        queue.start_tag = queue.start_tag + len(calls) / queue.weight
+        return calls
+
+    def requeue(self, calls):
+        """ put back calls taken off the queue that could not be served, ahead of
+            the calls of the same priority queued since, and refund their charge """
+        for call_context in reversed(calls):
+            queue = self._get_queue(call_context.func_key)
+            queue.push(call_context, next(self._requeued))
+            queue.start_tag = queue.start_tag - 1.0 / queue.weight
+        self._size = self._size + len(calls)
+
+    def drain(self, func_key):
+        """ take all queued calls of a function off the queue without charging them """
+        queue = self._queues.get(func_key)
+        calls = []
+        while queue:
+            calls.append(queue.pop())
+        self._size = self._size - len(calls)
+        return calls
+
+    def remove(self, func_key):
+        """ forget the queue of a function whose calls are all taken """
+        queue = self._queues.pop(func_key, None)
+        self._size = self._size - (len(queue) if queue is not None else 0)
+
+    def _get_queue(self, func_key):
+        """ the queue of a function, created on first use """
+        if func_key not in self._queues:
+            self._queues[func_key] = FunctionQueue(func_key, 1.0)
+        return self._queues[func_key]
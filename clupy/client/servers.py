@@ -0,0 +1,181 @@
+""" the server nodes allocated to a client, their execution slots and the requests
+    creating sandboxes, posting frames and uploading content to them """
+import time
+import urllib
+from datetime import datetime
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest, HTTPClientError
+from tornado import gen
+from ..utils import wire, compression
+
+def chunk_writer(chunks):
+    """ a body_producer streaming the chunks of an encoded frame straight to the socket """
+    @gen.coroutine
+    def write_chunks(write):
+        """ write the chunks one by one """
+        for chunk in chunks:
+            yield write(chunk)
+    return write_chunks
+
+class RemoteServerInfo(object):
+    """ the server information structure represented a remote server
+        containing server URL as well as the batches of calls that are
+        outstanding on the server, at most one per execution slot
+    """
+
+    def __init__(self, url, weight=1.0):
+        self.server_url = url
+        self.weight = weight # the spare cores of the server when the master allocated it
+        self.in_flight = []
+        # a single slot until the server reports its concurrency on sandbox creation
+        self.slot_count = 1
+        # the requests the server admits at once, its workers and run queue, 0 if unknown
+        self.capacity = 0
+        self.sandbox_id = None
+        self.codecs = [] # the codecs the server accepts
+        self.blobs = set() # digests of the blobs and source modules uploaded to the server
+        self.blob_uploads = {} # digest -> Future of the ongoing upload
+        self.last_activity_time = datetime.now()
+        self.last_completion_time = 0.0
+        self.warm_functions = {} # code key -> time the server last completed a batch of it
+        self.actors = set() # the ids of the actors living on the server
+        self.services = set() # the names of the entry points published on the server
+        self.load = 0.0 # the load hint of the server's latest response
+        self.retry_time = 0.0 # the server turned a request away, wait until then
+
+    def free_slots(self, pipeline_depth=0):
+        """ the number of further requests that can be put on the wire to this server,
+            pipeline_depth extra requests are allowed to queue up on a busy server
+            so that the next task is already there when a slot frees up, never more
+            than the server admits, it would turn the excess away
+        """
+        if time.time() < self.retry_time:
+            # give the server time to work off its run queue
+            return 0
+        if not self.sandbox_id:
+            # wait for the sandbox creation to tell us the slot count
+            return 1 - len(self.in_flight)
+        slots = self.slot_count + pipeline_depth
+        if self.capacity > 0:
+            slots = min(slots, self.capacity)
+        return slots - len(self.in_flight)
+
+    def record_load(self, headers, busy=False):
+        """ take in the load hint of a response, a busy server, which turned the
+            request away, gets no further requests for its Retry-After seconds """
+        load = headers.get(wire.LOAD_HEADER)
+        if load is not None:
+            self.load = float(load)
+        if busy:
+            self.retry_time = time.time() + float(headers.get("Retry-After", "1"))
+
+class ServerRequestsMixin(object):
+    """ the part of the RemoteExecutionWorker talking to the servers, creating the
+        sandboxes, posting the encoded frames and uploading blobs and modules """
+
+    @gen.coroutine
+    def create_sandbox(self, server_entry, server_url):
+        """ ask the server to create an execution sandbox for this client """
+        request_url = server_url + "/create/" + urllib.parse.quote(\
+                self.client_id) + "/1"
+        response = yield AsyncHTTPClient().fetch(request_url)
+        server_entry.sandbox_id = response.body.decode("utf-8")
+        server_entry.codecs = compression.parse_accept_header(\
+            response.headers.get(compression.ACCEPT_HEADER))
+        server_entry.slot_count = self._config.slots_per_server \
+            if self._config.slots_per_server > 0 \
+            else int(response.headers.get("X-CluPy-Slots", "1"))
+        server_entry.capacity = int(response.headers.get(wire.CAPACITY_HEADER, "0"))
+        server_entry.record_load(response.headers)
+        self._logger.info("server %s provides %d execution slots", \
+            server_entry.server_url, server_entry.slot_count)
+        # the newly known slots can be filled right away
+        self.carry_out_executions()
+
+    @gen.coroutine
+    def post_frame(self, server_entry, request_url, chunks, stats, timing, headers):
+        """ post an encoded frame with the extra headers, compressing it if
+            worthwhile, and return the decompressed response body """
+        request = self.frame_request(server_entry, request_url, "POST", chunks, stats)
+        request.headers.update(headers)
+        if stats.response.worthwhile():
+            request.headers[compression.ACCEPT_HEADER] = compression.accept_header_value()
+        try:
+            response = yield AsyncHTTPClient().fetch(request)
+        except HTTPClientError as err:
+            if err.response is not None:
+                server_entry.record_load(err.response.headers, err.code == 503)
+            raise
+        server_entry.record_load(response.headers)
+        timing["received"] = time.time()
+        exec_times = response.headers.get(wire.EXEC_TIME_HEADER)
+        timing["remote"] = [float(value) for value in exec_times.split(",")] \
+            if exec_times else []
+        server_entry.codecs = compression.parse_accept_header(\
+            response.headers.get(compression.ACCEPT_HEADER))
+        body = response.body
+        codec = response.headers.get(compression.CODEC_HEADER)
+        if codec:
+            start = time.time()
+            body = compression.decompress(codec, body)
+            stats.response.record(len(body), len(response.body), time.time() - start \
+                + float(response.headers.get(compression.COMPRESS_TIME_HEADER, "0")))
+        return body
+
+    def frame_request(self, server_entry, request_url, method, chunks, stats):
+        """ build the request sending an encoded frame, compressed if worthwhile """
+        length = wire.frame_length(chunks)
+        headers = {"Content-Type": wire.CONTENT_TYPE}
+        codec = compression.choose_codec(server_entry.codecs)
+        if codec and length >= self._config.compression_threshold \
+                and stats.request.worthwhile():
+            body, seconds = compression.timed_compress(codec, chunks)
+            stats.request.record(length, len(body), seconds)
+            headers[compression.CODEC_HEADER] = codec
+            return HTTPRequest(request_url, method=method, body=body, \
+                request_timeout=self._config.request_timeout, headers=headers)
+        headers["Content-Length"] = str(length)
+        return HTTPRequest(request_url, method=method, body_producer=chunk_writer(chunks), \
+            request_timeout=self._config.request_timeout, headers=headers)
+
+    @gen.coroutine
+    def upload_blobs(self, server_entry, server_url, blobs, stats, kind="blob"):
+        """ make sure the server holds the given blobs, only the ones the server
+            misses are uploaded and concurrent batches share the uploads, source
+            modules are uploaded the same way into the server's code cache with
+            kind set to module """
+        pending = []
+        to_query = {}
+        for digest, chunks in blobs.items():
+            if digest in server_entry.blobs:
+                continue
+            if digest in server_entry.blob_uploads:
+                pending.append(server_entry.blob_uploads[digest])
+            else:
+                to_query[digest] = chunks
+        if to_query:
+            upload = self.upload_missing_blobs(server_entry, server_url, to_query, \
+                                               stats, kind)
+            for digest in to_query:
+                server_entry.blob_uploads[digest] = upload
+            pending.append(upload)
+        if pending:
+            yield pending
+
+    @gen.coroutine
+    def upload_missing_blobs(self, server_entry, server_url, blobs, stats, kind):
+        """ ask the server which blobs it misses and upload those """
+        http_client = AsyncHTTPClient()
+        try:
+            response = yield http_client.fetch(server_url + "/" + kind + "s", \
+                method="POST", body=b"".join(wire.encode_frame(list(blobs.keys()))), \
+                headers={"Content-Type": wire.CONTENT_TYPE})
+            for digest in wire.decode_frame(response.body):
+                chunks = blobs[digest]
+                self._logger.info("uploading %s %s to %s", kind, digest, \
+                                  server_entry.server_url)
+                yield http_client.fetch(self.frame_request(server_entry, \
+                    server_url + "/" + kind + "/" + digest, "PUT", chunks, stats))
+            server_entry.blobs.update(blobs.keys())
+        finally:
+            for digest in blobs:
+                server_entry.blob_uploads.pop(digest, None)
@@ -0,0 +1,19 @@
+""" client side publishing of services, whose entry points are hosted by server nodes """
+import importlib
+import urllib
+from .modules import FunctionModules
+
+def resolve_entry_point(entry):
+    """ the (name, function) of an entry point given either as a function or as a
+        "module.function" name, the name is the path the entry point is served at """
+    if callable(entry):
+        return FunctionModules(entry).module_name + "." + entry.__name__, entry
+    module_name, _, func_name = entry.rpartition(".")
+    if not module_name:
+        raise ValueError("entry point {} is not of the form module.function".format(entry))
+    return entry, getattr(importlib.import_module(module_name), func_name)
+
+def endpoint_url(server_url, port, name):
+    """ the URL an entry point published on a server node is served at """
+    host = urllib.parse.urlparse(server_url.replace("clupy://", "http://")).hostname
+    return "http://{}:{}/{}".format(host, port, name)
@@ -0,0 +1,98 @@
+""" speculative re-execution of the straggling batches on idle servers, the first
+    copy of a batch to complete wins """
+import collections
+import time
+
+class DurationTracker(object):
+    """ the per-call durations of a function's most recent batches """
+
+    def __init__(self, window=200, min_samples=10):
+        self.min_samples = min_samples
+        self._durations = collections.deque(maxlen=window)
+
+    def record(self, per_call_time):
+        """ record the per-call duration of a completed batch """
+        self._durations.append(per_call_time)
+
+    def percentile(self, percent):
+        """ the given percentile of the recorded durations, None if there are too few """
+        if len(self._durations) < self.min_samples:
+            return None
+        ordered = sorted(self._durations)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100.0))]
+
+class SpeculationCounters(object):
+    """ how often straggling batches were re-executed speculatively """
+
+    def __init__(self):
+        self.launched = 0
+        self.won = 0 # the speculative copy completed first
+        self.lost = 0 # the original copy completed first
+
+    def info(self):
+        """ the counters as a dictionary """
+        return {"launched": self.launched, "won": self.won, "lost": self.lost}
+
+class StragglerSpeculationMixin(object):
+    """ the part of the RemoteExecutionWorker launching speculative copies of the
+        batches running much longer than their function's typical duration """
+
+    def check_stragglers(self):
+        """ called periodically, when there are idle servers, launch a speculative
+            copy of every running batch that takes longer than speculation_threshold
+            percent of the speculation_percentile duration of its function """
+        if not self._scheduler.empty():
+            # the servers are not idle, queued calls come first
+            return
+        now = time.time()
+        for server in self._server_list:
+            blocked = False
+            for batch in list(server.in_flight):
+                if batch.speculated or batch.completed:
+                    # the requests waiting behind a straggler are stuck as well
+                    blocked = blocked or batch.speculated
+                    continue
+                func_context = self._function_list[batch.calls[0].func_key]
+                if batch.calls[0].stream is not None or func_context.reduction is not None:
+                    # a stream runs as long as its consumer, and the results of map
+                    # calls are reduced on the server, neither must run twice
+                    continue
+                start_time, pipelined = batch.copies[server]
+                if pipelined and server.last_completion_time < start_time:
+                    # still waiting behind another request, not running yet
+                    if not blocked:
+                        continue
+                else:
+                    if pipelined:
+                        start_time = server.last_completion_time
+                    typical = func_context.durations.percentile(\
+                        self._config.speculation_percentile)
+                    if typical is None or now - start_time < typical * len(batch.calls) \
+                            * self._config.speculation_threshold / 100.0:
+                        continue
+                idle_server = self.pick_idle_server(batch)
+                if idle_server is None:
+                    return
+                self._logger.info("speculatively re-executing a straggler of %s on %s", \
+                    batch.calls[0].func_key, idle_server.server_url)
+                batch.speculated = True
+                func_context.speculation.launched = func_context.speculation.launched + 1
+                self.dispatch_batch(batch, idle_server, True)
+
+    def pick_idle_server(self, batch):
+        """ the server with the most idle slots not already running the batch """
+        chosen = None
+        chosen_slots = 0
+        for server in self._server_list:
+            if server in batch.copies or not server.sandbox_id:
+                continue
+            idle_slots = server.free_slots()
+            if idle_slots > chosen_slots:
+                chosen = server
+                chosen_slots = idle_slots
+        return chosen
+
+    def speculation_info(self):
+        """ the speculation counters of every function """
+        return dict((func_key, func_context.speculation.info()) \
+                    for func_key, func_context in self._function_list.items())
@@ -0,0 +1,139 @@
+""" client side fetching of the large results server nodes spooled to disk """
+import concurrent.futures
+import hashlib
+import http.client
+import logging
+import mmap
+import os
+import socket
+import threading
+import urllib.error
+import urllib.request
+from ..utils import wire
+
+READ_SIZE = 1 << 20 # bytes read from the response between two writes
+MIN_PART_SIZE = 1 << 20 # bytes, smaller results are not split into ranges
+
+def map_frame(path):
+    """ the object of a frame saved in a file, decoded from a private memory map
+        so that its large buffers are paged in as they are used """
+    with open(path, "rb") as stream:
+        mapped = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_COPY)
+    return wire.decode_frame(mapped)
+
+def load_result(path):
+    """ the value of a spooled result saved with RemoteExecutionFuture.save """
+    return map_frame(path)
+
+class SpooledRemoteResult(object):
+    """ handle of a result a server node spooled rather than replied, the frame of
+        size bytes is fetched in parallel byte ranges, a range whose connection
+        broke off resumes from where it stopped, the ranges already received are
+        kept so that calling save again after a failure carries on, the server
+        removes the result once it was fetched, or after its spool ttl
+    """
+
+    def __init__(self, url, size, digest, config):
+        self.url = url
+        self.size = size # bytes
+        self.digest = digest
+        self._config = config
+        self._lock = threading.Lock()
+        self._path = None
+        self._parts = [] # [offset, end] of each range, offset is the next byte to fetch
+        self._logger = logging.getLogger("client")
+
+    def __repr__(self):
+        return "SpooledRemoteResult({}, {} bytes)".format(self.url, self.size)
+
+    def save(self, path):
+        """ fetch the encoded result into the file at path, raise RuntimeError if
+            the server no longer holds it or the content does not match its digest """
+        with self._lock:
+            if self._path != path or not os.path.exists(path):
+                self._path = path
+                part_count = max(1, min(self._config.result_fetch_parts, \
+                                        self.size // MIN_PART_SIZE))
+                part_size = -(-self.size // part_count)
+                self._parts = [[start, min(start + part_size, self.size)] \
+                               for start in range(0, self.size, part_size)]
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                os.ftruncate(fd, self.size)
+                pending = [part for part in self._parts if part[0] < part[1]]
+                if pending:
+                    with concurrent.futures.ThreadPoolExecutor(len(pending)) as executor:
+                        for fetch in [executor.submit(self.fetch_range, fd, part) \
+                                      for part in pending]:
+                            fetch.result()
+            finally:
+                os.close(fd)
+            if self.file_digest(path) != self.digest:
+                self._path = None
+                raise RuntimeError("spooled result {} does not match its digest".format(self.url))
+            self.remove()
+
+    def load(self):
+        """ fetch the result into the client spool directory and decode it, the
+            file is mapped and unlinked so that it goes away with the value """
+        path = os.path.join(self._config.result_spool_dir, self.url.rsplit("/", 1)[-1])
+        self.save(path)
+        value = map_frame(path)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return value
+
+    def fetch_range(self, fd, part):
+        """ fetch the bytes of part into fd, resuming after a broken connection, give
+            up after result_fetch_retries consecutive attempts without progress """
+        failures = 0
+        while part[0] < part[1]:
+            request = urllib.request.Request(self.url, headers={\
+                "Range": "bytes={}-{}".format(part[0], part[1] - 1)})
+            offset = part[0]
+            try:
+                with urllib.request.urlopen(request, \
+                        timeout=self._config.result_fetch_timeout) as response:
+                    if response.status != 206 and part[0] > 0:
+                        raise RuntimeError("server does not serve ranges of {}".format(self.url))
+                    while part[0] < part[1]:
+                        data = response.read(min(READ_SIZE, part[1] - part[0]))
+                        if not data:
+                            break
+                        os.pwrite(fd, data, part[0])
+                        part[0] = part[0] + len(data)
+                if part[0] < part[1]:
+                    raise ConnectionError("range of {} ended early".format(self.url))
+            except urllib.error.HTTPError as err:
+                if err.code == 404:
+                    raise RuntimeError("spooled result {} expired on the server".format(\
+                        self.url)) from err
+                raise
+            except (urllib.error.URLError, http.client.HTTPException, socket.timeout, \
+                    ConnectionError) as err:
+                failures = failures + 1 if part[0] == offset else 1
+                if failures > self._config.result_fetch_retries:
+                    raise
+                self._logger.info("resuming %s at byte %d: %s", self.url, part[0], str(err))
+
+    @staticmethod
+    def file_digest(path):
+        """ the content hash of a saved frame """
+        hasher = hashlib.blake2b(digest_size=20)
+        with open(path, "rb") as stream:
+            for data in iter(lambda: stream.read(READ_SIZE), b""):
+                hasher.update(data)
+        return hasher.hexdigest()
+
+    def remove(self):
+        """ have the server remove the fetched result """
+        request = urllib.request.Request(self.url, method="DELETE")
+        try:
+            urllib.request.urlopen(request, timeout=self._config.result_fetch_timeout).close()
+        except (urllib.error.URLError, http.client.HTTPException, socket.timeout, \
+                ConnectionError) as err:
+            self._logger.info("could not remove %s: %s", self.url, str(err))
@@ -0,0 +1,154 @@
+""" per-call latency breakdown of remote executions
+
+    Every call records when it was queued, dispatched to a server, serialized,
+    when the response arrived and when the response was deserialized, the
+    server reports the execution time of each call in the X-CluPy-Exec-Time
+    response header. The phases in between are collected into per function
+    histograms, and optionally written to a JSON-lines file, one line per call.
+"""
+import json
+import logging
+import math
+import threading
+
+# the phases of a call, each measured between two timestamps of the call
+PHASES = ("queue", "serialize", "transfer", "remote", "deserialize", "total")
+
+class LatencyHistogram(object):
+    """ a histogram of durations over logarithmic buckets, four per doubling,
+        starting at one microsecond """
+
+    MIN_DURATION = 1e-6
+    BUCKETS_PER_DOUBLING = 4
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = {} # bucket index -> count
+
+    def record(self, duration):
+        """ add one duration in seconds """
+        duration = max(duration, 0.0)
+        self.count = self.count + 1
+        self.sum = self.sum + duration
+        self.min = duration if self.min is None else min(self.min, duration)
+        self.max = duration if self.max is None else max(self.max, duration)
+        index = self.bucket_index(duration)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    @staticmethod
+    def bucket_index(duration):
+        """ the bucket holding the duration """
+        if duration <= LatencyHistogram.MIN_DURATION:
+            return 0
+        return int(math.log(duration / LatencyHistogram.MIN_DURATION, 2) \
+                   * LatencyHistogram.BUCKETS_PER_DOUBLING) + 1
+
+    @staticmethod
+    def bucket_bound(index):
+        """ the upper bound of a bucket in seconds """
+        return LatencyHistogram.MIN_DURATION \
+            * 2.0 ** (float(index) / LatencyHistogram.BUCKETS_PER_DOUBLING)
+
+    def percentile(self, percent):
+        """ the upper bound of the bucket holding the given percentile """
+        if not self.count:
+            return None
+        rank = self.count * percent / 100.0
+        seen = 0
+        for index in sorted(self.buckets):
+            seen = seen + self.buckets[index]
+            if seen >= rank:
+                return min(self.bucket_bound(index), self.max)
+        return self.max
+
+    def summary(self):
+        """ the histogram as a dictionary """
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count if self.count else None,
+            "min": self.min,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max,
+            "buckets": [(self.bucket_bound(index), self.buckets[index]) \
+                        for index in sorted(self.buckets)],
+        }
+
+def call_phases(call_context):
+    """ the durations of the phases a completed call went through, phases the
+        call did not reach, e.g. upon failing to get servers, are left out """
+    phases = {}
+    if call_context.dispatch_time is not None:
+        phases["queue"] = call_context.dispatch_time - call_context.enqueue_time
+    if call_context.serialized_time is not None:
+        phases["serialize"] = call_context.serialized_time - call_context.dispatch_time
+    if call_context.received_time is not None:
+        # the whole round trip less the time the server spent running the batch
+        phases["transfer"] = call_context.received_time - call_context.serialized_time \
+            - call_context.batch_remote_time
+        phases["remote"] = call_context.remote_time
+    if call_context.deserialized_time is not None:
+        phases["deserialize"] = call_context.deserialized_time - call_context.received_time
+    phases["total"] = call_context.completion_time - call_context.enqueue_time
+    return phases
+
+class LatencyStatsSingleton(object):
+    """ the singleton class for LatencyStats """
+
+    instance = None
+    lock = threading.Lock()
+
+    def __new__(cls, config):
+        """ stats instance creation """
+        with LatencyStatsSingleton.lock:
+            if not LatencyStatsSingleton.instance:
+                LatencyStatsSingleton.instance = LatencyStatsSingleton.LatencyStats(\
+                    config.stats_file)
+        return LatencyStatsSingleton.instance
+
+    def __getattr__(self, name):
+        return getattr(self.instance, name)
+
+    def __setattr__(self, name, val):
+        return setattr(self.instance, name, val)
+
+    class LatencyStats(object):
+        """ per function latency histograms of every phase, calls are appended to
+            the stats_file as JSON lines if one is configured """
+
+        def __init__(self, stats_file):
+            self._logger = logging.getLogger("client")
+            self._lock = threading.Lock()
+            self._histograms = {} # func_key -> {phase: LatencyHistogram}
+            self._stream = open(stats_file, "a", encoding="utf-8") if stats_file else None
+
+        def record(self, call_context, succeeded):
+            """ record the phases of a completed call """
+            phases = call_phases(call_context)
+            with self._lock:
+                histograms = self._histograms.setdefault(call_context.func_key, \
+                    dict((phase, LatencyHistogram()) for phase in PHASES))
+                for phase, duration in phases.items():
+                    histograms[phase].record(duration)
+                if self._stream:
+                    line = {"func_key": call_context.func_key, "succeeded": succeeded, \
+                            "enqueue_time": call_context.enqueue_time}
+                    line.update(phases)
+                    self._stream.write(json.dumps(line) + "\n")
+
+        def summary(self):
+            """ the summaries of the histograms of every function and phase """
+            with self._lock:
+                return dict((func_key, dict((phase, histogram.summary()) \
+                                            for phase, histogram in histograms.items())) \
+                            for func_key, histograms in self._histograms.items())
+
+        def flush(self):
+            """ write out the buffered JSON lines """
+            with self._lock:
+                if self._stream:
+                    self._stream.flush()
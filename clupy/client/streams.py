@@ -0,0 +1,195 @@
+""" client side iteration over the items streamed by remote generator functions """
+import asyncio
+import collections
+import threading
+import time
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError
+from tornado import gen
+from ..utils import wire
+
+class RemoteResultStream(object):
+    """ the items yielded by a call of a remote generator function, in the order
+        they were yielded, iterable from any thread and from asyncio code
+
+        The server sends the items in chunks and pauses the generator once it sent
+        as many chunks as the client granted credit for, the stream grants one
+        more chunk whenever the consumer takes a chunk out of the buffer, so that
+        at most window chunks are buffered on the client.
+    """
+
+    def __init__(self):
+        self.stream_id = None
+        self._condition = threading.Condition()
+        self._reader = wire.MessageReader()
+        self._chunks = collections.deque()
+        self._items = iter(())
+        self._finished = False
+        self._failure = None
+        self._grant = None
+        self._async_waiters = []
+
+    def start(self, stream_id, grant):
+        """ called by the worker before posting the call, grant(count) sends credit
+            to the server, a negative count cancels the stream """
+        self.stream_id = stream_id
+        self._grant = grant
+
+    def data_received(self, data):
+        """ the streaming_callback of the request, called by the worker """
+        for kind, value in self._reader.feed(data):
+            with self._condition:
+                if kind == "items":
+                    self._chunks.append(value)
+                else:
+                    self._finished = True
+                    self._failure = value if kind == "error" else None
+            self._notify()
+
+    def finish(self, failure=None):
+        """ called by the worker once the call completed, a stream that did not
+            receive its end message fails with the failure of the call """
+        with self._condition:
+            if self._finished:
+                return
+            self._finished = True
+            self._failure = failure if failure is not None \
+                else RuntimeError("the stream ended prematurely")
+        self._notify()
+
+    @property
+    def failure(self):
+        """ the exception the stream ended with, None if it is still running or succeeded """
+        return self._failure
+
+    def close(self):
+        """ stop consuming, the server stops the generator """
+        with self._condition:
+            finished = self._finished
+            self._finished = True
+            self._chunks.clear()
+            self._items = iter(())
+        if not finished and self._grant is not None:
+            self._grant(-1)
+        self._notify()
+
+    def _notify(self):
+        """ wake up the blocked consumers """
+        with self._condition:
+            self._condition.notify_all()
+            waiters = self._async_waiters
+            self._async_waiters = []
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(lambda fut=waiter: fut.done() or fut.set_result(None))
+
+    def _next_chunk(self):
+        """ take the next chunk out of the buffer, None if none has arrived yet,
+            raise StopIteration or the failure once the stream is over """
+        with self._condition:
+            if self._chunks:
+                chunk = self._chunks.popleft()
+            elif self._finished:
+                if self._failure is not None:
+                    raise self._failure
+                raise StopIteration
+            else:
+                return None
+        self._grant(1)
+        return chunk
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while True:
+            for item in self._items:
+                return item
+            with self._condition:
+                while not self._chunks and not self._finished:
+                    self._condition.wait()
+            chunk = self._next_chunk()
+            if chunk is not None:
+                self._items = iter(chunk)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while True:
+            for item in self._items:
+                return item
+            try:
+                chunk = self._next_chunk()
+            except StopIteration as err:
+                raise StopAsyncIteration from err
+            if chunk is not None:
+                self._items = iter(chunk)
+                continue
+            loop = asyncio.get_event_loop()
+            waiter = loop.create_future()
+            with self._condition:
+                if self._chunks or self._finished:
+                    continue
+                self._async_waiters.append((loop, waiter))
+            await waiter
+
+class StreamRequestsMixin(object):
+    """ the part of the RemoteExecutionWorker posting the calls of generator
+        functions and granting their streams credit """
+
+    def start_stream(self, stream, server_url):
+        """ assign the stream an id and let it send credit to the server,
+            return the stream options of the request """
+        stream_id = self.client_id + "-" + str(next(self._stream_ids))
+        stream.start(stream_id, lambda count: self.io_loop.add_callback(\
+            self.grant_stream_credit, server_url, stream_id, count))
+        return {
+            "stream_id": stream_id,
+            "window": self._config.stream_window,
+            "chunk_items": self._config.stream_chunk_items,
+            "chunk_time": self._config.batch_target_time / 1000.0,
+        }
+
+    @gen.coroutine
+    def post_stream(self, server_entry, request_url, chunks, stats, timing, headers, \
+                    stream):
+        """ post the call of a generator function, the response body is fed to
+            the stream as it arrives, return the digests of the content the
+            server misses, None once the stream completed """
+        request = self.frame_request(server_entry, request_url, "POST", chunks, stats)
+        request.headers.update(headers)
+        status_lines = []
+        rejected = []
+        def header_line(line):
+            """ keep the status line """
+            if not status_lines:
+                status_lines.append(line)
+        def data_received(data):
+            """ only successful responses carry stream messages """
+            if status_lines[0].split(" ")[1] == "200":
+                stream.data_received(data)
+            else:
+                rejected.append(data)
+        request.header_callback = header_line
+        request.streaming_callback = data_received
+        try:
+            response = yield AsyncHTTPClient().fetch(request)
+        except HTTPClientError as err:
+            if err.response is not None:
+                server_entry.record_load(err.response.headers, err.code == 503)
+            if err.code != 409:
+                raise
+            return wire.decode_frame(b"".join(rejected))
+        server_entry.record_load(response.headers)
+        stream.finish()
+        timing["received"] = timing["deserialized"] = time.time()
+        return None
+
+    @gen.coroutine
+    def grant_stream_credit(self, server_url, stream_id, count):
+        """ tell the server the consumer took count chunks, -1 cancels the stream """
+        try:
+            yield AsyncHTTPClient().fetch(server_url + "/credit/" + stream_id + "/" \
+                + str(count), method="POST", body=b"")
+        except Exception as err: # pylint: disable=W0703
+            self._logger.info("granting credit to stream %s failed: %s", \
+                stream_id, str(err))
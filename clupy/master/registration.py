@@ -1,6 +1,9 @@
 """ clupy server node registration handling """
 from __future__ import print_function
+from collections import OrderedDict
 from datetime import datetime, timedelta
+import heapq
+import itertools
 import logging
 from urllib.parse import urlparse # pylint: disable=E0611, E0401
 import pickle
@@ -17,6 +20,72 @@ class ServerRegistrationInfo(object):
         self.reservation_time = None # first reservation time by a client
         self.last_reservation_time = None # first reservation time by a client
         self.client_id = None # id of the client that is owning the server
+        # the resources reported with the latest heartbeat
+        self.cores = 1
+        self.workers = 1 # the worker processes running calls
+        self.free_memory = None # bytes, None if unknown
+        self.load_average = 0.0
+        self.run_queue = 0 # requests waiting for an idle worker
+
+    def update_resources(self, resources):
+        """ take in the resources reported by a heartbeat, a dictionary of strings,
+            the resources missing from it are left as they were """
+        try:
+            self.cores = int(resources.get("cores", self.cores))
+            self.workers = int(resources.get("workers", self.workers))
+            self.free_memory = int(resources["free_memory"]) if "free_memory" in resources \
+                else self.free_memory
+            self.load_average = float(resources.get("load_average", self.load_average))
+            self.run_queue = int(resources.get("run_queue", self.run_queue))
+        except ValueError:
+            logging.getLogger('master').warning("malformed resource report: %s", str(resources))
+
+    def capacity(self):
+        """ the spare cores of the server, the cores it runs calls on that are not
+            busy by its load average nor claimed by the requests in its run queue """
+        return max(min(self.cores, self.workers) - self.load_average - self.run_queue, 0.0)
+
+    def rank(self, min_free_memory):
+        """ the allocation order of the server, higher first, servers short of
+            memory come last, then the ones with the most spare cores """
+        memory_ok = self.free_memory is None or self.free_memory >= min_free_memory
+        return (memory_ok, self.capacity(), self.cores)
+
+class RankIndex(object):
+    """ the servers of a pool ordered by their allocation rank, a heap whose entries
+        are invalidated rather than removed when a server leaves the pool or its rank
+        changes, adding, discarding and popping are O(log n) amortized """
+
+    def __init__(self):
+        self._heap = []
+        self._entries = {} # url -> the valid heap entry of the server
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, url, rank):
+        """ add a server, or update its rank """
+        # ranks are ordered higher first, the heap pops its smallest entry
+        entry = (tuple(-field for field in rank), next(self._counter), url)
+        self._entries[url] = entry
+        heapq.heappush(self._heap, entry)
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = list(self._entries.values())
+            heapq.heapify(self._heap)
+
+    def discard(self, url):
+        """ remove a server if it is in the pool """
+        self._entries.pop(url, None)
+
+    def pop(self):
+        """ remove and return the server of the highest rank, None if empty """
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            if self._entries.get(entry[2]) is entry:
+                del self._entries[entry[2]]
+                return entry[2]
+        return None
 
 class ServerRegistrationServiceSingleton(object):
     """ the singleton server registration service class """
@@ -37,25 +106,76 @@ class ServerRegistrationServiceSingleton(object):
         return setattr(self.instance, name, val)
 
     class ServerRegistrationService(object):
-        """ the real server registration service class """
+        """ the real server registration service class, the registrations are indexed
+            so that allocating, renewing and releasing k servers costs O(k log n):
+            the free and the leased servers are kept in a RankIndex each, and the
+            registrations and the leases in the order of their last heartbeat and
+            renewal, so that the expired ones are found at the front """
         def __init__(self, config):
             """ pass in and save the server configuration object """
             self._config = config
             self._registrations = {}
+            self._heartbeats = OrderedDict() # url -> None, the least recently updated first
+            self._leases = OrderedDict() # url -> None, the least recently renewed first
+            self._free = RankIndex() # the servers not leased
+            self._busy = RankIndex() # the leased servers, shared when too few are free
+            self._owned = {} # client id -> the urls of the servers it leased
+            self._min_free_memory = config.min_free_memory * (1 << 20)
             self._logger = logging.getLogger('master')
 
-        def register_server(self, server_url):
-            """ server node registration/update """
+        def register_server(self, server_url, resources=None):
+            """ server node registration/update, resources are the ones the node
+                reported with its heartbeat """
             self._logger.info("to register: %s", server_url)
             if not server_url in self._registrations.keys():
                 self._registrations[server_url] = ServerRegistrationInfo()
+                self._heartbeats[server_url] = None
             else:
                 self._registrations[server_url].updating_time = datetime.now()
+                self._heartbeats.move_to_end(server_url)
+            if resources:
+                self._registrations[server_url].update_resources(resources)
+            self.index_server(server_url)
 
         def unregister_server(self, server_url):
             """ server node unregistration """
             self._logger.info("to unregister: %s", server_url)
-            del self._registrations[server_url]
+            srv_obj = self._registrations.pop(server_url)
+            del self._heartbeats[server_url]
+            self._leases.pop(server_url, None)
+            self._free.discard(server_url)
+            self._busy.discard(server_url)
+            self.disown(srv_obj.client_id, server_url)
+
+        def index_server(self, server_url):
+            """ (re)insert a server into the pool it belongs to with its current rank """
+            rank = self._registrations[server_url].rank(self._min_free_memory)
+            if server_url in self._leases:
+                self._free.discard(server_url)
+                self._busy.add(server_url, rank)
+            else:
+                self._busy.discard(server_url)
+                self._free.add(server_url, rank)
+
+        def disown(self, client_id, server_url):
+            """ remove a server from the ones leased by a client """
+            owned = self._owned.get(client_id)
+            if owned is not None:
+                owned.discard(server_url)
+                if not owned:
+                    del self._owned[client_id]
+
+        def expire_leases(self, now):
+            """ return the servers whose leases were not renewed within reservation_ttl
+                to the free pool, their last holder may still renew them until they are
+                allocated again """
+            expiration = now - timedelta(seconds=self._config.reservation_ttl)
+            while self._leases:
+                server_url = next(iter(self._leases))
+                if self._registrations[server_url].last_reservation_time >= expiration:
+                    break
+                del self._leases[server_url]
+                self.index_server(server_url)
 
         def maintain_servers(self):
             """ server registration maintenance method
@@ -64,72 +184,98 @@ class ServerRegistrationServiceSingleton(object):
             now = datetime.now()
             delta = timedelta(seconds=self._config.registration_ttl)
             expiration = now - delta
-            keys_to_remove = []
-            for k, val in self._registrations.items():
-                if val.updating_time < expiration:
-                    keys_to_remove.append(k)
-            for k in keys_to_remove:
-                logging.info("removing server %s from registration", k)
-                del self._registrations[k]
+            while self._heartbeats:
+                server_url = next(iter(self._heartbeats))
+                if self._registrations[server_url].updating_time >= expiration:
+                    break
+                self._logger.info("removing server %s from registration", server_url)
+                self.unregister_server(server_url)
+            self.expire_leases(now)
 
         def allocate_server_resources(self, client_id, request_server_count):
-            """ server computing resource allocation requests,
-            for now, we only pass the server count, in the future,
-            we will need to support a lot more information """
+            """ server computing resource allocation requests, the free servers with
+            the most spare capacity are leased to the client, returns the list of
+            (server url, capacity weight) pairs, the weight being the server's spare
+            cores as of its last heartbeat """
 
             now = datetime.now()
-            delta = timedelta(seconds=self._config.reservation_ttl)
-            expiration = now - delta
-            return_server_list = []
             if request_server_count == 0:
                 request_server_count = self._config.default_server_request_count
             if request_server_count > len(self._registrations):
                 self._logger.error("requested server count %d exceeds total registration %d", \
                     request_server_count, len(self._registrations))
                 return -1, ''
-            for k, val in self._registrations.items():
-                if val.client_id is None or val.last_reservation_time < expiration:
-                    return_server_list.append(k)
-                    if len(return_server_list) >= request_server_count:
-                        break
+            self.expire_leases(now)
+            return_server_list = []
+            shared_list = []
+            while len(return_server_list) < request_server_count and len(self._free) > 0:
+                return_server_list.append(self._free.pop())
             if len(return_server_list) < request_server_count:
                 self._logger.info("only have %d free servers, requesting %d, trying to add busy servers", \
                                     len(return_server_list), request_server_count)
-                for k, val in self._registrations.items():
-                    if k not in return_server_list:
-                        return_server_list.append(k)
-                    if len(return_server_list) >= request_server_count:
-                        break
+                # busy servers are shared, their leases stay with the clients holding them,
+                # they are popped for their ranks and put back
+                while len(return_server_list) + len(shared_list) < request_server_count \
+                        and len(self._busy) > 0:
+                    shared_list.append(self._busy.pop())
+                for server in shared_list:
+                    self.index_server(server)
             for server in return_server_list:
                 srv_obj = self._registrations[server]
+                self.disown(srv_obj.client_id, server)
                 srv_obj.reservation_time = now
                 srv_obj.last_reservation_time = now
                 srv_obj.client_id = client_id
-            self._logger.info("returned server list: %s", pprint.pformat(return_server_list))
-            return 0, return_server_list
+                self._owned.setdefault(client_id, set()).add(server)
+                self._leases[server] = None
+                self._leases.move_to_end(server)
+                self.index_server(server)
+            return_server_list.extend(shared_list)
+            self._logger.info("allocated %d servers to %s", len(return_server_list), client_id)
+            if self._logger.isEnabledFor(logging.DEBUG):
+                self._logger.debug("returned server list: %s", pprint.pformat(return_server_list))
+            return 0, [(server, self._registrations[server].capacity()) \
+                       for server in return_server_list]
 
         def retain_server_resources(self, client_id, server_list, to_free=False):
-            """ retain onwership of a set of servers """
+            """ retain onwership of a set of servers, only the servers leased to the
+            client are renewed or released, returns the servers it still holds """
 
             now = datetime.now()
+            held_list = []
             for server in server_list:
                 if server in self._registrations.keys():
                     srv_obj = self._registrations[server]
-                    if to_free:
+                    if srv_obj.client_id != client_id:
+                        self._logger.info("client %s does not hold the server: %s", client_id, server)
+                    elif to_free:
                         self._logger.info("client %s is releasing the server: %s", client_id, server)
                         srv_obj.client_id = None
+                        self.disown(client_id, server)
+                        self._leases.pop(server, None)
+                        self.index_server(server)
                     else:
                         self._logger.info("client %s retained service of the server: %s", client_id, server)
                         srv_obj.last_reservation_time = now
+                        self._leases[server] = None
+                        self._leases.move_to_end(server)
+                        self.index_server(server)
+                        held_list.append(server)
+            return held_list
 
         def query_master_info(self):
-            """ return the server usage information """
-            self._logger.info("-----master server info start------")
-            for k, val in self._registrations.items():
-                self._logger.info("%s: reg - %s, upd - %s, lrsv - %s, cid - %s", k, \
-                    str(val.registration_time), str(val.updating_time), \
-                    str(val.last_reservation_time), str(val.client_id))
-            self._logger.info("-----master server info end------")
+            """ return the server usage information, the servers are listed one by one
+                in the log at debug level only """
+            self._logger.info("master server info: %d registered, %d leased to %d clients, " \
+                "%d free", len(self._registrations), len(self._leases), len(self._owned), \
+                len(self._free))
+            if self._logger.isEnabledFor(logging.DEBUG):
+                for k, val in self._registrations.items():
+                    self._logger.debug("%s: reg - %s, upd - %s, lrsv - %s, cid - %s, cores - %d, " \
+                        "load - %.2f, queue - %d, mem - %s", k, \
+                        str(val.registration_time), str(val.updating_time), \
+                        str(val.last_reservation_time), str(val.client_id), val.cores, \
+                        val.load_average, val.run_queue, str(val.free_memory))
             return self._registrations
 
 class MasterHandler(tornado.web.RequestHandler):
@@ -143,11 +289,14 @@ class MasterHandler(tornado.web.RequestHandler):
 class RegistrationHandler(MasterHandler):
     """ the registration handler for /register """
     def get(self, server_url):
-        """ the get request handler """
+        """ the get request handler, the query arguments are the resources of the
+        server node: cores, workers, free_memory, load_average and run_queue """
         server_url = urlparse(server_url).geturl()
         self._logger.info("handling registration request for %s", server_url)
 
-        self._service.register_server(server_url)
+        resources = dict((name, self.get_argument(name)) \
+                         for name in self.request.query_arguments)
+        self._service.register_server(server_url, resources)
         response = "{} successfully registered".format(server_url)
         self._logger.info(response)
         self.write(response)
@@ -193,13 +342,18 @@ class AllocServerResourcesHandler(MasterHandler):
 
 class RetainServerResourcesHandler(MasterHandler):
     """ handler for retaining server resources requested earlier """
-    def get(self, client_id, to_free):
-        """ the get request handler """
-        #server_list = self.get_body_argument("data", default=None, strip=False)
-        #server_list = pickle.loads(server_list)
-        server_list = ['server1']
+    def post(self, client_id, to_free):
+        """ the post request handler, the body is the pickled list of server urls """
+        try:
+            server_list = pickle.loads(self.request.body)
+        except Exception: # pylint: disable=W0703
+            server_list = None
+        if not isinstance(server_list, list):
+            self.set_status(400)
+            self.write("the body must be a pickled list of server urls")
+            return
         self._logger.info("handling resource retaining request for %s, to_free: %s, servers: %s", \
             client_id, str(to_free), pprint.pformat(server_list))
         to_free = True if int(to_free) != 0 else False
-        self._service.retain_server_resources(client_id, server_list, to_free)
-        self.write("server resources retained")
\ No newline at end of file
+        held_list = self._service.retain_server_resources(client_id, server_list, to_free)
+        self.write(pickle.dumps(held_list))
\ No newline at end of file
@@ -4,8 +4,15 @@ import logging
 import signal
 import tornado.ioloop
 import tornado.web
+from tornado.httpclient import AsyncHTTPClient
+from tornado.ioloop import PeriodicCallback
 from .registration import ServerNodeRegistrationSingleton
+from .execution import ServerExecutionServiceSingleton
 from .execution import CreateSandboxHandler, ExecuteFunctionHandler
+from .execution import QueryBlobsHandler, UploadBlobHandler
+from .execution import StreamFunctionHandler, StreamCreditHandler, ActorHandler
+from .execution import PublishServiceHandler
+from .spool import SpoolHandler
 
 class Health(tornado.web.RequestHandler):
     """master server health"""
@@ -13,11 +20,12 @@ class Health(tornado.web.RequestHandler):
         """check health of the server"""
         self.write("iamok")
 
-def on_shutdown(register_service):
+def on_shutdown(register_service, execution_service):
     """ called when user pressed ctrl + C """
     logger = logging.getLogger('server')
     logger.info("server node is shutting down")
     register_service.stop_registration()
+    execution_service.stop()
     tornado.ioloop.IOLoop.current().stop()
 
 def run_server(args):
@@ -40,20 +48,36 @@ def run_server(args):
         (r"/health", Health),
         (r"/exec/create/(.*)/(.*)", CreateSandboxHandler, dict(config=server_config)),
         (r"/exec/run/(.*)", ExecuteFunctionHandler, dict(config=server_config)),
+        (r"/exec/stream/(.*)", StreamFunctionHandler, dict(config=server_config)),
+        (r"/exec/actor/(.*)", ActorHandler, dict(config=server_config)),
+        (r"/exec/publish/(.*)", PublishServiceHandler, dict(config=server_config)),
+        (r"/exec/spool/(.*)", SpoolHandler, dict(path=server_config.spool_dir)), # pylint: disable=E1101
+        (r"/exec/credit/(.*)/(-?[0-9]+)", StreamCreditHandler, dict(config=server_config)),
+        (r"/exec/blobs", QueryBlobsHandler, dict(config=server_config)),
+        (r"/exec/blob/(.*)", UploadBlobHandler, dict(config=server_config)),
+        (r"/exec/modules", QueryBlobsHandler, dict(config=server_config, store="code_cache")),
+        (r"/exec/module/(.*)", UploadBlobHandler, dict(config=server_config, store="code_cache")),
     ])
+    # server nodes fetch partial results of reductions from each other
+    AsyncHTTPClient.configure(None, max_body_size=server_config.max_body_size) # pylint: disable=E1101
     sockets = tornado.netutil.bind_sockets(server_config.port) # pylint: disable=E1101
-    server = tornado.httpserver.HTTPServer(application)
+    server = tornado.httpserver.HTTPServer(application, \
+                max_body_size=server_config.max_body_size) # pylint: disable=E1101
     server.add_sockets(sockets)
     for sock in sockets:
         server_config.config['port'] = sock.getsockname()[1]
         break
     logger.info('Starting server node at port %d', server_config.port) # pylint: disable=E1101
 
+    # start the worker processes before taking any request
+    execution_service = ServerExecutionServiceSingleton(server_config)
     register_service = ServerNodeRegistrationSingleton(server_config)
     register_service.start_registration()
+    spool_expiry = PeriodicCallback(execution_service.spool.expire, 60000)
+    spool_expiry.start()
 
     signal.signal(signal.SIGINT, \
         lambda sig, frame: tornado.ioloop.IOLoop.current().add_callback_from_signal(\
-            on_shutdown, register_service))
+            on_shutdown, register_service, execution_service))
     tornado.ioloop.IOLoop.current().start()
 
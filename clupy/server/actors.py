@@ -0,0 +1,55 @@
+""" server side ordering of the calls of the actors living on this node """
+from tornado import gen, locks
+
+class ServerActor(object):
+    """ an actor living in a worker process, the batches of its calls run one at
+        a time in the order of their sequence numbers, whatever order the
+        requests carrying them arrive in """
+
+    def __init__(self, worker):
+        self.worker = worker # the WorkerProcess the instance lives in
+        self.next_seq = 0
+        self.destroyed = False
+        self._condition = locks.Condition()
+
+    @gen.coroutine
+    def wait_turn(self, seq):
+        """ wait until the calls before seq ran or the actor is destroyed """
+        while self.next_seq != seq and not self.destroyed:
+            yield self._condition.wait()
+
+    def advance(self, count):
+        """ count calls ran, let the next batch run """
+        self.next_seq = self.next_seq + count
+        self._condition.notify_all()
+
+    def destroy(self):
+        """ fail the batches still waiting for their turn """
+        self.destroyed = True
+        self._condition.notify_all()
+
+class ActorRegistry(object):
+    """ the actors living on this node by their ids, an actor is pinned to the
+        worker process with the fewest actors when its first request arrives """
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._actors = {}
+        self._destroyed = set() # the ids of the destroyed actors, their late calls fail
+
+    def get(self, actor_id):
+        """ the actor with the given id, created on first use, None if it was destroyed """
+        if actor_id in self._destroyed:
+            return None
+        if actor_id not in self._actors:
+            self._actors[actor_id] = ServerActor(self._pool.pin())
+        return self._actors[actor_id]
+
+    def remove(self, actor_id):
+        """ forget a destroyed actor, return it, None if there is no such actor """
+        self._destroyed.add(actor_id)
+        actor = self._actors.pop(actor_id, None)
+        if actor is not None:
+            actor.destroy()
+            self._pool.unpin(actor.worker)
+        return actor
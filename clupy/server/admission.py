@@ -0,0 +1,38 @@
+""" server side admission control of the calls posted to a node """
+
+class AdmissionControl(object):
+    """ bounds the number of requests running calls on this node, one per worker
+        process runs while at most queue_depth more wait for an idle worker,
+        further requests are turned away until the node caught up, so that a
+        burst queues up on the clients rather than in the node's memory
+    """
+
+    def __init__(self, workers, queue_depth, retry_after):
+        self.workers = workers
+        self.capacity = workers + queue_depth
+        self.retry_after = retry_after # seconds a turned away client waits
+        self.admitted = 0
+
+    def admit(self):
+        """ take in a request if the run queue has room, it must leave afterwards """
+        if self.admitted >= self.capacity:
+            return False
+        self.admitted = self.admitted + 1
+        return True
+
+    def leave(self):
+        """ an admitted request is done """
+        self.admitted = self.admitted - 1
+
+    def queued(self):
+        """ the number of admitted requests waiting for an idle worker """
+        return max(self.admitted - self.workers, 0)
+
+    def load(self):
+        """ the load hint, the admitted requests per worker process, above 1 once
+            requests wait for an idle worker """
+        return float(self.admitted) / self.workers
+
+    def load_header(self):
+        """ the value of the load header """
+        return "{:.3f}".format(self.load())
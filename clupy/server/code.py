@@ -0,0 +1,104 @@
+""" server side content addressed store for the source modules shipped by clients """
+import contextlib
+import importlib.abc
+import importlib.util
+import logging
+import os
+import sys
+from ..utils import wire
+
+class CodeFinder(importlib.abc.MetaPathFinder):
+    """ finds the modules of the manifest being activated in the code cache """
+
+    def __init__(self, code_cache):
+        self._code_cache = code_cache
+
+    def find_spec(self, fullname, path, target=None): # pylint: disable=W0613
+        """ the spec loading the cached source of a module of the active manifest """
+        entry = self._code_cache.active.get(fullname)
+        if entry is None:
+            return None
+        digest, package = entry
+        return importlib.util.spec_from_file_location(fullname, \
+            self._code_cache.path(digest), submodule_search_locations=[] if package else None)
+
+class CodeCache(object):
+    """ source files kept in cache_dir by content digest, along with the modules
+        every sandbox imported from them
+
+        A manifest maps module names to [digest, is package]. While a manifest is
+        activated for a sandbox, its modules are imported from the cached sources,
+        and the modules the sandbox imported earlier for the same manifest are
+        reused, sys.modules is restored afterwards so that sandboxes running
+        different versions of a module do not see each other's modules.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.active = {}
+        self._sandboxes = {} # sandbox id -> (manifest, {module name: module})
+        self._logger = logging.getLogger("server")
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        self._digests = set(os.path.splitext(entry)[0] for entry in os.listdir(cache_dir) \
+                            if entry.endswith(".py"))
+        sys.meta_path.insert(0, CodeFinder(self))
+
+    def __contains__(self, digest):
+        return digest in self._digests
+
+    def path(self, digest):
+        """ the path of the cached source with the given digest """
+        return os.path.join(self.cache_dir, digest + ".py")
+
+    def missing(self, digests):
+        """ the digests among the given ones that are not cached """
+        return [digest for digest in digests if digest not in self._digests]
+
+    def put(self, digest, source):
+        """ store an uploaded source """
+        if wire.digest_chunks([source]) != digest:
+            raise ValueError("source content does not match digest {}".format(digest))
+        if digest in self._digests:
+            return
+        # write to a temporary file first so that importers never see partial sources
+        temp_path = self.path(digest) + ".tmp"
+        with open(temp_path, "wb") as stream:
+            stream.write(source)
+        os.rename(temp_path, self.path(digest))
+        self._digests.add(digest)
+        self._logger.info("cached source %s", digest)
+
+    def unresolved(self, manifest):
+        """ the digests of the manifest that are not cached """
+        return self.missing(set(entry[0] for entry in manifest.values()))
+
+    @contextlib.contextmanager
+    def activated(self, sandbox_id, manifest):
+        """ import the modules of the manifest from the code cache within the block,
+            the framework's modules are never taken from a manifest, the sandbox
+            keeps decoding and encoding frames with the classes of the server's own """
+        manifest = dict((name, entry) for name, entry in manifest.items() \
+                        if not wire.is_framework_module(name))
+        previous, modules = self._sandboxes.get(sandbox_id, (None, {}))
+        if previous != manifest:
+            # a changed module invalidates the modules importing it as well
+            modules = {}
+        saved = {}
+        for name in manifest:
+            saved[name] = sys.modules.pop(name, None)
+            if name in modules:
+                sys.modules[name] = modules[name]
+        self.active = manifest
+        try:
+            yield
+        finally:
+            self.active = {}
+            modules = {}
+            for name in manifest:
+                module = sys.modules.pop(name, None)
+                if module is not None:
+                    modules[name] = module
+                if saved[name] is not None:
+                    sys.modules[name] = saved[name]
+            self._sandboxes[sandbox_id] = (manifest, modules)
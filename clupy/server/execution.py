@@ -1,11 +1,20 @@
 """ server side remote execution support """
 from __future__ import print_function
+import json
 import logging
-import pickle
-import base64
-import inspect
 import tornado.web
-from tornado.httpclient import AsyncHTTPClient, HTTPClient, HTTPError
+from tornado import gen
+from tornado.httpclient import AsyncHTTPClient
+from ..utils import wire, compression
+from .actors import ActorRegistry
+from .admission import AdmissionControl
+from .code import CodeCache
+from .objects import ObjectStore
+from .pool import WorkerPool
+from .reductions import ReductionStore
+from .services import ServiceRegistry, installed
+from .spool import ResultSpool
+from .streams import StreamRegistry
 
 class ServerExecutionServiceSingleton(object):
     """ the singleton class for ServerExecutionService """
@@ -26,45 +35,35 @@ class ServerExecutionServiceSingleton(object):
         return setattr(self.instance, name, val)
 
     class ServerExecutionService(object):
-        """ the management class for server node registrations with the master nodes """
+        """ the management class for server node registrations with the master nodes,
+            the remote functions run in the processes of the worker pool """
 
         def __init__(self, config):
             self._config = config
             self._logger = logging.getLogger("server")
+            self.objects = ObjectStore(config.object_store_size)
+            self.code_cache = CodeCache(config.code_cache_dir)
+            self.streams = StreamRegistry()
+            self.reductions = ReductionStore(self.objects)
+            self.spool = ResultSpool(config.spool_dir, config.spool_threshold, config.spool_ttl)
+            self.pool = WorkerPool(config.worker_processes, config.code_cache_dir, \
+                config.worker_max_tasks, config.worker_max_memory * (1 << 20), self.spool)
+            self.actors = ActorRegistry(self.pool)
+            self.admission = AdmissionControl(config.worker_processes, \
+                config.run_queue_depth, config.retry_after)
+            self.services = ServiceRegistry(self.pool)
 
         def create_sand_box(self, client_id, execution_id):
             """ to create a sand box execution environment for client """
             self._logger.info("to create sandbox for (%s), execution (%s)", client_id, execution_id)
             return client_id + "_" + execution_id
 
-        def get_module_import_name(self, file_name):
-            """ based on the script file uploading implementation and sandbox
-                organization, return a module name for importing
-                The current hack is simply return the file name part
-            """
-            module_name = file_name[file_name.rfind('/')+1:]
-            module_name = module_name[:module_name.rfind('.')]
-            return module_name
-
-        def execute_code(self, sandbox_id, file_name, func_name, input_data):
-            """ execute specified function with the given input_datq """
-            self._logger.info("excute: %s:%s", file_name, func_name)
-            module_name = self.get_module_import_name(file_name)
-            module = __import__(module_name)
-            func = getattr(module, func_name)
-            argspec = inspect.getargspec(func)
-            all_args = []
-            if argspec.args:
-                for arg in argspec.args:
-                    all_args.append(input_data[arg])
-            if argspec.varargs:
-                for arg in argspec.varargs:
-                    all_args.append(input_data[arg])
-            all_kwargs = {}
-            if argspec.keywords:
-                for arg in argspec.keywords:
-                    all_kwargs[arg] = input_data[arg]
-            return func(*all_args, **all_kwargs)
+        def stop(self):
+            """ stop the services, the worker processes and remove the shared memory
+                of the objects """
+            self.services.stop()
+            self.pool.stop()
+            self.objects.stop()
 
 class CreateSandboxHandler(tornado.web.RequestHandler):
     """ handler for create sand box """
@@ -76,6 +75,11 @@ class CreateSandboxHandler(tornado.web.RequestHandler):
     def get(self, client_id, execution_id):
         """ the routine for creating sandbox and return the id """
         execution_service = ServerExecutionServiceSingleton(self._config)
+        # advertise how many calls this node is prepared to run concurrently
+        self.set_header("X-CluPy-Slots", str(self._config.execution_slots))
+        self.set_header(compression.ACCEPT_HEADER, compression.accept_header_value())
+        self.set_header(wire.LOAD_HEADER, execution_service.admission.load_header())
+        self.set_header(wire.CAPACITY_HEADER, str(execution_service.admission.capacity))
         self.write(execution_service.create_sand_box(client_id, execution_id))
 
 class ExecuteFunctionHandler(tornado.web.RequestHandler):
@@ -85,16 +89,373 @@ class ExecuteFunctionHandler(tornado.web.RequestHandler):
         """ handler initialization, called for each request """
         self._config = config # pylint: disable=W0201
 
+    @gen.coroutine
     def post(self, sandbox_id):
-        """ the real handler for remote function execution """
+        """ the real handler for remote function execution, the request carries the
+            meta data of a batch of calls to the same function and the frame of their
+            arguments, a frame with a list of (succeeded, value) pairs, one per call,
+            is written back, the modules header lists the digests of the source
+            modules to import the function from
+            The op of the request tells what to do with the calls:
+            call: return the result of every call
+            map_reduce: reduce the results into the node's partial result of the reduction
+            merge: reduce the partial result of the peer node into this node's one
+            take: return the partial result as a single (succeeded, value) pair
+            discard: forget the partial result
+            The calls run in a process of the worker pool, the IOLoop only passes
+            the undecoded frames and the references of the stored objects on
+            Calls are turned away with 503 while the node's run queue is full,
+            every response carries the node's load hint
+        """
         execution_service = ServerExecutionServiceSingleton(self._config)
-        file_name = self.get_body_argument("file_name", default=None, strip=False)
-        func_name = self.get_body_argument("func_name", default=None, strip=False)
-        print('from client:', file_name, func_name)
-        input_data = pickle.loads(base64.standard_b64decode(\
-                self.get_body_argument("input_data", default="", strip=False)))
-        output_data = execution_service.execute_code(sandbox_id, file_name, func_name, input_data)
-        if not output_data is None:
-            self.write(base64.standard_b64encode(pickle.dumps(output_data)))
+        manifest = json.loads(self.request.headers.get(wire.MODULES_HEADER, "{}"))
+        missing = execution_service.code_cache.unresolved(manifest)
+        if missing:
+            self.write_missing(missing)
+            return
+        meta, payload = self.read_request()
+        op = meta.get("op", "call")
+        if op in ("call", "map_reduce"):
+            admission = execution_service.admission
+            if not admission.admit():
+                self.write_busy(admission)
+                return
+            try:
+                missing = execution_service.objects.missing(meta["blobs"])
+                if missing:
+                    self.write_missing(missing)
+                    return
+                objects = execution_service.objects.acquire(meta["blobs"])
+                try:
+                    outcomes, exec_times, partial = yield execution_service.pool.run(("calls", \
+                        sandbox_id, manifest, meta, payload, objects))
+                finally:
+                    execution_service.objects.release(meta["blobs"])
+                if partial is not None:
+                    yield self.reduce_partial(execution_service, sandbox_id, manifest, meta, \
+                                              partial)
+            finally:
+                admission.leave()
+            self.set_header(wire.EXEC_TIME_HEADER, \
+                            ",".join("{:.6f}".format(seconds) for seconds in exec_times))
+        elif op == "merge":
+            peer_partial = yield self.take_peer_partial(meta["peer"], meta["reduction_id"])
+            yield self.reduce_partial(execution_service, sandbox_id, manifest, meta, peer_partial)
+            outcomes = b"".join(wire.encode_frame((True, None)))
+        elif op == "take":
+            try:
+                digest = execution_service.reductions.take(meta["reduction_id"])
+                outcomes = execution_service.objects.frame(digest)
+                execution_service.objects.release([digest])
+            except KeyError as err:
+                outcomes = b"".join(wire.encode_frame((False, err)))
+        else:
+            execution_service.reductions.discard(meta["reduction_id"])
+            outcomes = b"".join(wire.encode_frame((True, None)))
+        self.write_frame(outcomes)
+
+    def read_request(self):
+        """ the decoded meta data of the request and the bytes of the payload
+            frame, None if the request has none """
+        body = self.request.body
+        codec = self.request.headers.get(compression.CODEC_HEADER)
+        if codec:
+            body = compression.decompress(codec, body)
+        frames = wire.split_messages(body)
+        return wire.decode_frame(frames[0]), bytes(frames[1]) if len(frames) > 1 else None
+
+    def write_frame(self, frame):
+        """ write an encoded frame back, compressed if the client accepts a codec """
+        self.set_header("Content-Type", wire.CONTENT_TYPE)
+        self.set_header(compression.ACCEPT_HEADER, compression.accept_header_value())
+        self.set_load_header()
+        codec = compression.choose_codec(compression.parse_accept_header(\
+            self.request.headers.get(compression.ACCEPT_HEADER)))
+        if codec and len(frame) >= self._config.compression_threshold:
+            body, seconds = compression.timed_compress(codec, [frame])
+            self.set_header(compression.CODEC_HEADER, codec)
+            self.set_header(compression.COMPRESS_TIME_HEADER, "{:.6f}".format(seconds))
+            self.write(body)
+        else:
+            self.write(frame)
+
+    @staticmethod
+    @gen.coroutine
+    def reduce_partial(execution_service, sandbox_id, manifest, meta, partial):
+        """ reduce an encoded partial result into the node's partial result of the
+            reduction, the partials stored by concurrent requests while the workers
+            reduced are taken in as well """
+        reduction_id = meta["reduction_id"]
+        logging.getLogger("server").info("reducing into %s in %s", reduction_id, sandbox_id)
+        objects = execution_service.objects
+        digest = objects.hold(partial)
+        while reduction_id in execution_service.reductions:
+            other = execution_service.reductions.take(reduction_id)
+            references = objects.references([other, digest])
+            try:
+                partial, _ = yield execution_service.pool.run(("combine", sandbox_id, manifest, \
+                    meta, references[other], references[digest]))
+            finally:
+                objects.release([other, digest])
+            digest = objects.hold(partial)
+        execution_service.reductions.put(reduction_id, digest)
+
+    @gen.coroutine
+    def take_peer_partial(self, peer_url, reduction_id):
+        """ fetch the encoded partial result of a reduction from the peer node, the
+            modules header is passed on so that the peer can tell its modules apart """
+        response = yield AsyncHTTPClient().fetch(peer_url, method="POST", \
+            body=b"".join(wire.encode_request({"op": "take", "reduction_id": reduction_id})), \
+            headers={"Content-Type": wire.CONTENT_TYPE, \
+                     wire.MODULES_HEADER: self.request.headers.get(wire.MODULES_HEADER, "{}"), \
+                     compression.ACCEPT_HEADER: compression.accept_header_value()}, \
+            request_timeout=self._config.peer_request_timeout)
+        body = response.body
+        codec = response.headers.get(compression.CODEC_HEADER)
+        if codec:
+            body = compression.decompress(codec, body)
+        return body
+
+    def write_missing(self, digests):
+        """ answer with the digests of the blobs or modules to upload (again) """
+        self.set_status(409)
+        self.set_header("Content-Type", wire.CONTENT_TYPE)
+        self.set_load_header()
+        self.write(b"".join(wire.encode_frame(digests)))
+
+    def write_busy(self, admission):
+        """ turn the request away, the run queue of the node is full """
+        logging.getLogger("server").info("run queue full, turning away a request with load %s", \
+                                         admission.load_header())
+        self.set_status(503)
+        self.set_header("Retry-After", str(admission.retry_after))
+        self.set_load_header()
+        self.write("busy")
+
+    def set_load_header(self):
+        """ tell the client how loaded the node is """
+        self.set_header(wire.LOAD_HEADER, \
+            ServerExecutionServiceSingleton(self._config).admission.load_header())
 
     get = post
+
+class ActorHandler(ExecuteFunctionHandler):
+    """ handler for the calls of an actor, an instance living in the worker process
+        the actor is pinned to, a request carries a batch of consecutive calls
+        starting at a sequence number, batches run in the order of their sequence
+        numbers, whatever order the requests arrive in, the op "destroy" drops the
+        instance right away, the calls of actors are not subject to admission
+        control, a batch turned away would hold up the later ones
+    """
+
+    @gen.coroutine
+    def post(self, sandbox_id):
+        """ run a batch of calls of the actor once the calls before it ran """
+        execution_service = ServerExecutionServiceSingleton(self._config)
+        manifest = json.loads(self.request.headers.get(wire.MODULES_HEADER, "{}"))
+        missing = execution_service.code_cache.unresolved(manifest)
+        if missing:
+            self.write_missing(missing)
+            return
+        meta, payload = self.read_request()
+        actor_id = meta["actor_id"]
+        if meta["op"] == "destroy":
+            yield self.drop_actor(execution_service, actor_id)
+            self.write_frame(b"".join(wire.encode_frame((True, None))))
+            return
+        missing = execution_service.objects.missing(meta["blobs"])
+        if missing:
+            self.write_missing(missing)
+            return
+        objects = execution_service.objects.acquire(meta["blobs"])
+        try:
+            actor = execution_service.actors.get(actor_id)
+            if actor is not None:
+                yield actor.wait_turn(meta["seq"])
+            if actor is None or actor.destroyed:
+                err = RuntimeError("actor {} was destroyed".format(actor_id))
+                self.write_frame(b"".join(wire.encode_frame(\
+                    [(False, err)] * len(meta["methods"]))))
+                return
+            try:
+                outcomes, exec_times = yield execution_service.pool.run(("actor", sandbox_id, \
+                    manifest, meta, payload, objects), actor.worker)
+            except Exception:
+                # the worker process died, and the instance along with it
+                execution_service.actors.remove(actor_id)
+                raise
+            finally:
+                actor.advance(len(meta["methods"]))
+        finally:
+            execution_service.objects.release(meta["blobs"])
+        if "__destroy__" in meta["methods"]:
+            execution_service.actors.remove(actor_id)
+        self.set_header(wire.EXEC_TIME_HEADER, \
+                        ",".join("{:.6f}".format(seconds) for seconds in exec_times))
+        self.write_frame(outcomes)
+
+    @staticmethod
+    @gen.coroutine
+    def drop_actor(execution_service, actor_id):
+        """ forget an actor and drop its instance in the worker it is pinned to """
+        actor = execution_service.actors.remove(actor_id)
+        if actor is None:
+            return
+        try:
+            yield execution_service.pool.run(("drop", actor_id), actor.worker)
+        except RuntimeError as err:
+            logging.getLogger("server").info("dropping actor %s failed: %s", actor_id, str(err))
+
+class StreamFunctionHandler(ExecuteFunctionHandler):
+    """ handler for a call of a remote generator function, the items it yields are
+        written back as a chunked response of messages, ("items", [...]) for every
+        chunk of items, then ("end", None) or ("error", err), the generator is
+        paused whenever the client has no credit left for another chunk, it runs
+        in a worker process held for the whole stream
+    """
+
+    @gen.coroutine
+    def post(self, sandbox_id):
+        """ run the generator, producing a chunk of items whenever there is credit """
+        execution_service = ServerExecutionServiceSingleton(self._config)
+        manifest = json.loads(self.request.headers.get(wire.MODULES_HEADER, "{}"))
+        missing = execution_service.code_cache.unresolved(manifest)
+        if missing:
+            self.write_missing(missing)
+            return
+        meta, payload = self.read_request()
+        admission = execution_service.admission
+        if not admission.admit():
+            self.write_busy(admission)
+            return
+        missing = execution_service.objects.missing(meta["blobs"])
+        if missing:
+            admission.leave()
+            self.write_missing(missing)
+            return
+        options = meta["stream"]
+        stream = execution_service.streams.open(options["stream_id"], options["window"])
+        self._stream = stream # pylint: disable=W0201
+        pool = execution_service.pool
+        # the arguments are held until the generator is done with them
+        objects = execution_service.objects.acquire(meta["blobs"])
+        worker = yield pool.acquire()
+        try:
+            self.set_header("Content-Type", wire.CONTENT_TYPE)
+            self.set_load_header()
+            messages, finished = yield pool.call(worker, ("stream", sandbox_id, manifest, \
+                meta, payload, objects))
+            self.write(messages)
+            while not finished:
+                yield stream.wait_for_credit()
+                if stream.cancelled:
+                    break
+                messages, finished = yield pool.call(worker, ("next",))
+                stream.credit = stream.credit - 1
+                self.write(messages)
+                # wait for the chunk to be handed to the socket before producing the next one
+                yield self.flush()
+        finally:
+            execution_service.streams.close(options["stream_id"])
+            try:
+                if not worker.broken:
+                    yield pool.call(worker, ("close",))
+            finally:
+                pool.release(worker)
+                execution_service.objects.release(meta["blobs"])
+                admission.leave()
+
+    def on_connection_close(self):
+        """ the client went away, stop producing """
+        stream = getattr(self, "_stream", None)
+        if stream is not None:
+            stream.cancel()
+
+class PublishServiceHandler(ExecuteFunctionHandler):
+    """ handler publishing the entry points of a service on a port of this node,
+        the request meta data lists the entry points as (name, module name, function
+        name) triples, the port, the packages the service needs, and optionally the
+        max_batch_size and max_batch_wait, in milliseconds, of its micro-batches,
+        a (succeeded, error) pair is written back
+    """
+
+    def post(self, sandbox_id):
+        """ publish the entry points, the modules header lists the digests of the
+            source modules to import them from """
+        execution_service = ServerExecutionServiceSingleton(self._config)
+        manifest = json.loads(self.request.headers.get(wire.MODULES_HEADER, "{}"))
+        missing = execution_service.code_cache.unresolved(manifest)
+        if missing:
+            self.write_missing(missing)
+            return
+        meta, _ = self.read_request()
+        missing = [package for package in meta["packages"] if not installed(package)]
+        if missing:
+            outcome = (False, RuntimeError("packages not installed on {}: {}".format(\
+                self._config.server_url, ", ".join(missing))))
+        else:
+            try:
+                execution_service.services.publish(meta["port"], sandbox_id, manifest, \
+                    meta["entry_points"], \
+                    meta.get("max_batch_size") or self._config.service_max_batch_size, \
+                    (meta.get("max_batch_wait") or self._config.service_max_batch_wait) \
+                    / 1000.0)
+                outcome = (True, None)
+            except OSError as err:
+                outcome = (False, err)
+        self.write_frame(b"".join(wire.encode_frame(outcome)))
+
+class StreamCreditHandler(tornado.web.RequestHandler):
+    """ handler granting credit to a stream once the client consumed chunks """
+
+    def initialize(self, config=None):
+        """ handler initialization, called for each request """
+        self._config = config # pylint: disable=W0201
+
+    def post(self, stream_id, count):
+        """ count is the number of chunks consumed, -1 to cancel the stream """
+        execution_service = ServerExecutionServiceSingleton(self._config)
+        if not execution_service.streams.grant(stream_id, int(count)):
+            self.set_status(404)
+        self.write("granted")
+
+class QueryBlobsHandler(tornado.web.RequestHandler):
+    """ handler telling which of the posted digests are not cached on this node,
+        store names the store of the execution service, objects or code_cache """
+
+    def initialize(self, config=None, store="objects"):
+        """ handler initialization, called for each request """
+        self._config = config # pylint: disable=W0201
+        self._store = store # pylint: disable=W0201
+
+    def post(self):
+        """ the request frame is a list of digests, the missing ones are written back """
+        execution_service = ServerExecutionServiceSingleton(self._config)
+        digests = wire.decode_frame(self.request.body)
+        self.set_header("Content-Type", wire.CONTENT_TYPE)
+        self.write(b"".join(wire.encode_frame(\
+            getattr(execution_service, self._store).missing(digests))))
+
+class UploadBlobHandler(tornado.web.RequestHandler):
+    """ handler for uploading a large argument value into the object store, or a
+        source module into the code cache """
+
+    def initialize(self, config=None, store="objects"):
+        """ handler initialization, called for each request """
+        self._config = config # pylint: disable=W0201
+        self._store = store # pylint: disable=W0201
+
+    def put(self, digest):
+        """ the body is the encoded argument frame with the given digest """
+        execution_service = ServerExecutionServiceSingleton(self._config)
+        body = self.request.body
+        codec = self.request.headers.get(compression.CODEC_HEADER)
+        if codec:
+            body = compression.decompress(codec, body)
+        try:
+            getattr(execution_service, self._store).put(digest, body)
+        except ValueError as err:
+            self.set_status(400)
+            self.write(str(err))
+            return
+        self.write("stored")
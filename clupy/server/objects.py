@@ -0,0 +1,189 @@
+""" server side store of large argument values and intermediate results
+
+    Every object is an encoded frame kept once in a shared memory segment of the
+    server node. The tasks sent to the worker processes carry ObjectReferences
+    rather than the bytes. The workers attach to the segments and decode the
+    frames in place, so the out-of-band buffers of the values, e.g. NumPy array
+    data, are read-only views into the shared memory rather than private copies.
+"""
+from collections import OrderedDict
+import logging
+from ..utils import wire
+try:
+    from multiprocessing import shared_memory
+except ImportError: # python < 3.8, the frames are passed to the workers by value
+    shared_memory = None
+
+class ObjectReference(object):
+    """ stands for an object of the store in a task sent to a worker process, the
+        name and size of its shared memory segment, or the frame itself when
+        shared memory is not available """
+
+    def __init__(self, digest, name, size, data=None):
+        self.digest = digest
+        self.name = name
+        self.size = size
+        self.data = data
+
+class StoredObject(object):
+    """ an encoded frame in a shared memory segment, refs counts the running tasks
+        and partial results holding it, a transient object is an intermediate
+        result removed as soon as it is no longer held """
+
+    def __init__(self, data, transient):
+        self.size = len(data)
+        self.refs = 0
+        self.transient = transient
+        if shared_memory is None:
+            self.segment = None
+            self.data = bytes(data)
+        else:
+            self.segment = shared_memory.SharedMemory(create=True, size=max(self.size, 1))
+            self.segment.buf[:self.size] = data
+            self.data = None
+
+    def reference(self, digest):
+        """ the ObjectReference passed to the worker processes """
+        if self.segment is None:
+            return ObjectReference(digest, None, self.size, self.data)
+        return ObjectReference(digest, self.segment.name, self.size)
+
+    def frame(self):
+        """ a copy of the encoded frame """
+        if self.segment is None:
+            return self.data
+        return bytes(self.segment.buf[:self.size])
+
+    def free(self):
+        """ remove the segment, the workers still attached to it keep their mapping """
+        if self.segment is not None:
+            self.segment.close()
+            self.segment.unlink()
+
+class ObjectStore(object):
+    """ a size bounded store of encoded frames keyed by content digest, objects
+        held by a running task or a partial result are never evicted, the least
+        recently used of the others are evicted to keep the size within capacity """
+
+    def __init__(self, capacity):
+        self.capacity = capacity # bytes
+        self.size = 0
+        self._objects = OrderedDict()
+        self._logger = logging.getLogger("server")
+
+    def __contains__(self, digest):
+        return digest in self._objects
+
+    def missing(self, digests):
+        """ the digests among the given ones that are not stored """
+        return [digest for digest in digests if digest not in self._objects]
+
+    def put(self, digest, data):
+        """ store an uploaded frame, raise ValueError if it does not match its digest """
+        if wire.digest_chunks([data]) != digest:
+            raise ValueError("blob content does not match digest {}".format(digest))
+        self.store(digest, data)
+
+    def hold(self, data):
+        """ store an intermediate result held until released, return its digest """
+        digest = wire.digest_chunks([data])
+        self.store(digest, data, True)
+        self.acquire([digest])
+        return digest
+
+    def store(self, digest, data, transient=False):
+        """ store a frame, evicting the least recently used objects to make room """
+        if digest in self._objects:
+            self._objects[digest].transient = self._objects[digest].transient and transient
+            self._objects.move_to_end(digest)
+            return
+        self.evict(len(data))
+        self._objects[digest] = StoredObject(data, transient)
+        self.size = self.size + len(data)
+
+    def acquire(self, digests):
+        """ hold the objects with the given digests, return their references by digest """
+        for digest in digests:
+            self._objects[digest].refs = self._objects[digest].refs + 1
+            self._objects.move_to_end(digest)
+        return self.references(digests)
+
+    def references(self, digests):
+        """ the references of the objects with the given digests, by digest """
+        return dict((digest, self._objects[digest].reference(digest)) for digest in digests)
+
+    def release(self, digests):
+        """ let go of the objects with the given digests """
+        for digest in digests:
+            stored = self._objects.get(digest)
+            if stored is None:
+                continue
+            stored.refs = stored.refs - 1
+            if stored.refs <= 0 and stored.transient:
+                self.remove(digest)
+        self.evict(0)
+
+    def frame(self, digest):
+        """ a copy of the frame with the given digest """
+        return self._objects[digest].frame()
+
+    def evict(self, incoming):
+        """ evict unheld objects until incoming bytes fit within capacity """
+        for digest in list(self._objects):
+            if self.size + incoming <= self.capacity:
+                break
+            stored = self._objects[digest]
+            if stored.refs > 0:
+                continue
+            self._logger.info("evicting object %s", digest)
+            self.remove(digest)
+
+    def remove(self, digest):
+        """ remove an object and its segment """
+        stored = self._objects.pop(digest)
+        self.size = self.size - stored.size
+        stored.free()
+
+    def stop(self):
+        """ remove every segment """
+        for stored in self._objects.values():
+            stored.free()
+        self._objects = OrderedDict()
+        self.size = 0
+
+class ObjectViews(object):
+    """ the worker process side of the store, the referenced frames are decoded in
+        place, every object once per task, the segments are detached once the task
+        is done unless values that outlived it, e.g. attributes of an actor, still
+        view them """
+
+    def __init__(self):
+        self._segments = {} # segment name -> SharedMemory attached for the running task
+        self._lingering = [] # attached segments still viewed by the values of earlier tasks
+        self._values = {} # digest -> value decoded during the running task
+
+    def value(self, reference):
+        """ the value of a referenced object """
+        if reference.digest not in self._values:
+            if reference.data is not None:
+                frame = reference.data
+            else:
+                segment = self._segments.get(reference.name)
+                if segment is None:
+                    segment = shared_memory.SharedMemory(name=reference.name)
+                    self._segments[reference.name] = segment
+                frame = segment.buf[:reference.size].toreadonly()
+            self._values[reference.digest] = wire.decode_frame(frame)
+        return self._values[reference.digest]
+
+    def release(self):
+        """ forget the values of the task and detach its segments """
+        self._values = {}
+        segments = self._lingering + list(self._segments.values())
+        self._segments = {}
+        self._lingering = []
+        for segment in segments:
+            try:
+                segment.close()
+            except BufferError:
+                self._lingering.append(segment)
@@ -0,0 +1,142 @@
+""" the pool of pre-started worker processes a server node runs remote functions in """
+import concurrent.futures
+import logging
+import multiprocessing
+from tornado import gen, locks
+from tornado.ioloop import IOLoop
+from .worker import worker_main
+
+class WorkerProcess(object):
+    """ a worker process and the server's end of the pipe to it """
+
+    def __init__(self, context, code_cache_dir, spool):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=worker_main, \
+            args=(child_connection, code_cache_dir, spool.spool_dir, spool.threshold), \
+            daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.task_count = 0
+        self.memory = 0 # resident bytes reported with the last reply
+        self.broken = False
+        self.actors = 0 # the number of actors pinned to the process
+
+    def call(self, task):
+        """ send a task and wait for its reply, blocks the calling thread """
+        self.connection.send(task)
+        return self.connection.recv()
+
+    def stop(self):
+        """ ask the process to exit, kill it if it does not """
+        try:
+            self.connection.send(None)
+        except (OSError, ValueError):
+            pass
+        self.connection.close()
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.terminate()
+
+class WorkerPool(object):
+    """ size worker processes, each runs one task at a time, a worker is replaced
+        by a fresh one after max_tasks tasks, once its resident memory exceeds
+        max_memory bytes, or if it died, workers with actors pinned to them are
+        only replaced once they died, which loses their actors
+
+        The pipes are written and read on the threads of an executor, so the
+        IOLoop keeps serving requests while the workers compute. The workers write
+        the large results of calls to the ResultSpool.
+    """
+
+    def __init__(self, size, code_cache_dir, max_tasks, max_memory, spool):
+        self.size = size
+        self._code_cache_dir = code_cache_dir
+        self._spool = spool
+        self._max_tasks = max_tasks
+        self._max_memory = max_memory
+        self._logger = logging.getLogger("server")
+        # spawned rather than forked, the server process runs threads and an IOLoop
+        self._context = multiprocessing.get_context("spawn")
+        self._executor = concurrent.futures.ThreadPoolExecutor(size + 1)
+        self._idle = []
+        self._released = locks.Condition()
+        self._workers = []
+        for _ in range(size):
+            self._idle.append(self.start_worker())
+
+    def start_worker(self):
+        """ start a worker process """
+        worker = WorkerProcess(self._context, self._code_cache_dir, self._spool)
+        self._workers.append(worker)
+        self._logger.info("started worker process %d", worker.process.pid)
+        return worker
+
+    def pin(self):
+        """ the worker an actor is pinned to, the one with the fewest actors """
+        worker = min(self._workers, key=lambda worker: worker.actors)
+        worker.actors = worker.actors + 1
+        return worker
+
+    @staticmethod
+    def unpin(worker):
+        """ an actor pinned to the worker was destroyed """
+        worker.actors = worker.actors - 1
+
+    @gen.coroutine
+    def acquire(self, worker=None):
+        """ wait for the given worker, or any worker if None, to be idle and take
+            it, preferring workers without actors, it must be released afterwards """
+        while True:
+            if worker is not None and worker not in self._workers:
+                raise RuntimeError("worker process {} died".format(worker.process.pid))
+            candidates = [idle for idle in self._idle if worker is None or idle is worker]
+            if candidates:
+                chosen = min(candidates, key=lambda idle: idle.actors)
+                self._idle.remove(chosen)
+                return chosen
+            yield self._released.wait()
+
+    def release(self, worker):
+        """ give an acquired worker back, recycling it if it is due """
+        if worker.broken or (not worker.actors and (worker.task_count >= self._max_tasks \
+                                                    or worker.memory > self._max_memory)):
+            self._logger.info("recycling worker process %d after %d tasks, %d bytes", \
+                worker.process.pid, worker.task_count, worker.memory)
+            self._workers.remove(worker)
+            self._executor.submit(worker.stop)
+            worker = self.start_worker()
+        self._idle.append(worker)
+        self._released.notify_all()
+
+    @gen.coroutine
+    def call(self, worker, task):
+        """ carry out a task on an acquired worker, return its result """
+        try:
+            succeeded, result, memory = yield IOLoop.current().run_in_executor(\
+                self._executor, worker.call, task)
+        except (EOFError, OSError) as err:
+            worker.broken = True
+            raise RuntimeError("worker process {} died: {}".format(\
+                worker.process.pid, str(err) or type(err).__name__)) from err
+        worker.task_count = worker.task_count + 1
+        worker.memory = memory
+        if not succeeded:
+            raise result
+        return result
+
+    @gen.coroutine
+    def run(self, task, worker=None):
+        """ carry out a task on the given worker once it is idle, or on the next
+            idle worker if None, return its result """
+        worker = yield self.acquire(worker)
+        try:
+            result = yield self.call(worker, task)
+        finally:
+            self.release(worker)
+        return result
+
+    def stop(self):
+        """ stop every worker process """
+        for worker in self._workers:
+            worker.stop()
+        self._workers = []
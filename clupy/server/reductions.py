@@ -0,0 +1,35 @@
+""" server side partial results of map_reduce calls """
+
+class ReductionStore(object):
+    """ the partial result of every running reduction on this node, the results of
+        the node's map calls are reduced into it as they are computed, then the
+        partials of the nodes are merged pairwise until one node holds the result
+
+        Partials are encoded (succeeded, value) frames held in the node's
+        ObjectStore, they are decoded and reduced by the worker processes only.
+    """
+
+    def __init__(self, objects):
+        self._objects = objects
+        self._partials = {} # reduction id -> digest of the held partial result
+
+    def __contains__(self, reduction_id):
+        return reduction_id in self._partials
+
+    def put(self, reduction_id, digest):
+        """ set the partial result of a reduction, the digest of an object held
+            in the ObjectStore, which is released once the partial is discarded """
+        self._partials[reduction_id] = digest
+
+    def take(self, reduction_id):
+        """ remove and return the digest of the partial result of a reduction, the
+            caller is to release it """
+        if reduction_id not in self._partials:
+            raise KeyError("no partial result for reduction {}".format(reduction_id))
+        return self._partials.pop(reduction_id)
+
+    def discard(self, reduction_id):
+        """ forget the partial result of a failed reduction """
+        digest = self._partials.pop(reduction_id, None)
+        if digest is not None:
+            self._objects.release([digest])
@@ -1,9 +1,43 @@
 """ server node registration with the master node processing """
 from __future__ import print_function
 import logging
+import multiprocessing
+import os
 import urllib
 from tornado.httpclient import AsyncHTTPClient, HTTPClient, HTTPError
 import tornado.ioloop
+from .execution import ServerExecutionServiceSingleton
+
+def free_memory():
+    """ the memory available to new processes on this node in bytes, None if unknown """
+    try:
+        with open("/proc/meminfo", encoding="utf-8") as stream:
+            for line in stream:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, OSError, ValueError):
+        return None
+
+def node_resources(config):
+    """ the resources of this node reported to the master with every heartbeat """
+    admission = ServerExecutionServiceSingleton(config).admission
+    resources = {
+        "cores": multiprocessing.cpu_count(),
+        "workers": admission.workers,
+        "run_queue": admission.queued(),
+    }
+    memory = free_memory()
+    if memory is not None:
+        resources["free_memory"] = memory
+    try:
+        resources["load_average"] = "{:.2f}".format(os.getloadavg()[0])
+    except (AttributeError, OSError):
+        pass
+    return resources
 
 class ServerNodeRegistrationSingleton(object):
     """ the singleton class for server node registration with the master nodes """
@@ -31,12 +65,15 @@ class ServerNodeRegistrationSingleton(object):
             self._logger = logging.getLogger("server")
             self._timeout_handle = None
             self._stopped = False
-            self._http_request = None
 
-        def process_registration_response(self, response):
-            """ processing registration request response """
-            if response.error:
-                self._logger.error("registration request error: %s", response.error)
+        def process_registration_response(self, response_future):
+            """ processing registration request response, schedules the next heartbeat """
+            try:
+                error = response_future.result().error
+            except Exception as err: # pylint: disable=W0703
+                error = err
+            if error:
+                self._logger.error("registration request error: %s", error)
                 timeout = self._config.failure_retry_interval
             else:
                 self._logger.info("successful in server registration")
@@ -49,17 +86,17 @@ class ServerNodeRegistrationSingleton(object):
                     self.start_registration)
 
         def start_registration(self):
-            """ start the registration process """
+            """ start the registration process, every registration request is a
+                heartbeat reporting the resources of the node """
             self._logger.info("issuing registration request")
             master_url = self._config.master_url.replace("clupy://", "http://")
             master_url = master_url if master_url.endswith("/") else master_url + "/"
             server_url = urllib.parse.quote_plus(self._config.server_url) # pylint: disable=E1101
-            master_url = master_url + "register/" + server_url
-            if self._http_request is not None:
-                self._http_request.close()
-            self._http_request = AsyncHTTPClient()
-            self._http_request.fetch(master_url, \
-                lambda response, context=self: context.process_registration_response(response))
+            master_url = master_url + "register/" + server_url + "?" \
+                + urllib.parse.urlencode(node_resources(self._config))
+            tornado.ioloop.IOLoop.current().add_future(\
+                AsyncHTTPClient().fetch(master_url, raise_error=False), \
+                self.process_registration_response)
 
         def stop_registration(self):
             """ stop the server node registration, called upon exiting """
@@ -0,0 +1,165 @@
+""" server side hosting of the entry points of published services
+
+    A service's entry points are served on a port of their own, POST /<entry point>
+    takes a JSON input and answers the JSON output. The concurrent requests to an
+    entry point are coalesced into micro-batches, the entry point is called once
+    per batch with the list of its inputs and returns the list of their outputs.
+"""
+import importlib.util
+import json
+import logging
+import tornado.web
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.httpserver import HTTPServer
+from tornado.ioloop import IOLoop
+try:
+    from importlib import metadata
+except ImportError: # python < 3.8, packages are only found by their module names
+    metadata = None
+
+def installed(package):
+    """ whether a package is installed, by its distribution or its module name,
+        the package is not imported """
+    if metadata is not None:
+        try:
+            metadata.distribution(package)
+            return True
+        except metadata.PackageNotFoundError:
+            pass
+    try:
+        return importlib.util.find_spec(package.split(".")[0]) is not None
+    except ValueError:
+        return False
+
+class ServiceEndpoint(object):
+    """ an entry point of a published service, the requests are sent to the worker
+        processes in batches of at most max_batch_size inputs, a batch leaves once
+        it is full or once its oldest request waited max_batch_wait seconds, while
+        every worker process runs a batch the requests queue up and make the next
+        batches larger, so that the batch size follows the load
+    """
+
+    def __init__(self, pool, sandbox_id, manifest, module_name, func_name, \
+                 max_batch_size, max_batch_wait):
+        self._pool = pool
+        self._task = (sandbox_id, manifest, module_name, func_name)
+        self.max_batch_size = max_batch_size
+        self.max_batch_wait = max_batch_wait # seconds
+        self._pending = [] # (input, Future, arrival time) of the requests waiting for a batch
+        self._running = 0 # the batches running in the worker processes
+        self._timer = None
+        self._logger = logging.getLogger("server")
+
+    def call(self, value):
+        """ queue an input, return the Future of its (succeeded, JSON output or
+            error message) pair """
+        future = Future()
+        self._pending.append((value, future, IOLoop.current().time()))
+        self.flush()
+        return future
+
+    def flush(self):
+        """ send the due batches while a worker process is free, and wake up once
+            the oldest request left waiting is due """
+        io_loop = IOLoop.current()
+        if self._timer is not None:
+            io_loop.remove_timeout(self._timer)
+            self._timer = None
+        while self._pending and self._running < self._pool.size:
+            due_time = self._pending[0][2] + self.max_batch_wait
+            if len(self._pending) < self.max_batch_size and io_loop.time() < due_time:
+                self._timer = io_loop.call_at(due_time, self.flush)
+                return
+            batch = self._pending[:self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size:]
+            self._running = self._running + 1
+            io_loop.add_future(self.run_batch(batch), lambda fut: self.complete_batch())
+
+    @gen.coroutine
+    def run_batch(self, batch):
+        """ call the entry point with the inputs of a batch and fan the outputs out """
+        try:
+            outcomes = yield self._pool.run(("service",) + self._task \
+                                            + ([value for value, _, _ in batch],))
+        except Exception as err: # pylint: disable=W0703
+            self._logger.error("batch of %s failed: %s", self._task[3], str(err))
+            outcomes = [(False, str(err))] * len(batch)
+        for (_, future, _), outcome in zip(batch, outcomes):
+            future.set_result(outcome)
+
+    def complete_batch(self):
+        """ a worker process is free for the next batch """
+        self._running = self._running - 1
+        self.flush()
+
+class ServiceCallHandler(tornado.web.RequestHandler):
+    """ handler for the requests to the entry points published on a port """
+
+    def initialize(self, endpoints=None):
+        """ handler initialization, called for each request """
+        self._endpoints = endpoints # pylint: disable=W0201
+
+    def get(self, name):
+        """ GET / lists the entry points """
+        if name:
+            self.send_json(404, {"error": "use POST to call {}".format(name)})
+            return
+        self.send_json(200, sorted(self._endpoints.keys()))
+
+    @gen.coroutine
+    def post(self, name):
+        """ call an entry point with the JSON input of the body """
+        endpoint = self._endpoints.get(name)
+        if endpoint is None:
+            self.send_json(404, {"error": "no entry point {}".format(name)})
+            return
+        try:
+            value = json.loads(self.request.body.decode("utf-8")) if self.request.body else None
+        except ValueError as err:
+            self.send_json(400, {"error": "malformed JSON input: {}".format(str(err))})
+            return
+        succeeded, output = yield endpoint.call(value)
+        if not succeeded:
+            self.send_json(500, {"error": output})
+            return
+        self.set_header("Content-Type", "application/json")
+        self.write(output)
+
+    def send_json(self, status, value):
+        """ write a JSON value back with the given status """
+        self.set_status(status)
+        self.set_header("Content-Type", "application/json")
+        self.write(json.dumps(value))
+
+class ServiceRegistry(object):
+    """ the entry points published on this node, by port, every port is served by
+        an HTTP server of its own, publishing an entry point again replaces it """
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._ports = {} # port -> (HTTPServer, entry point name -> ServiceEndpoint)
+        self._logger = logging.getLogger("server")
+
+    def publish(self, port, sandbox_id, manifest, entry_points, max_batch_size, \
+                max_batch_wait):
+        """ serve the entry points, (name, module name, function name) triples, on
+            port, raise OSError if the port cannot be listened on """
+        if port not in self._ports:
+            endpoints = {}
+            server = HTTPServer(tornado.web.Application([\
+                (r"/(.*)", ServiceCallHandler, dict(endpoints=endpoints))]))
+            server.listen(port)
+            self._ports[port] = (server, endpoints)
+        endpoints = self._ports[port][1]
+        for name, module_name, func_name in entry_points:
+            self._logger.info("publishing %s on port %d, batches of %d within %.3f seconds", \
+                name, port, max_batch_size, max_batch_wait)
+            endpoints[name] = ServiceEndpoint(self._pool, sandbox_id, manifest, module_name, \
+                func_name, max_batch_size, max_batch_wait)
+
+    def stop(self):
+        """ stop serving every port """
+        for server, _ in self._ports.values():
+            server.stop()
+        self._ports = {}
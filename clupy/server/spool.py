@@ -0,0 +1,91 @@
+""" server side spool of large results, fetched by the clients in byte ranges """
+import logging
+import os
+import time
+import uuid
+import tornado.web
+from ..utils import wire
+
+class ResultSpool(object):
+    """ the encoded frames of results of at least threshold bytes, kept in a file
+        each under a directory per sandbox rather than sent in the response, a
+        file is removed once the client fetched it, or ttl seconds after it was
+        written, the worker processes write the files and the server serves them
+    """
+
+    def __init__(self, spool_dir, threshold, ttl=None):
+        self.spool_dir = os.path.abspath(spool_dir)
+        self.threshold = threshold # bytes
+        self.ttl = ttl # seconds
+        self._logger = logging.getLogger("server")
+
+    def spool(self, sandbox_id, chunks):
+        """ write the chunks of an encoded frame to a new file, return its SpooledResult """
+        directory = os.path.join(self.spool_dir, sandbox_id)
+        os.makedirs(directory, exist_ok=True)
+        name = uuid.uuid4().hex
+        path = os.path.join(directory, name)
+        # renamed once complete, so that a partial file is never served
+        with open(path + ".part", "wb") as stream:
+            for chunk in chunks:
+                stream.write(chunk)
+        os.replace(path + ".part", path)
+        return wire.SpooledResult(sandbox_id + "/" + name, wire.frame_length(chunks), \
+                                  wire.digest_chunks(chunks))
+
+    def spool_outcomes(self, sandbox_id, outcomes):
+        """ the (succeeded, value) pairs with the values whose encoded frames reach
+            the threshold spooled and replaced by their SpooledResults, a value is
+            encoded only if it may be that large, and written as encoded """
+        spooled = []
+        for succeeded, value in outcomes:
+            if succeeded and wire.may_exceed(value, self.threshold):
+                try:
+                    chunks = wire.encode_frame(value)
+                except Exception: # pylint: disable=W0703
+                    chunks = [] # not picklable, turned into a failure with the others
+                if wire.frame_length(chunks) >= self.threshold:
+                    self._logger.info("spooling a result of %d bytes in %s", \
+                                      wire.frame_length(chunks), sandbox_id)
+                    value = self.spool(sandbox_id, chunks)
+            spooled.append((succeeded, value))
+        return spooled
+
+    def expire(self):
+        """ remove the files written more than ttl seconds ago, called periodically """
+        if not os.path.isdir(self.spool_dir):
+            return
+        expiration = time.time() - self.ttl
+        for sandbox_id in os.listdir(self.spool_dir):
+            directory = os.path.join(self.spool_dir, sandbox_id)
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                try:
+                    if os.path.getmtime(path) < expiration:
+                        self._logger.info("expiring spooled result %s/%s", sandbox_id, name)
+                        os.remove(path)
+                except OSError:
+                    pass
+            if not os.listdir(directory):
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    pass
+
+class SpoolHandler(tornado.web.StaticFileHandler):
+    """ handler serving the spooled results, GET honours Range headers so that
+        clients fetch a result in parallel ranges and resume the ones that broke
+        off, DELETE removes a result once fetched """
+
+    def compute_etag(self):
+        """ spooled files are served once, hashing multi-GB files is not worth it """
+        return None
+
+    def delete(self, path):
+        """ remove a spooled result """
+        root = os.path.realpath(self.root)
+        absolute_path = os.path.realpath(self.get_absolute_path(root, self.parse_url_path(path)))
+        if not absolute_path.startswith(root + os.path.sep) or not os.path.isfile(absolute_path):
+            raise tornado.web.HTTPError(404)
+        os.remove(absolute_path)
+        self.write("removed")
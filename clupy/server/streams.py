@@ -0,0 +1,56 @@
+""" server side flow control of the results streamed by remote generator functions """
+import logging
+from tornado import gen, locks
+
+class ServerStream(object):
+    """ the credit of one streamed call, the number of chunks the client is ready to
+        receive, the generator is paused while the credit is used up """
+
+    def __init__(self, window):
+        self.credit = window
+        self.cancelled = False
+        self._condition = locks.Condition()
+
+    def grant(self, count):
+        """ the client consumed count chunks, a negative count cancels the stream """
+        if count < 0:
+            self.cancelled = True
+        else:
+            self.credit = self.credit + count
+        self._condition.notify_all()
+
+    def cancel(self):
+        """ stop producing, e.g. once the client went away """
+        self.grant(-1)
+
+    @gen.coroutine
+    def wait_for_credit(self):
+        """ wait until a chunk may be sent or the stream is cancelled """
+        while self.credit <= 0 and not self.cancelled:
+            yield self._condition.wait()
+
+class StreamRegistry(object):
+    """ the streams being produced on this node by their ids """
+
+    def __init__(self):
+        self._streams = {}
+        self._logger = logging.getLogger("server")
+
+    def open(self, stream_id, window):
+        """ register a new stream with an initial credit of window chunks """
+        stream = ServerStream(window)
+        self._streams[stream_id] = stream
+        return stream
+
+    def close(self, stream_id):
+        """ forget a finished stream """
+        self._streams.pop(stream_id, None)
+
+    def grant(self, stream_id, count):
+        """ pass a credit grant on to the stream, False if there is no such stream """
+        stream = self._streams.get(stream_id)
+        if stream is None:
+            self._logger.info("credit for unknown stream %s", stream_id)
+            return False
+        stream.grant(count)
+        return True
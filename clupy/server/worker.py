@@ -0,0 +1,340 @@
+""" the worker processes running remote functions on behalf of a server node
+
+    A worker receives tasks over a pipe and sends back one reply per task. The
+    arguments of the calls are only decoded in the worker, with the sandbox's
+    shipped modules activated, so that the server process never imports the
+    clients' modules and its IOLoop is never blocked by them. Large argument
+    values and partial results are referenced by the tasks, and decoded in place
+    in the shared memory of the server's ObjectStore.
+"""
+import importlib
+import json
+import logging
+import os
+import signal
+import time
+from ..utils import wire
+from ..utils.binding import BindingPlan
+from .code import CodeCache
+from .objects import ObjectViews
+from .spool import ResultSpool
+
+def resident_memory():
+    """ the resident set size of the current process in bytes, 0 if unknown """
+    try:
+        with open("/proc/self/statm", encoding="utf-8") as stream:
+            return int(stream.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        # the peak rather than the current size, in kilobytes on linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        return 0
+
+def get_function(module_name, func_name):
+    """ the function object, the module is imported from the code cache while
+        the sandbox's modules are activated """
+    module = importlib.import_module(module_name)
+    return getattr(module, func_name)
+
+def manifest_digest(manifest):
+    """ the content hash of the code shipped along with a request """
+    return wire.digest_chunks([json.dumps(manifest, sort_keys=True).encode("utf-8")])
+
+class CallableCache(object):
+    """ the functions every sandbox resolved, along with their binding plans, so
+        that a call only looks its function up in a dictionary, an entry is
+        resolved again once the code shipped to the sandbox changed """
+
+    def __init__(self):
+        self._entries = {} # (sandbox id, module name, func name) -> (code hash, func, plan)
+        self._logger = logging.getLogger("server")
+
+    def resolve(self, sandbox_id, code_hash, module_name, func_name):
+        """ the function and its BindingPlan, the sandbox's modules must be activated """
+        key = (sandbox_id, module_name, func_name)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != code_hash:
+            self._logger.info("resolving %s:%s in %s", module_name, func_name, sandbox_id)
+            func = get_function(module_name, func_name)
+            entry = (code_hash, func, BindingPlan(func))
+            self._entries[key] = entry
+        return entry[1], entry[2]
+
+def resolve(input_data, objects, views):
+    """ replace the BlobReferences among the argument values of a call by the
+        values of the referenced objects, the references are instances of the
+        server's own wire module since sandboxes never import the framework from
+        the code cache """
+    for name, value in input_data.items():
+        if isinstance(value, wire.BlobReference):
+            input_data[name] = views.value(objects[value.digest])
+    return input_data
+
+def encode_outcomes(outcomes, spool=None, sandbox_id=None):
+    """ the encoded frame of a list of (succeeded, value) pairs, with a spool, the
+        values whose encoded frames reach its threshold are spooled and replaced
+        by their SpooledResults """
+    if spool is not None:
+        outcomes = spool.spool_outcomes(sandbox_id, outcomes)
+    try:
+        chunks = wire.encode_frame(outcomes)
+    except Exception: # pylint: disable=W0703
+        chunks = wire.encode_frame([wire.picklable_outcome(outcome) for outcome in outcomes])
+    return b"".join(chunks)
+
+def encode_outcome(outcome):
+    """ the encoded frame of a single (succeeded, value) pair """
+    return b"".join(wire.encode_frame(wire.picklable_outcome(outcome)))
+
+def produce_chunk(generator, options):
+    """ take up to chunk_items items from the generator, or as many as it yields
+        in chunk_time seconds, return the encoded messages and whether the
+        generator is done """
+    items = []
+    start = time.time()
+    outcome = None
+    while len(items) < options["chunk_items"] and time.time() - start < options["chunk_time"]:
+        try:
+            items.append(next(generator))
+        except StopIteration:
+            outcome = ("end", None)
+            break
+        except Exception as err: # pylint: disable=W0703
+            logging.getLogger("server").error("stream %s failed: %s", \
+                options["stream_id"], str(err))
+            outcome = wire.picklable_outcome(("error", err))
+            break
+    messages = []
+    if items:
+        try:
+            messages.append(wire.encode_message(("items", items)))
+        except Exception as err: # pylint: disable=W0703
+            outcome = wire.picklable_outcome(("error", err))
+    if outcome is not None:
+        messages.append(wire.encode_message(outcome))
+    return b"".join(b"".join(message) for message in messages), outcome is not None
+
+class TaskRunner(object):
+    """ carries out the tasks a worker receives, a task is a tuple starting with
+        its kind:
+        ("calls", sandbox id, manifest, meta, payload, objects): run a batch of calls
+        ("combine", sandbox id, manifest, meta, first, second): reduce two partials
+        ("stream", sandbox id, manifest, meta, payload, objects): start a generator
+        ("next",): produce the next chunk of the generator
+        ("close",): stop the generator
+        ("actor", sandbox id, manifest, meta, payload, objects): run calls of an actor
+        ("drop", actor id): drop the instance of an actor
+        ("service", sandbox id, manifest, module name, func name, inputs): call
+        the entry point of a service with the inputs of a micro-batch
+        meta is the request meta data, payload the frame of the calls' arguments,
+        objects the ObjectReferences of the large arguments they reference by
+        digest, and first and second the ObjectReferences of the partials
+        The large results of calls are written to the spool rather than replied.
+    """
+
+    def __init__(self, code_cache_dir, spool_dir, spool_threshold):
+        self.code_cache = CodeCache(code_cache_dir)
+        self.spool = ResultSpool(spool_dir, spool_threshold)
+        self.callables = CallableCache()
+        self.views = ObjectViews()
+        self._logger = logging.getLogger("server")
+        self._generator = None
+        self._stream = None # (sandbox id, manifest, stream options) of the generator
+        self.actors = {} # actor id -> the instance living in this worker
+        self._method_plans = {} # (type, method name) -> BindingPlan of the bound method
+
+    def run(self, task):
+        """ carry out a task and return its reply """
+        try:
+            return getattr(self, "run_" + task[0])(*task[1:])
+        finally:
+            self.views.release()
+
+    def run_calls(self, sandbox_id, manifest, meta, payload, objects):
+        """ run the calls of a batch, return the encoded (succeeded, value) pairs,
+            the execution times and, for map_reduce calls, the encoded partial
+            result the values of the batch were reduced to, their pairs carry no
+            value, the partial is None if no call succeeded """
+        with self.code_cache.activated(sandbox_id, manifest):
+            calls = wire.decode_frame(payload)
+            code_hash = manifest_digest(manifest)
+            try:
+                func, plan = self.callables.resolve(sandbox_id, code_hash, \
+                                                    meta["module_name"], meta["func_name"])
+                reduce_fn = None
+                if meta["op"] == "map_reduce":
+                    reduce_fn, _ = self.callables.resolve(sandbox_id, code_hash, \
+                        meta["reduce_module"], meta["reduce_func"])
+            except Exception as err: # pylint: disable=W0703
+                self._logger.error("resolving %s:%s failed: %s", \
+                    meta["file_name"], meta["func_name"], str(err))
+                return encode_outcomes([(False, err)] * len(calls)), [0.0] * len(calls), None
+            outcomes = []
+            exec_times = []
+            partial = None
+            for input_data in calls:
+                start = time.time()
+                try:
+                    value = plan.call(func, resolve(input_data, objects, self.views) \
+                                      if objects else input_data)
+                    if reduce_fn is not None:
+                        partial = (True, value if partial is None \
+                                   else reduce_fn(partial[1], value))
+                        value = None
+                    outcomes.append((True, value))
+                except Exception as err: # pylint: disable=W0703
+                    self._logger.error("execution of %s:%s failed: %s", \
+                        meta["file_name"], meta["func_name"], str(err))
+                    outcomes.append((False, err))
+                exec_times.append(time.time() - start)
+            return encode_outcomes(outcomes, self.spool, sandbox_id), exec_times, \
+                encode_outcome(partial) if partial is not None else None
+
+    def run_combine(self, sandbox_id, manifest, meta, first, second):
+        """ reduce two referenced partial results into one, a failed partial fails
+            the combination, return the encoded partial and whether it succeeded """
+        with self.code_cache.activated(sandbox_id, manifest):
+            outcomes = (self.views.value(first), self.views.value(second))
+            for outcome in outcomes:
+                if not outcome[0]:
+                    return encode_outcome(outcome), False
+            try:
+                reduce_fn, _ = self.callables.resolve(sandbox_id, manifest_digest(manifest), \
+                                                      meta["reduce_module"], meta["reduce_func"])
+                return encode_outcome((True, reduce_fn(outcomes[0][1], outcomes[1][1]))), True
+            except Exception as err: # pylint: disable=W0703
+                self._logger.error("reduction %s failed: %s", meta["reduction_id"], str(err))
+                return encode_outcome((False, err)), False
+
+    def run_stream(self, sandbox_id, manifest, meta, payload, objects):
+        """ start the generator of a streamed call, return the encoded error message
+            and True if it failed to start, empty bytes and False otherwise """
+        self.run_close()
+        with self.code_cache.activated(sandbox_id, manifest):
+            input_data = wire.decode_frame(payload)[0]
+            try:
+                func, plan = self.callables.resolve(sandbox_id, manifest_digest(manifest), \
+                                                    meta["module_name"], meta["func_name"])
+                self._generator = iter(plan.call(func, \
+                    resolve(input_data, objects, self.views)))
+            except Exception as err: # pylint: disable=W0703
+                return b"".join(wire.encode_message(wire.picklable_outcome(("error", err)))), \
+                    True
+        self._stream = (sandbox_id, manifest, meta["stream"])
+        return b"", False
+
+    def run_next(self):
+        """ the encoded messages of the next chunk of the generator and whether
+            the generator is done """
+        sandbox_id, manifest, options = self._stream
+        with self.code_cache.activated(sandbox_id, manifest):
+            return produce_chunk(self._generator, options)
+
+    def run_close(self):
+        """ stop the generator, if any """
+        if self._generator is None:
+            return None
+        sandbox_id, manifest, _ = self._stream
+        try:
+            with self.code_cache.activated(sandbox_id, manifest):
+                self._generator.close()
+        finally:
+            self._generator = None
+            self._stream = None
+        return None
+
+    def method_plan(self, instance, name):
+        """ the bound method of an actor instance and its BindingPlan """
+        method = getattr(instance, name)
+        key = (type(instance), name)
+        plan = self._method_plans.get(key)
+        if plan is None:
+            plan = BindingPlan(method)
+            self._method_plans[key] = plan
+        return method, plan
+
+    def run_actor(self, sandbox_id, manifest, meta, payload, objects):
+        """ run a batch of calls of an actor in order, "__init__" constructs the
+            instance and "__destroy__" drops it, return the encoded (succeeded,
+            value) pairs and the execution times """
+        actor_id = meta["actor_id"]
+        with self.code_cache.activated(sandbox_id, manifest):
+            calls = wire.decode_frame(payload)
+            outcomes = []
+            exec_times = []
+            for method, input_data in zip(meta["methods"], calls):
+                start = time.time()
+                try:
+                    if objects:
+                        input_data = resolve(input_data, objects, self.views)
+                    if method == "__init__":
+                        cls, plan = self.callables.resolve(sandbox_id, \
+                            manifest_digest(manifest), meta["module_name"], meta["class_name"])
+                        self.actors[actor_id] = plan.call(cls, input_data)
+                        value = None
+                    elif method == "__destroy__":
+                        value = self.actors.pop(actor_id, None) is not None
+                    elif actor_id not in self.actors:
+                        raise RuntimeError("actor {} was not constructed".format(actor_id))
+                    else:
+                        func, plan = self.method_plan(self.actors[actor_id], method)
+                        value = plan.call(func, input_data)
+                    outcomes.append((True, value))
+                except Exception as err: # pylint: disable=W0703
+                    self._logger.error("%s of actor %s failed: %s", method, actor_id, str(err))
+                    outcomes.append((False, err))
+                exec_times.append(time.time() - start)
+            return encode_outcomes(outcomes, self.spool, sandbox_id), exec_times
+
+    def run_drop(self, actor_id):
+        """ drop the instance of an actor, if any """
+        self.actors.pop(actor_id, None)
+
+    def run_service(self, sandbox_id, manifest, module_name, func_name, inputs):
+        """ call the entry point of a service once with the list of the inputs of a
+            micro-batch, it returns the list of their outputs, return the (succeeded,
+            JSON output or error message) pair of every input """
+        with self.code_cache.activated(sandbox_id, manifest):
+            try:
+                func, _ = self.callables.resolve(sandbox_id, manifest_digest(manifest), \
+                                                 module_name, func_name)
+                outputs = list(func(inputs))
+                if len(outputs) != len(inputs):
+                    raise ValueError("{} returned {} outputs for {} inputs".format(\
+                        func_name, len(outputs), len(inputs)))
+            except Exception as err: # pylint: disable=W0703
+                self._logger.error("entry point %s:%s failed: %s", module_name, func_name, \
+                                   str(err))
+                return [(False, "{}: {}".format(type(err).__name__, str(err)))] * len(inputs)
+            outcomes = []
+            for output in outputs:
+                try:
+                    outcomes.append((True, json.dumps(output)))
+                except (TypeError, ValueError) as err:
+                    outcomes.append((False, "output is not JSON serializable: " + str(err)))
+            return outcomes
+
+def worker_main(connection, code_cache_dir, spool_dir, spool_threshold):
+    """ the entry point of a worker process, replies to the tasks received over
+        the connection with (succeeded, result, resident memory) until it receives
+        None or the server closes its end """
+    # the server process handles ctrl + C and stops its workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(format='%(asctime)-15s, %(message)s', level=logging.INFO)
+    runner = TaskRunner(code_cache_dir, spool_dir, spool_threshold)
+    while True:
+        try:
+            task = connection.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        try:
+            reply = (True, runner.run(task))
+        except Exception as err: # pylint: disable=W0703
+            # the server process may not be able to unpickle the clients' exceptions
+            reply = (False, RuntimeError("{}: {}".format(type(err).__name__, str(err))))
+        connection.send(reply + (resident_memory(),))
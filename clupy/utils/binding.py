@@ -0,0 +1,77 @@
+""" the binding of call arguments to parameter names shared by clients and server nodes
+
+    A call's arguments travel as a dictionary from parameter names to values. The
+    client packs the positional and keyword arguments of a call into it, filling
+    in the defaults, and the server unpacks it into the arguments the function is
+    called with. Both sides compute the plan of a function once and reuse it for
+    every call.
+"""
+import inspect
+
+class BindingPlan(object):
+    """ the parameters of a function, computed from its full argspec, the first
+        parameter of a bound function, e.g. self of a method or of the __init__ of
+        a class, is left out since the instance supplies it """
+
+    def __init__(self, func, bound=None):
+        spec = inspect.getfullargspec(func)
+        if bound is None:
+            bound = inspect.ismethod(func) or inspect.isclass(func)
+        self.func_name = func.__name__
+        self.args = list(spec.args[1:] if bound else spec.args)
+        self.varargs = spec.varargs
+        self.varkw = spec.varkw
+        self.kwonly = list(spec.kwonlyargs)
+        defaults = spec.defaults or ()
+        self.defaults = dict(zip(self.args[len(self.args) - len(defaults):], defaults))
+        self.defaults.update(spec.kwonlydefaults or {})
+        # functions with plain positional parameters only take the fast paths
+        self.simple = not (self.varargs or self.varkw or self.kwonly)
+        self._names = set(self.args + self.kwonly)
+
+    def pack(self, args, kwargs):
+        """ the arguments of a call by parameter name with the defaults filled in,
+            raise TypeError for arguments the function would not accept """
+        if self.simple and not kwargs and len(args) == len(self.args):
+            return dict(zip(self.args, args))
+        if len(args) > len(self.args) and not self.varargs:
+            raise TypeError("{}() takes {} positional arguments but {} were given".format(\
+                self.func_name, len(self.args), len(args)))
+        packed = dict(zip(self.args, args))
+        if self.varargs:
+            packed[self.varargs] = tuple(args[len(self.args):])
+        extra = {}
+        for name, value in kwargs.items():
+            if name in self._names:
+                if name in packed:
+                    raise TypeError("{}() got multiple values for argument '{}'".format(\
+                        self.func_name, name))
+                packed[name] = value
+            elif self.varkw:
+                extra[name] = value
+            else:
+                raise TypeError("{}() got an unexpected keyword argument '{}'".format(\
+                    self.func_name, name))
+        if len(packed) < len(self._names) + (1 if self.varargs else 0):
+            for name in self.args + self.kwonly:
+                if name in packed:
+                    continue
+                if name not in self.defaults:
+                    raise TypeError("{}() missing required argument '{}'".format(\
+                        self.func_name, name))
+                packed[name] = self.defaults[name]
+        if self.varkw:
+            packed[self.varkw] = extra
+        return packed
+
+    def call(self, func, packed):
+        """ call the function with the arguments of a packed call """
+        args = [packed[name] for name in self.args]
+        if self.simple:
+            return func(*args)
+        if self.varargs:
+            args.extend(packed[self.varargs])
+        kwargs = dict((name, packed[name]) for name in self.kwonly)
+        if self.varkw:
+            kwargs.update(packed[self.varkw])
+        return func(*args, **kwargs)
@@ -0,0 +1,115 @@
+""" payload compression codecs negotiated between clients and server nodes
+
+    The sender of a payload lists the codecs it can decode in the
+    X-CluPy-Accept-Codecs header, a compressed body is tagged with the
+    codec name in the X-CluPy-Codec header.
+"""
+import time
+
+ACCEPT_HEADER = "X-CluPy-Accept-Codecs"
+CODEC_HEADER = "X-CluPy-Codec"
+COMPRESS_TIME_HEADER = "X-CluPy-Compress-Time"
+
+# codecs in the order of preference, fast ones first
+CODECS = {}
+PREFERENCE = []
+try:
+    import zlib
+    CODECS["zlib"] = (lambda data: zlib.compress(data, 1), zlib.decompress)
+    PREFERENCE.append("zlib")
+except ImportError:
+    pass
+try:
+    import bz2
+    CODECS["bz2"] = (bz2.compress, bz2.decompress)
+    PREFERENCE.append("bz2")
+except ImportError:
+    pass
+try:
+    import lzma
+    CODECS["lzma"] = (lzma.compress, lzma.decompress)
+    PREFERENCE.append("lzma")
+except ImportError:
+    pass
+
+def accept_header_value():
+    """ the value of the accept header listing all locally available codecs """
+    return ",".join(PREFERENCE)
+
+def parse_accept_header(value):
+    """ the list of codec names from an accept header value """
+    if not value:
+        return []
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+def choose_codec(accepted):
+    """ the preferred local codec the peer accepts, None if there is none """
+    for name in PREFERENCE:
+        if name in accepted:
+            return name
+    return None
+
+def compress(codec, chunks):
+    """ compress a list of byte chunks with the given codec """
+    return CODECS[codec][0](b"".join(chunks))
+
+def decompress(codec, data):
+    """ decompress data compressed by the given codec """
+    if codec not in CODECS:
+        raise ValueError("unsupported codec {}".format(codec))
+    return CODECS[codec][1](data)
+
+class CompressionStats(object):
+    """ tracks how well compression works for one kind of payload and decides
+        whether compressing is still worth it, i.e. whether the time spent
+        compressing is below the transfer time it saves
+    """
+
+    # payloads to compress before trusting the statistics
+    PROBE_COUNT = 3
+    # while compression is off, still probe once every this many payloads
+    REPROBE_INTERVAL = 100
+
+    def __init__(self, bandwidth, max_ratio=0.9, smoothing=0.3):
+        self.bandwidth = float(bandwidth) # bytes per second of the network link
+        self.max_ratio = max_ratio
+        self.smoothing = smoothing
+        self.ratio = None # smoothed compressed size / raw size
+        self.seconds_per_byte = None # smoothed compression cost
+        self.samples = 0
+        self.skipped = 0
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        self.compress_time = 0.0
+
+    def record(self, raw_size, compressed_size, seconds):
+        """ record one compressed payload """
+        ratio = compressed_size / float(max(raw_size, 1))
+        cost = seconds / float(max(raw_size, 1))
+        if self.ratio is None:
+            self.ratio = ratio
+            self.seconds_per_byte = cost
+        else:
+            self.ratio = self.smoothing * ratio + (1.0 - self.smoothing) * self.ratio
+            self.seconds_per_byte = self.smoothing * cost \
+                + (1.0 - self.smoothing) * self.seconds_per_byte
+        self.samples = self.samples + 1
+        self.raw_bytes = self.raw_bytes + raw_size
+        self.compressed_bytes = self.compressed_bytes + compressed_size
+        self.compress_time = self.compress_time + seconds
+
+    def worthwhile(self):
+        """ whether the next payload should be compressed """
+        if self.samples < CompressionStats.PROBE_COUNT:
+            return True
+        saved_time = (1.0 - self.ratio) / self.bandwidth
+        if self.ratio <= self.max_ratio and self.seconds_per_byte < saved_time:
+            return True
+        self.skipped = self.skipped + 1
+        return self.skipped % CompressionStats.REPROBE_INTERVAL == 0
+
+def timed_compress(codec, chunks):
+    """ compress chunks, returning the compressed data and the seconds it took """
+    start = time.time()
+    data = compress(codec, chunks)
+    return data, time.time() - start
@@ -1,5 +1,6 @@
 """Support master/server/client configurations"""
 
+import multiprocessing
 import os.path
 import yaml
 
@@ -21,7 +22,7 @@ class BaseConigure(object):
     def load(self, path):
         """load the configuration file"""
         with open(path) as stream:
-            self._config = yaml.load(stream)
+            self._config = yaml.safe_load(stream) or {}
 
     @property
     def config(self):
@@ -44,6 +45,44 @@ class BaseConigure(object):
             setattr(type(self), name, property(\
                 lambda self2, nam=name, defv=def_value: self2.get_int_config(nam, defv)))
 
+    def get_non_negative_int_config(self, name, default_value):
+        """ get integer value from the configuration with a default value, 0 is a
+            valid value, negative or malformed values are rejected """
+        if name not in self._config.keys():
+            return default_value
+        try:
+            val = int(self._config[name])
+        except ValueError:
+            val = -1
+        if val < 0:
+            raise ValueError("{} must be a non-negative integer, got {}".format(\
+                name, self._config[name]))
+        return val
+
+    def define_non_negative_int_config_properties(self, items):
+        """ define an array of configuration based non-negative integer values with defaults """
+        for item in items:
+            name = item[0]
+            def_value = item[1]
+            setattr(type(self), name, property(\
+                lambda self2, nam=name, defv=def_value: \
+                    self2.get_non_negative_int_config(nam, defv)))
+
+    def get_bool_config(self, name, default_value):
+        """ get boolean value from the configuration with a default value """
+        val = self._config[name] if name in self._config.keys() else default_value
+        if isinstance(val, str):
+            return val.lower() in ("1", "true", "yes", "on")
+        return bool(val)
+
+    def define_bool_config_properties(self, items):
+        """ define an array of configuration based boolean values with defaults """
+        for item in items:
+            name = item[0]
+            def_value = item[1]
+            setattr(type(self), name, property(\
+                lambda self2, nam=name, defv=def_value: self2.get_bool_config(nam, defv)))
+
     def get_string_config(self, name, default_value):
         """ get string value from the configuration with a default value """
         return self._config[name] if name in self._config.keys() else default_value
@@ -68,6 +107,7 @@ class MasterConfigure(BaseConigure):
             ("port", 7878),
             ("default_server_request_count", 10),
             ("maintenance_period", 180),
+            ("min_free_memory", 512), # megabytes, servers with less are allocated last
         ])
 
 # provide default values for unconfigured entries
@@ -82,10 +122,26 @@ class ServerConfigure(BaseConigure):
             ("port", 0),
             ("default_server_request_count", 10),
             ("failure_retry_interval", 10),
-            ("registration_interval", 200),
+            ("registration_interval", 30), # seconds between heartbeats reporting resources
+            ("execution_slots", multiprocessing.cpu_count()),
+            ("max_body_size", 1 << 31), # bytes
+            ("compression_threshold", 65536), # bytes
+            ("object_store_size", 1 << 32), # bytes of shared memory for large arguments
+            ("peer_request_timeout", 3600), # seconds, fetching partial results from peers
+            ("worker_processes", multiprocessing.cpu_count()), # processes running the calls
+            ("worker_max_tasks", 1000), # tasks before a worker process is replaced
+            ("worker_max_memory", 4096), # megabytes, a larger worker process is replaced
+            ("run_queue_depth", multiprocessing.cpu_count()), # requests waiting for a worker
+            ("retry_after", 1), # seconds a client turned away by a full run queue waits
+            ("service_max_batch_size", 32), # inputs per call of a service's entry point
+            ("service_max_batch_wait", 5), # milliseconds a service request waits for a batch
+            ("spool_threshold", 1 << 26), # bytes, larger results are fetched from the spool
+            ("spool_ttl", 3600), # seconds a spooled result is kept unless fetched
         ])
         self.define_string_config_properties([
             ("master_url", "clupy://localhost:7878"),
+            ("code_cache_dir", ".clupy_code"), # sources shipped by clients, by digest
+            ("spool_dir", ".clupy_spool"), # large results waiting to be fetched
         ])
 
     @property
@@ -95,3 +151,52 @@ class ServerConfigure(BaseConigure):
              else "clupy://localhost:{}"
         return url.format(self.port) # pylint: disable=E1101
 
+
+# provide default values for unconfigured entries
+class ClientConfigure(BaseConigure):
+    """Support configuration for client node"""
+
+    def __init__(self, path):
+        """init with a given configuration file, which is optional for clients"""
+        super(ClientConfigure, self).__init__()
+        if ClientConfigure.exists(path):
+            self.load(path)
+        else:
+            self._config = {}
+        self.define_int_config_properties([
+            ("batch_target_time", 50), # milliseconds each batched request should take
+            ("max_batch_size", 1000),
+            ("slots_per_server", 0), # 0 to use the slot count reported by each server
+            ("max_connections", 1000),
+            ("max_body_size", 1 << 31), # bytes
+            ("request_timeout", 3600), # seconds
+            ("compression_threshold", 65536), # bytes
+            ("network_bandwidth", 125000000), # bytes per second
+            ("blob_threshold", 1 << 20), # bytes, larger arguments are uploaded once per server
+            ("result_cache_memory", 1 << 28), # bytes
+            ("result_cache_disk", 1 << 32), # bytes
+            ("lease_renewal_period", 60), # seconds, must be below the master's reservation_ttl
+            ("server_idle_time", 30), # seconds before an idle server is released
+            ("stream_window", 4), # chunks of streamed items buffered on the client
+            ("stream_chunk_items", 1000), # items per streamed chunk at most
+            ("speculation_interval", 200), # milliseconds between straggler checks
+            ("speculation_percentile", 90),
+            ("speculation_threshold", 300), # percent of the percentile duration
+            ("locality_delay", 1000), # milliseconds to wait for a warm server to free up
+            ("actor_window", 4), # requests carrying calls of an actor in flight at most
+            ("result_fetch_parts", 4), # byte ranges of a spooled result fetched in parallel
+            ("result_fetch_retries", 5), # attempts resuming a range that made no progress
+            ("result_fetch_timeout", 60), # seconds a stalled range fetch waits
+        ])
+        self.define_non_negative_int_config_properties([
+            ("pipeline_depth", 1), # extra requests allowed in flight beyond the slots, 0 for none
+        ])
+        self.define_string_config_properties([
+            ("result_cache_dir", ".clupy_cache"),
+            ("stats_file", ""), # JSON-lines file receiving the latency of every call
+            ("result_spool_dir", ".clupy_results"), # spooled results being loaded
+        ])
+        self.define_bool_config_properties([
+            ("speculation", False), # re-execute stragglers, only for side effect free functions
+            ("locality", True), # prefer the servers that already ran a function
+        ])
@@ -0,0 +1,203 @@
+""" binary request/response framing shared by clients and server nodes
+
+    A frame is laid out as
+        magic (4 bytes) | buffer count n (4 bytes) | n + 1 lengths (8 bytes each)
+        | pickle stream | out-of-band buffer 1 | ... | out-of-band buffer n
+    The pickle stream uses protocol 5, contiguous buffers such as NumPy array
+    data are kept out of band so that they are written to the socket as they
+    are, and rebuilt on the receiving side as views into the received body.
+"""
+import hashlib
+import pickle
+import struct
+
+CONTENT_TYPE = "application/x-clupy-frame"
+# the seconds the server spent running each call of a batch, comma separated
+EXEC_TIME_HEADER = "X-CluPy-Exec-Time"
+# JSON object mapping the modules to import the function from to [digest, is package]
+MODULES_HEADER = "X-CluPy-Modules"
+# the package of the framework, its modules are never shipped, every node runs its own
+FRAMEWORK_PACKAGE = __name__.partition(".")[0]
+# the requests a server node runs or queues per worker process, a hint for routing
+LOAD_HEADER = "X-CluPy-Load"
+# the requests a server node runs or queues at most, clients keep no more in flight to it
+CAPACITY_HEADER = "X-CluPy-Capacity"
+FRAME_MAGIC = b"CLPY"
+HEADER_FORMAT = "!4sI"
+LENGTH_FORMAT = "!Q"
+OUT_OF_BAND = pickle.HIGHEST_PROTOCOL >= 5
+
+def is_framework_module(name):
+    """ whether the module of the given name is part of the framework, a second copy
+        of it would not share the classes the frames are encoded with """
+    return name == FRAMEWORK_PACKAGE or name.startswith(FRAMEWORK_PACKAGE + ".")
+
+class FrameError(ValueError):
+    """ raised upon receiving a malformed frame """
+
+class BlobReference(object):
+    """ stands in for a large argument value that was uploaded separately,
+        the value is the frame with the given content digest """
+
+    def __init__(self, digest):
+        self.digest = digest
+
+class SpooledResult(object):
+    """ stands in for a large result value the server wrote to its spool, the
+        value is the frame of size bytes with the given content digest, served
+        at /exec/spool/<handle> """
+
+    def __init__(self, handle, size, digest):
+        self.handle = handle
+        self.size = size
+        self.digest = digest
+
+def digest_chunks(chunks):
+    """ the content hash of an encoded frame """
+    hasher = hashlib.blake2b(digest_size=20)
+    for chunk in chunks:
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+def encode_frame(obj):
+    """ pickle obj into a list of chunks making up one frame, the buffer chunks
+        are memoryviews into the original objects and are not copied """
+    buffers = []
+    def collect(buf):
+        """ keep contiguous buffers out of band, the rest go in band """
+        try:
+            buffers.append(buf.raw())
+        except BufferError:
+            return True
+        return False
+    if OUT_OF_BAND:
+        stream = pickle.dumps(obj, protocol=5, buffer_callback=collect)
+    else:
+        stream = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    header = [struct.pack(HEADER_FORMAT, FRAME_MAGIC, len(buffers)), \
+              struct.pack(LENGTH_FORMAT, len(stream))]
+    for buf in buffers:
+        header.append(struct.pack(LENGTH_FORMAT, buf.nbytes))
+    return [b"".join(header), stream] + buffers
+
+def frame_length(chunks):
+    """ the total number of bytes of an encoded frame """
+    return sum(memoryview(chunk).nbytes for chunk in chunks)
+
+SCALAR_TYPES = (type(None), bool, int, float, complex)
+LARGE_CONTAINER = 4096 # items, larger containers are assumed to be large
+
+def may_exceed(value, threshold, depth=4):
+    """ whether the encoded frame of value may be threshold bytes or more, judged
+        generously from the sizes of its buffers, strings and containers without
+        pickling it, so that only the values that may be large are encoded to be
+        measured """
+    if isinstance(value, SCALAR_TYPES):
+        return False
+    if isinstance(value, str):
+        return 4 * len(value) >= threshold
+    if isinstance(value, (bytes, bytearray)):
+        return len(value) >= threshold
+    try:
+        return memoryview(value).nbytes >= threshold
+    except TypeError:
+        pass
+    if depth == 0:
+        return True
+    if isinstance(value, dict):
+        return len(value) >= LARGE_CONTAINER or any(may_exceed(key, threshold, depth - 1) \
+            or may_exceed(item, threshold, depth - 1) for key, item in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return len(value) >= LARGE_CONTAINER \
+            or any(may_exceed(item, threshold, depth - 1) for item in value)
+    if hasattr(value, "__dict__"):
+        return may_exceed(vars(value), threshold, depth - 1)
+    # objects of extension types, their pickled size is not known
+    return True
+
+def decode_frame(data):
+    """ unpickle a frame from bytes, the out-of-band buffers are handed to pickle
+        as slices of data without copying """
+    view = memoryview(data)
+    header_size = struct.calcsize(HEADER_FORMAT)
+    if view.nbytes < header_size:
+        raise FrameError("frame is too short")
+    magic, buffer_count = struct.unpack_from(HEADER_FORMAT, view)
+    if magic != FRAME_MAGIC:
+        raise FrameError("not a clupy frame")
+    length_size = struct.calcsize(LENGTH_FORMAT)
+    offset = header_size + (buffer_count + 1) * length_size
+    lengths = [struct.unpack_from(LENGTH_FORMAT, view, header_size + index * length_size)[0] \
+               for index in range(buffer_count + 1)]
+    if offset + sum(lengths) > view.nbytes:
+        raise FrameError("frame is truncated")
+    stream = view[offset:offset + lengths[0]]
+    offset = offset + lengths[0]
+    buffers = []
+    for length in lengths[1:]:
+        buffers.append(view[offset:offset + length])
+        offset = offset + length
+    if buffers:
+        return pickle.loads(stream, buffers=buffers)
+    return pickle.loads(stream)
+
+def picklable_outcome(outcome):
+    """ turn a (succeeded, value) outcome whose value can not be pickled into a failure """
+    try:
+        encode_frame(outcome)
+    except Exception as err: # pylint: disable=W0703
+        return (False, RuntimeError("could not pickle the outcome: {}".format(str(err))))
+    return outcome
+
+def encode_message(obj):
+    """ an encoded frame prefixed by its length, a stream of messages carries a
+        sequence of frames in one chunked response """
+    chunks = encode_frame(obj)
+    return [struct.pack(LENGTH_FORMAT, frame_length(chunks))] + chunks
+
+def encode_request(meta, payload=None):
+    """ the messages of an execution request, the meta data frame holds builtin
+        values only so that server nodes read it without importing any module of
+        the client, the payload frame, the arguments of the calls, is decoded by
+        the worker process running them """
+    chunks = encode_message(meta)
+    if payload is not None:
+        chunks = chunks + encode_message(payload)
+    return chunks
+
+def split_messages(data):
+    """ the frames of a sequence of messages as views into data, not decoded """
+    view = memoryview(data)
+    length_size = struct.calcsize(LENGTH_FORMAT)
+    frames = []
+    offset = 0
+    while offset < view.nbytes:
+        if offset + length_size > view.nbytes:
+            raise FrameError("message is truncated")
+        length = struct.unpack_from(LENGTH_FORMAT, view, offset)[0]
+        offset = offset + length_size
+        if offset + length > view.nbytes:
+            raise FrameError("message is truncated")
+        frames.append(view[offset:offset + length])
+        offset = offset + length
+    return frames
+
+class MessageReader(object):
+    """ splits the bytes of a stream of messages, received in arbitrary pieces,
+        back into the encoded objects """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        """ add received bytes, return the objects of the messages completed by them """
+        self._buffer.extend(data)
+        length_size = struct.calcsize(LENGTH_FORMAT)
+        objs = []
+        while len(self._buffer) >= length_size:
+            length = struct.unpack_from(LENGTH_FORMAT, self._buffer)[0]
+            if len(self._buffer) < length_size + length:
+                break
+            objs.append(decode_frame(bytes(self._buffer[length_size:length_size + length])))
+            del self._buffer[:length_size + length]
+        return objs
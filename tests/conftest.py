@@ -0,0 +1,79 @@
+""" fixtures shared by the tests """
+import os
+import pickle
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+import pytest
+import clupy
+from clupy.client.execution import RemoteExecutionServiceSingleton
+from clupy.server.execution import ServerExecutionServiceSingleton
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(autouse=True)
+def isolated_node(tmp_path, monkeypatch):
+    """ every test runs in a working directory of its own, where the default cache
+        directories end up, and with a fresh server execution service, whose
+        worker processes are stopped afterwards """
+    monkeypatch.chdir(tmp_path)
+    yield
+    if ServerExecutionServiceSingleton.instance is not None:
+        ServerExecutionServiceSingleton.instance.stop()
+        ServerExecutionServiceSingleton.instance = None
+
+def free_port():
+    """ a port nothing listens on at the moment """
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+def start_node(node_dir, option, config_file, config):
+    """ start a master or server node in a process of its own working in node_dir """
+    os.makedirs(node_dir)
+    with open(os.path.join(node_dir, config_file), "w", encoding="utf-8") as stream:
+        stream.write("".join("{}: {}\n".format(key, value) for key, value in config.items()))
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+    with open(os.path.join(node_dir, "node.log"), "wb") as log:
+        return subprocess.Popen([sys.executable, "-m", "clupy", option], cwd=node_dir, \
+                                env=env, stdout=log, stderr=subprocess.STDOUT)
+
+@pytest.fixture(scope="module")
+def cluster(tmp_path_factory):
+    """ a master and a server node running as processes of their own, with the
+        remote execution service of the tests pointed at the master, yields the
+        spool threshold of the server """
+    root = tmp_path_factory.mktemp("cluster")
+    port = free_port()
+    master_url = "clupy://localhost:{}".format(port)
+    spool_threshold = 1 << 20
+    nodes = [start_node(str(root / "master"), "-m", "clupy.master.yaml", \
+                        {"port": port, "url": master_url})]
+    nodes.append(start_node(str(root / "server"), "-s", "clupy.server.yaml", \
+                            {"port": 0, "server_url": "clupy://localhost:{}", \
+                             "master_url": master_url, "worker_processes": 1, \
+                             "spool_threshold": spool_threshold}))
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                with urllib.request.urlopen("http://localhost:{}/info".format(port)) as reply:
+                    if pickle.loads(reply.read()):
+                        break
+            except OSError:
+                pass
+            if time.time() > deadline:
+                raise RuntimeError("the server node did not register, see {}".format(root))
+            time.sleep(0.2)
+        clupy.set_master_url(master_url)
+        yield spool_threshold
+        if RemoteExecutionServiceSingleton.instance is not None:
+            clupy.stop_remote_execution()
+    finally:
+        RemoteExecutionServiceSingleton.instance = None
+        RemoteExecutionServiceSingleton.master_url = None
+        for node in nodes:
+            node.terminate()
+            node.wait()
@@ -0,0 +1,233 @@
+""" tests of stateful remote actors """
+import asyncio
+from concurrent.futures import Future
+import pytest
+from tornado import gen
+from clupy.client.actors import ActorHandle
+from clupy.client.execution import RemoteExecutionServiceSingleton, RemoteExecutionFuture
+from clupy.client.servers import RemoteServerInfo
+from clupy.server.actors import ActorRegistry, ServerActor
+from clupy.server.code import CodeCache
+from clupy.server.pool import WorkerPool
+from clupy.server.spool import ResultSpool
+from clupy.server.worker import TaskRunner
+from clupy.utils import wire
+from clupy.utils.config import ClientConfigure
+
+COUNTER = b"class Counter(object):\n" \
+          b"    def __init__(self, start):\n" \
+          b"        self.total = start\n" \
+          b"    def add(self, count=1):\n" \
+          b"        self.total = self.total + count\n" \
+          b"        return self.total\n"
+
+class Counter(object):
+    """ the client side class of an actor """
+    def __init__(self, start):
+        self.total = start
+
+    def add(self, count=1):
+        """ a method of the actor """
+        self.total = self.total + count
+        return self.total
+
+    @staticmethod
+    def describe(text):
+        """ a static method, it has no instance parameter """
+        return text
+
+    limit = 10
+
+@pytest.fixture
+def counter_module(tmp_path):
+    """ the code cache directory and the manifest of the module of the Counter class """
+    cache_dir = str(tmp_path / "code")
+    digest = wire.digest_chunks([COUNTER])
+    CodeCache(cache_dir).put(digest, COUNTER)
+    return cache_dir, {"counters": [digest, False]}
+
+def actor_task(manifest, methods, calls):
+    """ the task running calls of the actor "a" of the Counter class """
+    meta = {"actor_id": "a", "module_name": "counters", "class_name": "Counter", \
+            "methods": methods}
+    return ("actor", "sandbox", manifest, meta, b"".join(wire.encode_frame(calls)), {})
+
+def test_actor_instances_keep_their_state(counter_module):
+    """ the calls of an actor run in order against the instance constructed first """
+    cache_dir, manifest = counter_module
+    runner = TaskRunner(cache_dir, "spool", 1 << 26)
+    frame, exec_times = runner.run(actor_task(manifest, ["__init__", "add", "add"], \
+        [{"start": 5}, {"count": 1}, {"count": 10}]))
+    assert wire.decode_frame(frame) == [(True, None), (True, 6), (True, 16)]
+    assert len(exec_times) == 3
+    frame, _ = runner.run(actor_task(manifest, ["add", "__destroy__", "add"], \
+        [{"count": 1}, {}, {"count": 1}]))
+    outcomes = wire.decode_frame(frame)
+    assert outcomes[:2] == [(True, 17), (True, True)]
+    assert not outcomes[2][0] and isinstance(outcomes[2][1], RuntimeError)
+
+def test_actor_method_failures_keep_the_instance(counter_module):
+    """ a failing method call fails on its own, the instance lives on """
+    cache_dir, manifest = counter_module
+    runner = TaskRunner(cache_dir, "spool", 1 << 26)
+    frame, _ = runner.run(actor_task(manifest, ["__init__", "add", "missing", "add"], \
+        [{"start": 0}, {"count": "x"}, {}, {"count": 2}]))
+    outcomes = wire.decode_frame(frame)
+    assert isinstance(outcomes[1][1], TypeError)
+    assert isinstance(outcomes[2][1], AttributeError)
+    assert outcomes[3] == (True, 2)
+    runner.run(("drop", "a"))
+    assert not runner.actors
+
+def test_server_actor_orders_batches():
+    """ batches arriving out of order run in the order of their sequence numbers """
+    actor = ServerActor(None)
+    order = []
+    @gen.coroutine
+    def run_batch(seq, count):
+        yield actor.wait_turn(seq)
+        order.append(seq)
+        actor.advance(count)
+    async def run_all():
+        await gen.multi([run_batch(5, 1), run_batch(2, 3), run_batch(0, 2)])
+    asyncio.run(run_all())
+    assert order == [0, 2, 5]
+
+class FakePool(object):
+    """ a pool of named workers counting the actors pinned to them """
+    def __init__(self):
+        self.pinned = {"w1": 0, "w2": 0}
+
+    def pin(self):
+        """ the worker with the fewest actors """
+        worker = min(self.pinned, key=lambda name: (self.pinned[name], name))
+        self.pinned[worker] = self.pinned[worker] + 1
+        return worker
+
+    def unpin(self, worker):
+        """ an actor of the worker was destroyed """
+        self.pinned[worker] = self.pinned[worker] - 1
+
+def test_actors_are_spread_over_the_workers():
+    """ actors are pinned to the worker with the fewest actors, destroyed ones stay gone """
+    pool = FakePool()
+    registry = ActorRegistry(pool)
+    first = registry.get("a")
+    assert registry.get("a") is first
+    assert registry.get("b").worker != first.worker
+    assert registry.remove("a") is first and first.destroyed
+    assert registry.get("a") is None
+    assert registry.remove("a") is None
+    assert pool.pinned == {"w1": 0, "w2": 1}
+
+def test_pinned_workers_are_not_recycled(counter_module):
+    """ a worker an actor is pinned to keeps running past max_tasks """
+    cache_dir, manifest = counter_module
+    pool = WorkerPool(1, cache_dir, 1, 1 << 40, ResultSpool("spool", 1 << 26))
+    async def run():
+        worker = pool.pin()
+        outcomes = []
+        for methods, calls in ((["__init__"], [{"start": 1}]), (["add"], [{"count": 1}]), \
+                               (["add"], [{"count": 3}])):
+            frame, _ = await pool.run(actor_task(manifest, methods, calls), worker)
+            outcomes.extend(wire.decode_frame(frame))
+        return worker, outcomes
+    try:
+        worker, outcomes = asyncio.run(run())
+        assert outcomes == [(True, None), (True, 2), (True, 5)]
+        assert worker.task_count == 3
+    finally:
+        pool.stop()
+
+def test_handle_methods_skip_the_instance():
+    """ the plans of an actor's methods leave self out, attributes are not methods """
+    handle = ActorHandle(None, Counter, "a", None)
+    assert handle.add._plan.pack((2,), {}) == {"count": 2} # pylint: disable=W0212
+    assert handle.add is handle.add
+    assert handle.describe._plan.pack(("t",), {}) == {"text": "t"} # pylint: disable=W0212
+    with pytest.raises(AttributeError):
+        handle.limit # pylint: disable=W0104
+    with pytest.raises(AttributeError):
+        handle._hidden # pylint: disable=W0104,W0212
+
+class FakeService(object):
+    """ stands in for the remote execution service owning the worker """
+
+    def __init__(self, config):
+        self.config = config
+
+class FakeLoop(object):
+    """ records the futures the worker waits for """
+    def __init__(self):
+        self.waiting = []
+
+    def add_future(self, future, callback):
+        """ keep the future and the callback to run on its completion """
+        self.waiting.append((future, callback))
+
+def make_worker(tmp_path, settings):
+    """ a worker sending the calls of actors to a server, the requests stay in flight
+        until the test completes them """
+    path = tmp_path / "clupy.client.yaml"
+    path.write_text(settings)
+    worker = RemoteExecutionServiceSingleton.RemoteExecutionService.RemoteExecutionWorker(\
+        FakeService(ClientConfigure(str(path))))
+    worker.io_loop = FakeLoop()
+    worker.sent = []
+    def execute_batch_call(batch, server, timing): # pylint: disable=W0613
+        worker.sent.append([(call.func_name, call.seq) for call in batch])
+        return Future()
+    worker.execute_batch_call = execute_batch_call
+    worker.request_servers = lambda server_count: None
+    worker.carry_out_executions = lambda: None
+    worker.maintain_server_states = lambda: None
+    server = RemoteServerInfo("clupy://server")
+    worker._server_list.append(server)
+    return worker, server
+
+def complete_request(worker, index, outcomes):
+    """ complete the request index of the requests in flight """
+    future, callback = worker.io_loop.waiting[index]
+    future.set_result(outcomes)
+    callback(future)
+
+def test_actor_calls_are_sent_in_order(tmp_path):
+    """ calls go to the actor's server in sequence numbered batches, within the window """
+    worker, server = make_worker(tmp_path, "actor_window: 2\nmax_batch_size: 2\n")
+    futures = [RemoteExecutionFuture(None) for _ in range(6)]
+    worker.create_actor_request(Counter, {"start": 1}, "a", futures[0], 0)
+    for future in futures[1:]:
+        worker.call_actor_request("a", "add", {"count": 1}, future)
+    assert server.actors == {"a"}
+    assert worker.sent == [[("__init__", 0), ("add", 1)], [("add", 2)]]
+    complete_request(worker, 0, [(True, None), (True, 2)])
+    assert futures[1].value == 2
+    assert worker.sent[2] == [("add", 3), ("add", 4)]
+
+def test_failed_requests_break_the_actor(tmp_path):
+    """ a failed request fails the queued and the later calls of the actor """
+    worker, server = make_worker(tmp_path, "actor_window: 1\nmax_batch_size: 1\n")
+    futures = [RemoteExecutionFuture(None) for _ in range(3)]
+    worker.create_actor_request(Counter, {"start": 1}, "a", futures[0], 0)
+    worker.call_actor_request("a", "add", {"count": 1}, futures[1])
+    future, callback = worker.io_loop.waiting[0]
+    future.set_exception(ConnectionError("server gone"))
+    callback(future)
+    assert isinstance(futures[0].failure, ConnectionError)
+    assert isinstance(futures[1].failure, ConnectionError)
+    assert len(worker.sent) == 1
+    worker.call_actor_request("a", "add", {"count": 1}, futures[2])
+    assert futures[2].failure is not None
+    assert "a" not in worker._actors and not server.actors # pylint: disable=W0212
+
+def test_destroyed_actors_are_forgotten(tmp_path):
+    """ the actor is removed once its destruction ran, later calls fail """
+    worker, server = make_worker(tmp_path, "actor_window: 4\n")
+    futures = [RemoteExecutionFuture(None) for _ in range(3)]
+    worker.create_actor_request(Counter, {"start": 1}, "a", futures[0], 0)
+    worker.call_actor_request("a", "__destroy__", {}, futures[1])
+    complete_request(worker, 0, [(True, None), (True, True)])
+    assert futures[1].value is True
+    assert "a" not in worker._actors and not server.actors # pylint: disable=W0212
+    worker.call_actor_request("a", "add", {"count": 1}, futures[2])
+    assert isinstance(futures[2].failure, RuntimeError)
@@ -0,0 +1,122 @@
+""" tests of the bounded run queue of server nodes and the routing away from busy servers """
+import time
+from concurrent.futures import Future
+import tornado.testing
+import tornado.web
+from clupy.client.admission import ServerBusyError
+from clupy.client.batching import AdaptiveBatchSizer, OneExecutionRequestContext
+from clupy.client.execution import RemoteExecutionServiceSingleton, RemoteFunctionContext, \
+    PayloadCompressionStats, RemoteExecutionFuture
+from clupy.client.servers import RemoteServerInfo
+from clupy.server.admission import AdmissionControl
+from clupy.server.execution import ServerExecutionServiceSingleton, ExecuteFunctionHandler
+from clupy.utils import wire
+from clupy.utils.config import ClientConfigure, ServerConfigure
+
+def test_admission_is_bounded():
+    """ one request per worker runs and queue_depth more wait, the others are turned away """
+    admission = AdmissionControl(2, 1, 5)
+    assert [admission.admit() for _ in range(4)] == [True, True, True, False]
+    assert admission.load_header() == "1.500"
+    admission.leave()
+    assert admission.admit()
+    assert admission.load() == 1.5
+
+def test_busy_servers_get_no_requests():
+    """ a server that turned a request away has no free slot until its Retry-After passed """
+    server = RemoteServerInfo("clupy://a")
+    server.sandbox_id = "a"
+    server.record_load({wire.LOAD_HEADER: "0.5"})
+    assert server.load == 0.5 and server.free_slots() == 1
+    server.record_load({wire.LOAD_HEADER: "3.000", "Retry-After": "2"}, busy=True)
+    assert server.load == 3.0 and server.free_slots() == 0
+    assert server.retry_time > time.time() + 1
+    server.retry_time = time.time() - 1
+    assert server.free_slots() == 1
+
+class FakeService(object):
+    """ stands in for the remote execution service owning the worker """
+
+    def __init__(self, config):
+        self.config = config
+
+def make_worker(tmp_path):
+    """ a worker with two idle servers and a function f, recording its dispatches """
+    config = ClientConfigure(str(tmp_path / "missing.yaml"))
+    worker = RemoteExecutionServiceSingleton.RemoteExecutionService.RemoteExecutionWorker(\
+        FakeService(config))
+    worker.dispatched = []
+    def dispatch_batch(batch, server, speculative=False): # pylint: disable=W0613
+        batch.copies[server] = (time.time(), False)
+        server.in_flight.append(batch)
+        worker.dispatched.append((batch, server.server_url))
+    worker.dispatch_batch = dispatch_batch
+    worker.retry_held_back = lambda retry_time: None
+    worker.maintain_server_states = lambda: None
+    worker._function_list["f"] = RemoteFunctionContext(AdaptiveBatchSizer(0.05, 1), \
+        PayloadCompressionStats(config.network_bandwidth), None)
+    for url in ("clupy://a", "clupy://b"):
+        server = RemoteServerInfo(url)
+        server.sandbox_id = url
+        worker._server_list.append(server)
+    return worker
+
+def queue_call(worker):
+    """ queue a call of f """
+    call = OneExecutionRequestContext(RemoteExecutionFuture(None), "f", "f.py", "f", {"x": 1})
+    worker._scheduler.push(call) # pylint: disable=W0212
+    return call
+
+def test_least_loaded_server_is_preferred(tmp_path):
+    """ among equally warm servers, the least loaded one gets the batch """
+    worker = make_worker(tmp_path)
+    worker._server_list[0].load = 2.0 # pylint: disable=W0212
+    worker._server_list[1].load = 0.5 # pylint: disable=W0212
+    queue_call(worker)
+    worker.carry_out_executions()
+    assert [url for _, url in worker.dispatched] == ["clupy://b"]
+
+def test_turned_away_calls_are_routed_elsewhere(tmp_path):
+    """ calls a busy server turned away are requeued and sent to another server """
+    worker = make_worker(tmp_path)
+    call = queue_call(worker)
+    worker.carry_out_executions()
+    batch, busy_url = worker.dispatched[0]
+    busy = list(batch.copies)[0]
+    busy.record_load({"Retry-After": "30"}, busy=True)
+    future = Future()
+    future.set_exception(ServerBusyError("busy"))
+    worker.complete_batch_execution(future, batch, busy, False, {})
+    assert call.future_object.failure is None and not call.future_object.completed
+    assert len(worker.dispatched) == 2
+    retried, url = worker.dispatched[1]
+    assert url != busy_url and retried.calls == [call]
+    assert not busy.in_flight
+
+class AdmissionHandlerTest(tornado.testing.AsyncHTTPTestCase):
+    """ the node turns calls away while its run queue is full """
+
+    def get_app(self):
+        path = self.get_tmp_config()
+        config = ServerConfigure(path)
+        self.service = ServerExecutionServiceSingleton(config)
+        return tornado.web.Application([\
+            (r"/exec/run/(.*)", ExecuteFunctionHandler, dict(config=config))])
+
+    @staticmethod
+    def get_tmp_config():
+        """ a configuration of one worker process and a run queue of one request """
+        with open("clupy.server.yaml", "w", encoding="utf-8") as stream:
+            stream.write("worker_processes: 1\nrun_queue_depth: 1\nretry_after: 3\n")
+        return "clupy.server.yaml"
+
+    def test_full_run_queue_turns_calls_away(self):
+        """ a call arriving at a full run queue gets 503, Retry-After and the load hint """
+        self.service.admission.admitted = self.service.admission.capacity
+        request = {"op": "call", "module_name": "m", "file_name": "m.py", "func_name": "f", \
+                   "blobs": []}
+        response = self.fetch("/exec/run/sandbox", method="POST", \
+            body=b"".join(wire.encode_request(request, wire.encode_frame([{}]))))
+        assert response.code == 503
+        assert response.headers["Retry-After"] == "3"
+        assert response.headers[wire.LOAD_HEADER] == "2.000"
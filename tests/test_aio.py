@@ -0,0 +1,52 @@
+""" tests of the asyncio client API """
+import asyncio
+import threading
+import pytest
+from clupy.client.aio import AsyncRemoteExecutionService
+from clupy.client.execution import RemoteExecutionFuture
+
+def complete(future, result=None, excep=None):
+    """ complete a future the way the execution worker does """
+    future.value = result
+    future.failure = excep
+    future.do_complete_callback(result, excep)
+
+def test_await_future_completed_on_the_loop():
+    """ a future completed on the loop's thread is awaited directly """
+    async def main():
+        future = RemoteExecutionFuture(None)
+        asyncio.get_event_loop().call_later(0.01, complete, future, 7)
+        return await future
+    assert asyncio.run(main()) == 7
+
+def test_await_future_completed_by_another_thread():
+    """ futures completed on another thread, as clupy.parallel does, are handed over """
+    async def main():
+        future = RemoteExecutionFuture(None)
+        threading.Timer(0.01, complete, (future, "remote")).start()
+        return await asyncio.wait_for(future, 5)
+    assert asyncio.run(main()) == "remote"
+
+def test_await_failed_future():
+    """ awaiting a failed call raises its failure """
+    async def main():
+        future = RemoteExecutionFuture(None)
+        complete(future, excep=KeyError("missing"))
+        await future
+    with pytest.raises(KeyError):
+        asyncio.run(main())
+    async def main_text():
+        future = RemoteExecutionFuture(None)
+        complete(future, excep="remote traceback")
+        await future
+    with pytest.raises(RuntimeError, match="remote traceback"):
+        asyncio.run(main_text())
+
+def test_one_service_per_event_loop():
+    """ the asyncio service is bound to the running event loop """
+    async def main():
+        return AsyncRemoteExecutionService.current(), AsyncRemoteExecutionService.current()
+    first, second = asyncio.run(main())
+    assert first is second
+    other, _ = asyncio.run(main())
+    assert other is not first
@@ -0,0 +1,49 @@
+""" tests of the adaptive sizing of batched requests """
+from clupy.client.batching import AdaptiveBatchSizer
+from clupy.utils.config import ClientConfigure
+
+def test_probes_with_a_single_call():
+    """ the first batch is a single call, until a round trip is measured """
+    sizer = AdaptiveBatchSizer(0.05, 1000)
+    assert sizer.next_batch_size() == 1
+
+def test_grows_at_most_twofold():
+    """ a fast function doubles its batch size per request """
+    sizer = AdaptiveBatchSizer(0.05, 1000)
+    sizes = []
+    for _ in range(5):
+        size = sizer.next_batch_size()
+        sizes.append(size)
+        sizer.record(size, size * 0.0001)
+    assert sizes == [1, 2, 4, 8, 16]
+
+def test_converges_to_the_target_time():
+    """ the batch size settles where a request takes about target_time """
+    sizer = AdaptiveBatchSizer(0.05, 1000)
+    for _ in range(50):
+        size = sizer.next_batch_size()
+        sizer.record(size, size * 0.001)
+    assert sizer.next_batch_size() == 50
+
+def test_bounded_by_max_batch_size():
+    """ the batch size never exceeds max_batch_size """
+    sizer = AdaptiveBatchSizer(10.0, 8)
+    for _ in range(10):
+        size = sizer.next_batch_size()
+        sizer.record(size, size * 0.0001)
+    assert sizer.next_batch_size() == 8
+
+def test_slow_calls_are_sent_one_by_one():
+    """ calls taking longer than target_time are never batched """
+    sizer = AdaptiveBatchSizer(0.05, 1000)
+    sizer.record(1, 2.0)
+    assert sizer.next_batch_size() == 1
+
+def test_batch_settings_are_configurable(tmp_path):
+    """ clupy.client.yaml is optional, the batch settings default to 50 ms and 1000 calls """
+    assert ClientConfigure(str(tmp_path / "missing.yaml")).batch_target_time == 50
+    path = tmp_path / "clupy.client.yaml"
+    path.write_text("batch_target_time: 20\nmax_batch_size: 64\n")
+    config = ClientConfigure(str(path))
+    assert config.batch_target_time == 20
+    assert config.max_batch_size == 64
@@ -0,0 +1,107 @@
+""" tests of the binding of call arguments to parameter names """
+import pytest
+from clupy.server.code import CodeCache
+from clupy.server.worker import TaskRunner
+from clupy.utils import wire
+from clupy.utils.binding import BindingPlan
+
+def simple(a, b, c=3):
+    """ plain positional parameters """
+    return a, b, c
+
+def varied(a, *rest, key=None, **extra):
+    """ every kind of parameter """
+    return a, rest, key, extra
+
+class Counter(object):
+    """ a class whose __init__ and methods are bound """
+    def __init__(self, start, step=1):
+        self.start = start
+        self.step = step
+
+    def add(self, count):
+        """ a bound method """
+        return self.start + count * self.step
+
+def round_trip(func, *args, **kwargs):
+    """ call func through its binding plan """
+    plan = BindingPlan(func)
+    return plan.call(func, plan.pack(args, kwargs))
+
+def test_simple_functions():
+    """ positional, keyword and default arguments """
+    assert BindingPlan(simple).simple
+    assert BindingPlan(simple).pack((1, 2, 3), {}) == {"a": 1, "b": 2, "c": 3}
+    assert round_trip(simple, 1, 2) == (1, 2, 3)
+    assert round_trip(simple, 1, c=5, b=2) == (1, 2, 5)
+
+def test_varied_parameters():
+    """ varargs, keyword only and varkw parameters """
+    assert not BindingPlan(varied).simple
+    assert round_trip(varied, 1) == (1, (), None, {})
+    assert round_trip(varied, 1, 2, 3, key="k", other=4) == (1, (2, 3), "k", {"other": 4})
+
+def test_bound_callables():
+    """ the instance of a bound method and of a class is not a parameter """
+    plan = BindingPlan(Counter)
+    assert plan.pack((10,), {}) == {"start": 10, "step": 1}
+    counter = Counter(10, 2)
+    assert round_trip(counter.add, 3) == 16
+
+def test_rejected_arguments():
+    """ arguments the function would not accept raise TypeError """
+    plan = BindingPlan(simple)
+    with pytest.raises(TypeError):
+        plan.pack((1, 2, 3, 4), {})
+    with pytest.raises(TypeError):
+        plan.pack((1,), {"a": 2})
+    with pytest.raises(TypeError):
+        plan.pack((1,), {})
+    with pytest.raises(TypeError):
+        plan.pack((1, 2), {"d": 4})
+
+def shipped(cache_dir, source):
+    """ put the source of a module named shipped into the code cache, return its manifest """
+    digest = wire.digest_chunks([source])
+    CodeCache(cache_dir).put(digest, source)
+    return {"shipped": [digest, False]}
+
+def run_calls(runner, manifest, calls, func_name="scale"):
+    """ run a batch of packed calls of a shipped function, return their outcomes """
+    meta = {"op": "call", "module_name": "shipped", "file_name": "shipped.py", \
+            "func_name": func_name}
+    frame, exec_times, partial = runner.run(("calls", "sandbox", manifest, meta, \
+        b"".join(wire.encode_frame(calls)), {}))
+    assert len(exec_times) == len(calls) and partial is None
+    return wire.decode_frame(frame)
+
+def test_calls_use_binding_plans(tmp_path):
+    """ packed calls are unpacked with the plan of the function resolved once """
+    cache_dir = str(tmp_path / "code")
+    manifest = shipped(cache_dir, b"def scale(value, *rest, factor=2):\n" \
+                                  b"    return value * factor + sum(rest)\n")
+    runner = TaskRunner(cache_dir, "spool", 1 << 26)
+    outcomes = run_calls(runner, manifest, [{"value": 1, "rest": (), "factor": 2}, \
+                                            {"value": 1, "rest": (5,), "factor": 3}])
+    assert outcomes == [(True, 2), (True, 8)]
+    assert len(runner.callables._entries) == 1 # pylint: disable=W0212
+    outcomes = run_calls(runner, manifest, [{"value": 1}])
+    assert not outcomes[0][0] and isinstance(outcomes[0][1], KeyError)
+
+def test_edited_code_is_resolved_again(tmp_path):
+    """ a function is resolved again once the shipped code changed """
+    cache_dir = str(tmp_path / "code")
+    runner = TaskRunner(cache_dir, "spool", 1 << 26)
+    first = shipped(cache_dir, b"def scale(value):\n    return value * 2\n")
+    assert run_calls(runner, first, [{"value": 3}]) == [(True, 6)]
+    second = shipped(cache_dir, b"def scale(value):\n    return value * 10\n")
+    assert run_calls(runner, second, [{"value": 3}]) == [(True, 30)]
+
+def test_unresolvable_functions_fail_every_call(tmp_path):
+    """ a function missing from its module fails all the calls of the batch """
+    cache_dir = str(tmp_path / "code")
+    manifest = shipped(cache_dir, b"def scale(value):\n    return value\n")
+    runner = TaskRunner(cache_dir, "spool", 1 << 26)
+    outcomes = run_calls(runner, manifest, [{"value": 1}, {"value": 2}], func_name="missing")
+    assert [succeeded for succeeded, _ in outcomes] == [False, False]
+    assert isinstance(outcomes[0][1], AttributeError)
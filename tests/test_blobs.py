@@ -0,0 +1,65 @@
+""" tests of the content addressed upload of large arguments """
+import os
+import tempfile
+import tornado.testing
+import tornado.web
+from clupy.client.batching import OneExecutionRequestContext
+from clupy.server.execution import QueryBlobsHandler, UploadBlobHandler
+from clupy.utils import wire
+from clupy.utils.config import ServerConfigure
+
+def blob(value):
+    """ the digest and the encoded frame of value """
+    chunks = wire.encode_frame(value)
+    return wire.digest_chunks(chunks), b"".join(chunks)
+
+def test_large_arguments_become_references():
+    """ argument values of blob_threshold bytes or more are replaced by references """
+    large = b"x" * 4096
+    context = OneExecutionRequestContext(None, "key", "file.py", "func", \
+                                         {"small": 1, "large": large})
+    wire_input = context.prepare_input(1024)
+    assert wire_input["small"] == 1
+    assert isinstance(wire_input["large"], wire.BlobReference)
+    digest = wire_input["large"].digest
+    assert digest == blob(large)[0]
+    assert wire.decode_frame(b"".join(context.blobs[digest])) == large
+    assert context.prepare_input(1024) is wire_input
+
+def test_equal_values_share_a_digest():
+    """ the digest depends on the content only """
+    assert blob(list(range(1000)))[0] == blob(list(range(1000)))[0]
+    assert blob(list(range(1000)))[0] != blob(list(range(1001)))[0]
+
+class BlobHandlersTest(tornado.testing.AsyncHTTPTestCase):
+    """ the blob query and upload end points """
+
+    def get_app(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".yaml", delete=False) as stream:
+            stream.write("worker_processes: 1\n")
+        self.addCleanup(os.remove, stream.name)
+        config = ServerConfigure(stream.name)
+        return tornado.web.Application([
+            (r"/exec/blobs", QueryBlobsHandler, dict(config=config)),
+            (r"/exec/blob/(.*)", UploadBlobHandler, dict(config=config)),
+        ])
+
+    def query(self, digests):
+        """ the digests the node misses among the given ones """
+        response = self.fetch("/exec/blobs", method="POST", \
+                              body=b"".join(wire.encode_frame(digests)))
+        assert response.code == 200
+        return wire.decode_frame(response.body)
+
+    def test_upload_then_query(self):
+        """ an uploaded blob is no longer reported missing """
+        digest, data = blob(os.urandom(5000))
+        assert self.query([digest]) == [digest]
+        assert self.fetch("/exec/blob/" + digest, method="PUT", body=data).code == 200
+        assert self.query([digest]) == []
+
+    def test_corrupt_upload(self):
+        """ an upload not matching its digest is rejected """
+        digest, _ = blob("expected")
+        response = self.fetch("/exec/blob/" + digest, method="PUT", body=blob("other")[1])
+        assert response.code == 400
@@ -0,0 +1,99 @@
+""" tests of the client side result cache """
+import os
+import pytest
+from clupy.client.cache import ResultCacheSingleton, function_digest
+from clupy.client.execution import RemoteExecutionFuture, cached_call
+
+ResultCache = ResultCacheSingleton.ResultCache
+
+def square(value):
+    """ a function whose results get cached """
+    return value * value
+
+def cube(value):
+    """ another function with the same arguments """
+    return value * value * value
+
+def test_keys_depend_on_function_and_arguments(tmp_path):
+    """ equal calls share a key, other functions or arguments do not """
+    cache = ResultCache(1 << 20, str(tmp_path), 1 << 20)
+    key = cache.make_key(square, {"value": 3})
+    assert key == cache.make_key(square, {"value": 3})
+    assert key != cache.make_key(square, {"value": 4})
+    assert key != cache.make_key(cube, {"value": 3})
+    assert function_digest(square) != function_digest(cube)
+
+def test_memory_and_disk_hits(tmp_path):
+    """ results are found in memory, and on disk by a later cache """
+    cache = ResultCache(1 << 20, str(tmp_path), 1 << 20)
+    key = cache.make_key(square, {"value": 3})
+    assert cache.get(key) == (False, None)
+    cache.put(key, 9)
+    assert cache.get(key) == (True, 9)
+    later = ResultCache(1 << 20, str(tmp_path), 1 << 20)
+    assert later.disk_used == cache.disk_used > 0
+    assert later.get(key) == (True, 9)
+    assert later.get(key) == (True, 9)
+    assert cache.info()["misses"] == 1 and cache.info()["memory_hits"] == 1
+    assert later.info()["disk_hits"] == 1 and later.info()["memory_hits"] == 1
+
+def test_memory_tier_is_bounded():
+    """ the least recently used results are evicted from memory """
+    cache = ResultCache(2500, "", 0)
+    keys = [cache.make_key(square, {"value": index}) for index in range(3)]
+    for key in keys:
+        cache.put(key, b"x" * 1000)
+    assert cache.memory_used <= 2500
+    assert not cache.get(keys[0])[0]
+    assert cache.get(keys[2])[0]
+
+def test_disk_tier_is_bounded(tmp_path):
+    """ the oldest files are evicted once the disk tier is full """
+    cache = ResultCache(0, str(tmp_path), 2500)
+    keys = [cache.make_key(square, {"value": index}) for index in range(3)]
+    for index, key in enumerate(keys):
+        cache.put(key, b"x" * 1000)
+        os.utime(os.path.join(str(tmp_path), key), (index, index))
+    cache.put(cache.make_key(square, {"value": 4}), b"x" * 1000)
+    assert cache.disk_used <= 2500
+    assert not os.path.exists(os.path.join(str(tmp_path), keys[0]))
+
+def test_unpicklable_results_are_not_cached(tmp_path):
+    """ results that can not be encoded are skipped """
+    cache = ResultCache(1 << 20, str(tmp_path), 1 << 20)
+    key = cache.make_key(square, {"value": 1})
+    cache.put(key, lambda: None)
+    assert not cache.get(key)[0]
+
+class FakeService(object):
+    """ stands in for the remote execution service, completing calls locally """
+
+    config = None
+
+    def __init__(self):
+        self.calls = 0
+
+    def func_wrapped(self, packed, func, server_count, priority=0, weight=1): # pylint: disable=W0613
+        """ run the call locally and count it """
+        self.calls = self.calls + 1
+        future = RemoteExecutionFuture(None)
+        future.value = func(**packed)
+        future.do_complete_callback(future.value, None)
+        return future
+
+@pytest.fixture
+def result_cache(tmp_path):
+    """ a result cache singleton storing its files in a temporary directory """
+    saved = ResultCacheSingleton.instance
+    ResultCacheSingleton.instance = ResultCache(1 << 20, str(tmp_path), 1 << 20)
+    yield ResultCacheSingleton.instance
+    ResultCacheSingleton.instance = saved
+
+def test_cached_calls_skip_the_cluster(result_cache):
+    """ a repeated call completes from the cache without being executed again """
+    service = FakeService()
+    assert cached_call(service, {"value": 5}, square, 0, 0, 1).value == 25
+    future = cached_call(service, {"value": 5}, square, 0, 0, 1)
+    assert future.completed and future.successful and future.value == 25
+    assert service.calls == 1
+    assert result_cache.info()["memory_hits"] == 1
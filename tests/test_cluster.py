@@ -0,0 +1,40 @@
+""" end to end tests of remote calls against master and server nodes running
+    in processes of their own """
+import pytest
+import clupy
+
+def size(data):
+    """ the length of the argument """
+    return len(data)
+
+def filler(length):
+    """ a value of the given length """
+    return b"z" * length
+
+def test_large_arguments(cluster): # pylint: disable=W0613
+    """ an argument above the blob threshold is uploaded as a blob, and handed to
+        the function as its value within the sandbox """
+    future = clupy.parallel(size, server_count=1)(b"y" * (3 << 20))
+    future.wait(60)
+    assert future.successful, future.failure
+    assert future.value == 3 << 20
+
+def test_spooled_results(cluster, tmp_path):
+    """ a result reaching the spool threshold is fetched on the first access to
+        value, or into a file by save, and removed from the server afterwards """
+    spool_threshold = cluster
+    future = clupy.parallel(filler, server_count=1)(spool_threshold * 2)
+    future.wait(60)
+    assert future.successful, future.failure
+    assert future.spooled is not None
+    assert future.value == b"z" * (spool_threshold * 2)
+    future = clupy.parallel(filler, server_count=1)(spool_threshold)
+    future.wait(60)
+    assert future.successful, future.failure
+    spooled = future.spooled
+    assert spooled is not None
+    path = str(tmp_path / "result.frame")
+    future.save(path)
+    assert clupy.load_result(path) == b"z" * spool_threshold
+    with pytest.raises(RuntimeError, match="expired"):
+        spooled.save(str(tmp_path / "again.frame"))
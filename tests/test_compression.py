@@ -0,0 +1,41 @@
+""" tests of the negotiated payload compression """
+import pytest
+from clupy.utils import compression, wire
+
+def test_codecs_round_trip():
+    """ every available codec restores the frame it compressed """
+    chunks = wire.encode_frame(list(range(10000)))
+    for codec in compression.PREFERENCE:
+        data = compression.compress(codec, chunks)
+        assert len(data) < wire.frame_length(chunks)
+        assert wire.decode_frame(compression.decompress(codec, data)) == list(range(10000))
+    with pytest.raises(ValueError):
+        compression.decompress("snappy", b"")
+
+def test_negotiation():
+    """ the preferred local codec the peer accepts is chosen """
+    accepted = compression.parse_accept_header(compression.accept_header_value())
+    assert accepted == compression.PREFERENCE
+    assert compression.choose_codec(accepted) == compression.PREFERENCE[0]
+    assert compression.parse_accept_header(" lzma , snappy,") == ["lzma", "snappy"]
+    assert compression.choose_codec(["snappy"]) is None
+    assert compression.choose_codec(compression.parse_accept_header(None)) is None
+
+def test_stats_keep_compressing_when_it_saves_time():
+    """ well compressing cheap payloads stay compressed """
+    stats = compression.CompressionStats(bandwidth=1e6)
+    for _ in range(10):
+        stats.record(1000000, 100000, 0.01)
+        assert stats.worthwhile()
+    assert stats.raw_bytes == 10000000 and stats.compressed_bytes == 1000000
+
+def test_stats_stop_compressing_and_reprobe():
+    """ compression that costs more than it saves is switched off, with a re-probe
+        every REPROBE_INTERVAL payloads """
+    stats = compression.CompressionStats(bandwidth=1e9)
+    for _ in range(compression.CompressionStats.PROBE_COUNT):
+        assert stats.worthwhile()
+        stats.record(1000000, 950000, 0.5)
+    decisions = [stats.worthwhile() for _ in range(compression.CompressionStats.REPROBE_INTERVAL)]
+    assert decisions.count(True) == 1
+    assert decisions[-1]
@@ -0,0 +1,100 @@
+""" tests of the completion signalling of remote execution futures """
+import threading
+from concurrent.futures import FIRST_COMPLETED, FIRST_EXCEPTION
+import pytest
+import clupy
+from clupy.client.execution import RemoteExecutionFuture
+
+def complete(future, result=None, excep=None):
+    """ complete a future the way the execution worker does """
+    future.value = result
+    future.failure = excep
+    future.do_complete_callback(result, excep)
+
+def complete_later(future, result=None, excep=None, delay=0.05):
+    """ complete a future from another thread after delay seconds """
+    timer = threading.Timer(delay, complete, (future, result, excep))
+    timer.start()
+    return timer
+
+def test_wait_returns_upon_completion():
+    """ wait() wakes up when the future completes and reports the completion """
+    future = RemoteExecutionFuture(None)
+    assert not future.wait(0.01)
+    complete_later(future, 42)
+    assert future.wait(5)
+    assert future.successful and future.value == 42
+
+def test_callbacks_fire_once_completed():
+    """ callbacks registered before and after the completion are both called """
+    future = RemoteExecutionFuture(None)
+    before, after, done = [], [], []
+    future.succeed(before.append).add_done_callback(done.append)
+    complete(future, 1)
+    future.succeed(after.append)
+    future.add_done_callback(done.append)
+    assert before == [1] and after == [1]
+    assert done == [future, future]
+
+def test_failure_callbacks():
+    """ fail callbacks receive the failure and succeed callbacks are skipped """
+    future = RemoteExecutionFuture(None)
+    succeeded, failed = [], []
+    future.complete(succeeded.append, failed.append)
+    complete(future, excep="boom")
+    assert not future.successful
+    assert not succeeded and failed == ["boom"]
+
+def test_wait_first_completed_and_timeout():
+    """ clupy.wait splits the futures into done and not done ones """
+    futures = [RemoteExecutionFuture(None) for _ in range(3)]
+    complete_later(futures[1], 1)
+    done, not_done = clupy.wait(futures, 5, FIRST_COMPLETED)
+    assert done == {futures[1]}
+    assert not_done == {futures[0], futures[2]}
+    done, not_done = clupy.wait(futures, 0.05)
+    assert done == {futures[1]} and len(not_done) == 2
+
+def test_wait_first_exception():
+    """ FIRST_EXCEPTION returns as soon as a call fails """
+    futures = [RemoteExecutionFuture(None) for _ in range(2)]
+    complete(futures[0], 1)
+    complete_later(futures[1], excep="boom")
+    done, not_done = clupy.wait(futures, 5, FIRST_EXCEPTION)
+    assert done == set(futures) and not not_done
+
+def test_wait_all():
+    """ wait_all returns once every future completed """
+    futures = [RemoteExecutionFuture(None) for _ in range(3)]
+    for index, future in enumerate(futures):
+        complete_later(future, index, delay=0.01 * index)
+    clupy.wait_all(futures, 5)
+    assert all(future.completed for future in futures)
+
+def test_as_completed_order():
+    """ as_completed yields the futures in the order they complete """
+    futures = [RemoteExecutionFuture(None) for _ in range(3)]
+    complete(futures[2], 2)
+    complete_later(futures[0], 0, delay=0.05)
+    complete_later(futures[1], 1, delay=0.15)
+    assert [future.value for future in clupy.as_completed(futures, 5)] == [2, 0, 1]
+
+def test_as_completed_timeout():
+    """ as_completed raises TimeoutError when futures are still pending """
+    futures = [RemoteExecutionFuture(None) for _ in range(2)]
+    complete(futures[0], 0)
+    iterator = clupy.as_completed(futures, 0.05)
+    assert next(iterator) is futures[0]
+    with pytest.raises(TimeoutError):
+        next(iterator)
+
+def test_as_concurrent_future():
+    """ the standard future mirrors the result or the failure """
+    future = RemoteExecutionFuture(None)
+    std_future = future.as_concurrent_future()
+    complete_later(future, "done")
+    assert std_future.result(5) == "done"
+    failing = RemoteExecutionFuture(None)
+    complete(failing, excep=ValueError("bad"))
+    with pytest.raises(ValueError):
+        failing.as_concurrent_future().result(5)
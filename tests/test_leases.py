@@ -0,0 +1,119 @@
+""" tests of the server leases clients renew and release """
+import pickle
+from datetime import datetime, timedelta
+import pytest
+import tornado.testing
+import tornado.web
+from clupy.client.execution import RemoteExecutionServiceSingleton
+from clupy.client.servers import RemoteServerInfo
+from clupy.master.registration import ServerRegistrationServiceSingleton, \
+    RetainServerResourcesHandler
+from clupy.utils.config import ClientConfigure, MasterConfigure
+
+SERVERS = ["clupy://node1:7879", "clupy://node2:7879"]
+
+def make_registrations(tmp_path):
+    """ a master registration service with two registered servers """
+    path = tmp_path / "clupy.master.yaml"
+    path.write_text("port: 7878\n")
+    service = ServerRegistrationServiceSingleton.ServerRegistrationService(\
+        MasterConfigure(str(path)))
+    for server in SERVERS:
+        service.register_server(server)
+    return service
+
+def test_only_the_lease_holder_renews_and_releases(tmp_path):
+    """ shared busy servers stay leased to the client that allocated them """
+    service = make_registrations(tmp_path)
+    assert service.allocate_server_resources("a", 2) == (0, [(url, 1) for url in SERVERS])
+    assert service.allocate_server_resources("b", 2) == (0, [(url, 1) for url in SERVERS])
+    assert service.retain_server_resources("b", SERVERS) == []
+    assert service.retain_server_resources("b", SERVERS, True) == []
+    assert service.retain_server_resources("a", SERVERS) == SERVERS
+    service.retain_server_resources("a", SERVERS[:1], True)
+    assert service.retain_server_resources("a", SERVERS) == SERVERS[1:]
+    service.allocate_server_resources("b", 1)
+    assert service.retain_server_resources("b", SERVERS) == SERVERS[:1]
+
+class RetainHandlerTest(tornado.testing.AsyncHTTPTestCase):
+    """ the master's /retain end point """
+
+    def get_app(self):
+        self.service = make_registrations(self.tmp_path)
+        self.service.allocate_server_resources("client", 2)
+        saved = ServerRegistrationServiceSingleton.instance
+        ServerRegistrationServiceSingleton.instance = self.service
+        self.addCleanup(setattr, ServerRegistrationServiceSingleton, "instance", saved)
+        return tornado.web.Application([\
+            (r"/retain/(.*)/(.*)", RetainServerResourcesHandler, dict(config=None))])
+
+    @pytest.fixture(autouse=True)
+    def temporary_directory(self, tmp_path):
+        """ the configuration files go into a temporary directory """
+        self.tmp_path = tmp_path
+
+    def test_renew_answers_held_servers(self):
+        """ the posted servers held by the client are written back """
+        response = self.fetch("/retain/client/0", method="POST", \
+                              body=pickle.dumps(SERVERS + ["clupy://other:7879"]))
+        assert response.code == 200
+        assert pickle.loads(response.body) == SERVERS
+        response = self.fetch("/retain/client/1", method="POST", body=pickle.dumps(SERVERS))
+        assert pickle.loads(response.body) == []
+        assert all(info.client_id is None for info in self.service.query_master_info().values())
+
+    def test_malformed_body(self):
+        """ a body that is not a pickled list is rejected """
+        response = self.fetch("/retain/client/0", method="POST", body=b"servers")
+        assert response.code == 400
+
+class FakeService(object):
+    """ stands in for the remote execution service owning the worker """
+
+    def __init__(self, config):
+        self.config = config
+
+@pytest.fixture
+def worker(tmp_path):
+    """ a worker whose lease requests are recorded instead of being sent """
+    path = tmp_path / "clupy.client.yaml"
+    path.write_text("lease_renewal_period: 10\nserver_idle_time: 30\n")
+    worker = RemoteExecutionServiceSingleton.RemoteExecutionService.RemoteExecutionWorker(\
+        FakeService(ClientConfigure(str(path))))
+    worker.lease_requests = []
+    worker.send_lease_request = lambda urls, to_free: worker.lease_requests.append((urls, to_free))
+    saved = RemoteExecutionServiceSingleton.master_url
+    RemoteExecutionServiceSingleton.master_url = "clupy://localhost:7878"
+    yield worker
+    RemoteExecutionServiceSingleton.master_url = saved
+
+def add_server(worker, url, idle_seconds, busy=False):
+    """ add an allocated server last used idle_seconds ago """
+    server = RemoteServerInfo(url)
+    server.last_activity_time = datetime.now() - timedelta(seconds=idle_seconds)
+    if busy:
+        server.in_flight.append(object())
+    worker._server_list.append(server)
+    return server
+
+def test_idle_servers_are_released(worker):
+    """ servers idle for server_idle_time go back to the master in one request """
+    add_server(worker, "clupy://idle1", 40)
+    add_server(worker, "clupy://idle2", 50)
+    busy = add_server(worker, "clupy://busy", 100, busy=True)
+    add_server(worker, "clupy://recent", 5)
+    worker.maintain_server_states()
+    assert worker.lease_requests == [(["clupy://idle1", "clupy://idle2"], True)]
+    assert busy in worker._server_list and len(worker._server_list) == 2
+
+def test_active_servers_are_renewed_together(worker):
+    """ once per lease_renewal_period the servers used since the last renewal are renewed """
+    add_server(worker, "clupy://busy", 100, busy=True)
+    add_server(worker, "clupy://recent", 5)
+    worker.maintain_server_states()
+    assert not worker.lease_requests
+    worker._last_renewal_time = datetime.now() - timedelta(seconds=11)
+    add_server(worker, "clupy://stale", 20).last_activity_time = \
+        worker._last_renewal_time - timedelta(seconds=1)
+    worker.maintain_server_states()
+    assert worker.lease_requests == [(["clupy://busy", "clupy://recent"], False)]
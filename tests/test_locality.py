@@ -0,0 +1,134 @@
+""" tests of dispatching batches to the servers already warm for a function """
+import collections
+import time
+from clupy.client.batching import AdaptiveBatchSizer, OneExecutionRequestContext
+from clupy.client.execution import RemoteExecutionServiceSingleton, RemoteFunctionContext, \
+    PayloadCompressionStats
+from clupy.client.scheduler import FairShareScheduler
+from clupy.client.servers import RemoteServerInfo
+from clupy.utils.config import ClientConfigure
+
+Call = collections.namedtuple("Call", ["func_key", "priority", "index"])
+
+class FakeService(object):
+    """ stands in for the remote execution service owning the worker """
+
+    def __init__(self, config):
+        self.config = config
+
+def make_worker(tmp_path, settings=""):
+    """ a worker recording the batches it dispatches and the retries it schedules """
+    path = tmp_path / "clupy.client.yaml"
+    path.write_text(settings)
+    config = ClientConfigure(str(path))
+    worker = RemoteExecutionServiceSingleton.RemoteExecutionService.RemoteExecutionWorker(\
+        FakeService(config))
+    worker.dispatched = []
+    worker.retries = []
+    def dispatch_batch(batch, server, speculative=False): # pylint: disable=W0613
+        server.in_flight.append(batch)
+        worker.dispatched.append((batch.calls[0].func_key, server.server_url))
+    worker.dispatch_batch = dispatch_batch
+    worker.retry_held_back = worker.retries.append
+    for func_key in ("f", "g"):
+        worker._function_list[func_key] = RemoteFunctionContext(\
+            AdaptiveBatchSizer(0.05, 1), PayloadCompressionStats(config.network_bandwidth), None)
+    return worker
+
+def add_server(worker, url, busy=False, warm_for=()):
+    """ a server with one slot, warm for the given functions """
+    server = RemoteServerInfo(url)
+    server.sandbox_id = url
+    if busy:
+        # the slot and the pipelined request
+        server.in_flight.extend([object(), object()])
+    for func_key in warm_for:
+        server.warm_functions[func_key + ".py:" + func_key] = time.time()
+    worker._server_list.append(server)
+    return server
+
+def queue_call(worker, func_key, age=0.0):
+    """ queue a call of func_key enqueued age seconds ago """
+    call = OneExecutionRequestContext(None, func_key, func_key + ".py", func_key, {"x": 1})
+    call.enqueue_time = time.time() - age
+    worker._scheduler.push(call)
+    return call
+
+def test_skipped_functions_are_passed_over():
+    """ the scheduler serves the next function when the preferred one is held back """
+    scheduler = FairShareScheduler()
+    scheduler.push(Call("a", 0, 0))
+    scheduler.push(Call("b", 0, 1))
+    assert scheduler.next_func_key() == "a"
+    assert scheduler.next_func_key(skipped=("a",)) == "b"
+    assert scheduler.next_func_key(skipped=("a", "b")) is None
+    assert scheduler.head("b").index == 1
+
+def test_warm_server_is_preferred(tmp_path):
+    """ among free servers, the one that ran the function gets the batch """
+    worker = make_worker(tmp_path)
+    add_server(worker, "cold")
+    add_server(worker, "warm", warm_for=("f",))
+    queue_call(worker, "f")
+    worker.carry_out_executions()
+    assert worker.dispatched == [("f", "warm")]
+
+def test_held_back_for_a_busy_warm_server(tmp_path):
+    """ a function waits for its busy warm server, the others are served meanwhile """
+    worker = make_worker(tmp_path)
+    add_server(worker, "cold")
+    add_server(worker, "warm", busy=True, warm_for=("f",))
+    call = queue_call(worker, "f")
+    queue_call(worker, "g")
+    worker.carry_out_executions()
+    assert worker.dispatched == [("g", "cold")]
+    assert worker._scheduler.queued("f") == 1
+    assert worker.retries == [call.enqueue_time + 1.0]
+
+def test_cold_start_once_the_delay_expired(tmp_path):
+    """ a call waiting locality_delay already goes to a cold server """
+    worker = make_worker(tmp_path, "locality_delay: 100\n")
+    add_server(worker, "cold")
+    add_server(worker, "warm", busy=True, warm_for=("f",))
+    queue_call(worker, "f", age=0.2)
+    worker.carry_out_executions()
+    assert worker.dispatched == [("f", "cold")]
+    assert not worker.retries
+
+def test_locality_can_be_switched_off(tmp_path):
+    """ without locality, calls never wait for a warm server """
+    worker = make_worker(tmp_path, "locality: false\n")
+    add_server(worker, "cold")
+    add_server(worker, "warm", busy=True, warm_for=("f",))
+    queue_call(worker, "f")
+    worker.carry_out_executions()
+    assert worker.dispatched == [("f", "cold")]
+
+def test_servers_holding_large_arguments_are_warmer(tmp_path):
+    """ each large argument a server holds already adds to its warmth """
+    worker = make_worker(tmp_path, "blob_threshold: 1000\n")
+    cold = add_server(worker, "cold", warm_for=("f",))
+    holder = add_server(worker, "holder", warm_for=("f",))
+    call = OneExecutionRequestContext(None, "f", "f.py", "f", {"x": b"x" * 5000})
+    call.prepare_input(1000)
+    holder.blobs.update(call.blobs)
+    worker._scheduler.push(call)
+    worker.carry_out_executions()
+    assert worker.dispatched == [("f", "holder")]
+    digests = worker.blob_digests(call)
+    assert digests == frozenset(call.blobs)
+    assert worker.warmth(cold, call, digests) == 1
+    assert worker.warmth(holder, call, digests) == 2
+
+def test_large_arguments_are_digested_once_per_batch(tmp_path):
+    """ picking among many servers prepares the input of the call once """
+    worker = make_worker(tmp_path, "blob_threshold: 1000\n")
+    for name in ("a", "b", "c"):
+        add_server(worker, name, warm_for=("f",))
+    call = OneExecutionRequestContext(None, "f", "f.py", "f", {"x": b"x" * 5000})
+    prepared = []
+    prepare_input = call.prepare_input
+    call.prepare_input = lambda threshold: prepared.append(threshold) or prepare_input(threshold)
+    worker._scheduler.push(call)
+    worker.carry_out_executions()
+    assert len(worker.dispatched) == 1 and prepared == [1000]
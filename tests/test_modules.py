@@ -0,0 +1,141 @@
+""" tests of shipping source modules into the server code cache """
+import importlib
+import os
+import sys
+import textwrap
+import types
+import pytest
+import clupy
+from clupy.client.modules import FunctionModules
+from clupy.server.code import CodeCache
+from clupy.utils import wire
+
+@pytest.fixture
+def source_tree(tmp_path):
+    """ a package with a module using a helper module of its own and the standard library """
+    root = tmp_path / "src"
+    package = root / "shippedpkg"
+    package.mkdir(parents=True)
+    (package / "__init__.py").write_text("")
+    (package / "helper.py").write_text("def double(value):\n    return 2 * value\n")
+    (package / "main.py").write_text(textwrap.dedent("""\
+        import json
+        from .helper import double
+
+        def work(value):
+            return json.dumps(double(value))
+        """))
+    sys.path.insert(0, str(root))
+    yield package
+    sys.path.remove(str(root))
+    for name in list(sys.modules):
+        if name == "shippedpkg" or name.startswith("shippedpkg."):
+            del sys.modules[name]
+
+def test_function_modules(source_tree):
+    """ the function's module, the modules it uses from its tree and its packages are shipped """
+    main = importlib.import_module("shippedpkg.main")
+    modules = FunctionModules(main.work)
+    assert modules.module_name == "shippedpkg.main"
+    assert set(modules.modules) == {"shippedpkg", "shippedpkg.main", "shippedpkg.helper"}
+    assert modules.modules["shippedpkg"][1] and not modules.modules["shippedpkg.main"][1]
+    manifest, sources = modules.manifest()
+    digest = manifest["shippedpkg.helper"][0]
+    assert sources[digest] == [(source_tree / "helper.py").read_bytes()]
+
+def test_manifest_follows_edits(source_tree):
+    """ an edited module gets a new digest """
+    modules = FunctionModules(importlib.import_module("shippedpkg.main").work)
+    before = modules.manifest()[0]
+    helper = source_tree / "helper.py"
+    helper.write_text("def double(value):\n    return value + value\n")
+    os.utime(str(helper), ns=(1, 1))
+    after = modules.manifest()[0]
+    assert before["shippedpkg.helper"] != after["shippedpkg.helper"]
+    assert before["shippedpkg.main"] == after["shippedpkg.main"]
+
+NEXT_TO_CLUPY = """\
+import clupy
+from clupy.utils import wire
+from clupy.client.modules import FunctionModules as Modules
+
+def work(value):
+    return wire.digest_chunks([value]), clupy.wait, Modules
+"""
+
+@pytest.fixture
+def script_next_to_clupy():
+    """ a script living in the directory the clupy package is imported from, as a
+        client script run from a checkout of the framework is """
+    checkout = os.path.dirname(os.path.dirname(os.path.abspath(clupy.__file__)))
+    module = types.ModuleType("nextdoor")
+    module.__file__ = os.path.join(checkout, "nextdoor.py")
+    sys.modules["nextdoor"] = module
+    exec(compile(NEXT_TO_CLUPY, module.__file__, "exec"), vars(module)) # pylint: disable=W0122
+    yield module
+    del sys.modules["nextdoor"]
+
+def test_framework_is_never_shipped(script_next_to_clupy):
+    """ the modules of clupy are imported by the servers, not shipped, even when the
+        function lives in the same source tree """
+    modules = FunctionModules(script_next_to_clupy.work)
+    assert modules.module_name == "nextdoor"
+    assert set(modules.modules) == {"nextdoor"}
+    assert set(FunctionModules(wire.digest_chunks).modules) == set()
+
+def cache_source(cache, source):
+    """ put a source into the cache, returning its digest """
+    digest = wire.digest_chunks([source])
+    cache.put(digest, source)
+    return digest
+
+def test_sandboxes_import_their_own_versions(tmp_path):
+    """ sandboxes shipping different versions of a module do not see each other's """
+    cache = CodeCache(str(tmp_path / "code"))
+    first = {"shippedmod": [cache_source(cache, b"VERSION = 1\n"), False]}
+    second = {"shippedmod": [cache_source(cache, b"VERSION = 2\n"), False]}
+    with cache.activated("a", first):
+        assert importlib.import_module("shippedmod").VERSION == 1
+    with cache.activated("b", second):
+        assert importlib.import_module("shippedmod").VERSION == 2
+    with cache.activated("a", first):
+        module = importlib.import_module("shippedmod")
+        assert module.VERSION == 1
+    with cache.activated("a", first):
+        assert importlib.import_module("shippedmod") is module
+    assert "shippedmod" not in sys.modules
+
+def test_cache_survives_restarts(tmp_path):
+    """ cached sources are found again by a later cache on the same directory """
+    cache = CodeCache(str(tmp_path / "code"))
+    digest = cache_source(cache, b"VALUE = 3\n")
+    assert cache.unresolved({"mod": [digest, False], "other": ["0" * 40, False]}) == ["0" * 40]
+    assert digest in CodeCache(str(tmp_path / "code"))
+    with pytest.raises(ValueError):
+        cache.put(digest, b"VALUE = 4\n")
+
+def test_packages_from_the_cache(tmp_path):
+    """ packages and their submodules are imported from the cached sources """
+    cache = CodeCache(str(tmp_path / "code"))
+    manifest = {
+        "cachedpkg": [cache_source(cache, b""), True],
+        "cachedpkg.mod": [cache_source(cache, b"from . import sibling\nVALUE = sibling.X\n"), \
+                          False],
+        "cachedpkg.sibling": [cache_source(cache, b"X = 'sibling'\n"), False],
+    }
+    with cache.activated("sandbox", manifest):
+        assert importlib.import_module("cachedpkg.mod").VALUE == "sibling"
+    assert not [name for name in sys.modules if name.startswith("cachedpkg")]
+
+def test_sandboxes_keep_the_framework_of_the_server(tmp_path):
+    """ a manifest shipping a copy of a framework module does not replace the
+        server's own, the classes frames are decoded with stay the same ones """
+    cache = CodeCache(str(tmp_path / "code"))
+    with open(wire.__file__, "rb") as stream:
+        shipped = cache_source(cache, stream.read())
+    manifest = {"clupy.utils.wire": [shipped, False],
+                "shippedmod": [cache_source(cache, b"from clupy.utils import wire\n"), False]}
+    with cache.activated("sandbox", manifest):
+        assert importlib.import_module("shippedmod").wire is wire
+        assert sys.modules["clupy.utils.wire"] is wire
+    assert sys.modules["clupy.utils.wire"] is wire
@@ -0,0 +1,82 @@
+""" tests of the shared memory object store of server nodes """
+import pytest
+from clupy.server.objects import ObjectStore, ObjectViews
+from clupy.server.worker import resolve
+from clupy.utils import wire
+
+def frame(value):
+    """ the digest and the encoded frame of value """
+    chunks = wire.encode_frame(value)
+    return wire.digest_chunks(chunks), b"".join(chunks)
+
+@pytest.fixture
+def store():
+    """ an object store of 10 KB whose segments are removed afterwards """
+    objects = ObjectStore(10000)
+    yield objects
+    objects.stop()
+
+def test_references_resolve_to_views(store):
+    """ the workers decode the referenced objects in place of the references """
+    digest, data = frame({"rows": list(range(100))})
+    assert store.missing([digest]) == [digest]
+    store.put(digest, data)
+    assert digest in store and not store.missing([digest])
+    assert store.frame(digest) == data
+    views = ObjectViews()
+    references = store.acquire([digest])
+    assert resolve({"a": wire.BlobReference(digest), "b": 2}, references, views) \
+        == {"a": {"rows": list(range(100))}, "b": 2}
+    assert views.value(references[digest]) is views.value(references[digest])
+    views.release()
+    store.release([digest])
+
+def test_out_of_band_buffers_are_read_only_views(store):
+    """ the out-of-band buffers of a value view the shared memory """
+    digest, data = frame(bytearray(b"x" * 5000))
+    store.put(digest, data)
+    views = ObjectViews()
+    value = views.value(store.acquire([digest])[digest])
+    assert bytes(value) == b"x" * 5000
+    if isinstance(value, memoryview):
+        assert value.readonly
+    del value
+    views.release()
+    store.release([digest])
+
+def test_store_rejects_mismatching_content(store):
+    """ an object must hash to the digest it is uploaded under """
+    digest, _ = frame("one")
+    with pytest.raises(ValueError):
+        store.put(digest, frame("two")[1])
+
+def test_store_evicts_least_recently_used(store):
+    """ the store stays within its capacity by evicting the least recently used objects """
+    objects = [frame(bytes([index]) * 4000) for index in range(3)]
+    for digest, data in objects[:2]:
+        store.put(digest, data)
+    store.acquire([objects[0][0]])
+    store.release([objects[0][0]])
+    store.put(*objects[2])
+    assert store.missing([digest for digest, _ in objects]) == [objects[1][0]]
+    assert store.size <= store.capacity
+
+def test_held_objects_are_not_evicted(store):
+    """ objects held by a running task survive however old they are """
+    objects = [frame(bytes([index]) * 4000) for index in range(3)]
+    store.put(*objects[0])
+    store.acquire([objects[0][0]])
+    for digest, data in objects[1:]:
+        store.put(digest, data)
+    assert objects[0][0] in store
+    store.release([objects[0][0]])
+    assert store.size <= store.capacity
+
+def test_transient_objects_go_once_released(store):
+    """ an intermediate result is removed as soon as it is no longer held """
+    _, data = frame({"partial": 1})
+    digest = store.hold(data)
+    references = store.references([digest])
+    assert ObjectViews().value(references[digest]) == {"partial": 1}
+    store.release([digest])
+    assert digest not in store and store.size == 0
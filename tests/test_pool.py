@@ -0,0 +1,121 @@
+""" tests of the worker processes running remote functions on server nodes """
+import asyncio
+import pytest
+from clupy.server.code import CodeCache
+from clupy.server.objects import ObjectReference, ObjectStore
+from clupy.server.pool import WorkerPool
+from clupy.server.spool import ResultSpool
+from clupy.server.worker import TaskRunner
+from clupy.utils import wire
+
+REDUCERS = b"def add(left, right):\n    return left + right\n"
+
+def encoded(outcome):
+    """ the encoded frame of a (succeeded, value) pair """
+    return b"".join(wire.encode_frame(outcome))
+
+@pytest.fixture
+def objects():
+    """ an object store holding the partial results, removed afterwards """
+    store = ObjectStore(1 << 20)
+    yield store
+    store.stop()
+
+def partial(store, outcome):
+    """ the ObjectReference of a partial result held in the store """
+    digest = store.hold(encoded(outcome))
+    return store.references([digest])[digest]
+
+@pytest.fixture
+def reducers(tmp_path):
+    """ the code cache directory and the manifest of a module of reduce functions """
+    cache_dir = str(tmp_path / "code")
+    digest = wire.digest_chunks([REDUCERS])
+    CodeCache(cache_dir).put(digest, REDUCERS)
+    return cache_dir, {"reducers": [digest, False]}
+
+META = {"reduce_module": "reducers", "reduce_func": "add", "reduction_id": "r"}
+
+def test_combine_partials(reducers, objects):
+    """ two partial results are reduced with the shipped reduce function """
+    cache_dir, manifest = reducers
+    runner = TaskRunner(cache_dir, "spool", 1 << 26)
+    frame, succeeded = runner.run(("combine", "sandbox", manifest, META, \
+                                   partial(objects, (True, 2)), partial(objects, (True, 3))))
+    assert succeeded and wire.decode_frame(frame) == (True, 5)
+    frame, succeeded = runner.run(("combine", "sandbox", manifest, META, \
+        partial(objects, (True, 2)), partial(objects, (False, ValueError("map failed")))))
+    assert not succeeded
+    assert str(wire.decode_frame(frame)[1]) == "map failed"
+
+def test_combine_failures(reducers, objects):
+    """ a reduce function raising fails the combined partial """
+    cache_dir, manifest = reducers
+    runner = TaskRunner(cache_dir, "spool", 1 << 26)
+    frame, succeeded = runner.run(("combine", "sandbox", manifest, META, \
+        partial(objects, (True, 2)), partial(objects, (True, "text"))))
+    assert not succeeded
+    assert isinstance(wire.decode_frame(frame)[1], TypeError)
+
+def run_pool(pool, task_count, task):
+    """ run task_count tasks on the pool, return the pids of the workers used """
+    async def run():
+        pids = []
+        for _ in range(task_count):
+            worker = await pool.acquire()
+            pids.append(worker.process.pid)
+            try:
+                result = await pool.call(worker, task)
+            finally:
+                pool.release(worker)
+            assert wire.decode_frame(result[0]) == (True, 5)
+        return pids
+    return asyncio.run(run())
+
+def test_workers_are_recycled(reducers, objects):
+    """ a worker is replaced by a fresh process after max_tasks tasks """
+    cache_dir, manifest = reducers
+    pool = WorkerPool(1, cache_dir, 2, 1 << 40, ResultSpool("spool", 1 << 26))
+    try:
+        pids = run_pool(pool, 3, ("combine", "sandbox", manifest, META, \
+                                  partial(objects, (True, 2)), partial(objects, (True, 3))))
+    finally:
+        pool.stop()
+    assert pids[0] == pids[1] != pids[2]
+
+def test_task_errors_reach_the_server(reducers):
+    """ a task the worker can not carry out fails with a RuntimeError """
+    cache_dir, _ = reducers
+    pool = WorkerPool(1, cache_dir, 10, 1 << 40, ResultSpool("spool", 1 << 26))
+    garbage = ObjectReference("digest", None, 7, b"garbage")
+    async def run():
+        return await pool.run(("combine", "sandbox", {}, META, garbage, garbage))
+    try:
+        with pytest.raises(RuntimeError, match="FrameError"):
+            asyncio.run(run())
+    finally:
+        pool.stop()
+
+def test_dead_workers_are_replaced(reducers, objects):
+    """ a task on a worker that died fails, and the worker is replaced """
+    cache_dir, manifest = reducers
+    pool = WorkerPool(1, cache_dir, 10, 1 << 40, ResultSpool("spool", 1 << 26))
+    task = ("combine", "sandbox", manifest, META, partial(objects, (True, 2)), \
+            partial(objects, (True, 3)))
+    async def run():
+        worker = await pool.acquire()
+        worker.process.kill()
+        worker.process.join()
+        try:
+            with pytest.raises(RuntimeError, match="died"):
+                await pool.call(worker, task)
+        finally:
+            pool.release(worker)
+        result = await pool.run(task)
+        return worker, result
+    try:
+        dead, result = asyncio.run(run())
+    finally:
+        pool.stop()
+    assert dead.broken
+    assert wire.decode_frame(result[0]) == (True, 5)
@@ -0,0 +1,189 @@
+""" tests of map_reduce with tree reduction of partial results on the servers """
+import asyncio
+import json
+import operator
+import pytest
+import tornado.testing
+import tornado.web
+from tornado import gen
+from clupy.client.execution import RemoteExecutionServiceSingleton
+from clupy.client.reductions import Reduction
+from clupy.client.servers import RemoteServerInfo
+from clupy.server.execution import ServerExecutionServiceSingleton, ExecuteFunctionHandler
+from clupy.server.objects import ObjectStore
+from clupy.server.reductions import ReductionStore
+from clupy.utils import wire
+from clupy.utils.config import ClientConfigure, ServerConfigure
+
+def encoded(outcome):
+    """ the encoded frame of a (succeeded, value) pair """
+    return b"".join(wire.encode_frame(outcome))
+
+def test_store_holds_partials_in_the_object_store():
+    """ a partial result is held per reduction until it is taken or discarded """
+    objects = ObjectStore(1 << 20)
+    store = ReductionStore(objects)
+    try:
+        store.put("r", objects.hold(encoded((True, 10))))
+        other = objects.hold(encoded((True, 100)))
+        store.put("other", other)
+        assert "r" in store
+        digest = store.take("r")
+        assert wire.decode_frame(objects.frame(digest)) == (True, 10)
+        assert "r" not in store
+        with pytest.raises(KeyError):
+            store.take("r")
+        store.discard("other")
+        store.discard("unknown")
+        assert other not in objects
+        with pytest.raises(KeyError):
+            store.take("other")
+    finally:
+        objects.stop()
+
+def test_reduction_counts_calls():
+    """ the reduction completes with its last map call and keeps the first failure """
+    reduction = Reduction("r", None, "add", None, 3)
+    first = ValueError("first")
+    assert not reduction.call_completed(None)
+    assert not reduction.call_completed(first)
+    assert reduction.call_completed(ValueError("second"))
+    assert reduction.failure is first
+    server = RemoteServerInfo("clupy://a")
+    reduction.add_server(server)
+    reduction.add_server(server)
+    assert reduction.servers == [server]
+
+class FakeModules(object):
+    """ stands in for the FunctionModules of the reduce function """
+
+    module_name = "reducers"
+
+    @staticmethod
+    def manifest():
+        """ no modules to ship """
+        return {}, {}
+
+class FakeService(object):
+    """ stands in for the remote execution service owning the worker """
+
+    def __init__(self, config):
+        self.config = config
+
+class FunctionContext(object):
+    """ the part of a RemoteFunctionContext combine_partials looks at """
+
+    def __init__(self, reduction):
+        self.reduction = reduction
+
+def recording_worker(tmp_path, ops):
+    """ a worker whose reduction ops are recorded instead of being posted """
+    worker = RemoteExecutionServiceSingleton.RemoteExecutionService.RemoteExecutionWorker(\
+        FakeService(ClientConfigure(str(tmp_path / "missing.yaml"))))
+    @gen.coroutine
+    def post_reduction_op(server_entry, func_context, op, peer_entry=None): # pylint: disable=W0613
+        ops.append((op, server_entry.server_url, peer_entry.server_url if peer_entry else None))
+        return "result" if op == "take" else None
+    worker.post_reduction_op = post_reduction_op
+    return worker
+
+def combine(worker, reduction):
+    """ run combine_partials to completion """
+    async def run():
+        return await worker.combine_partials(FunctionContext(reduction))
+    return asyncio.run(run())
+
+def test_partials_are_merged_in_a_tree(tmp_path):
+    """ five partial results take three rounds of pairwise merges """
+    ops = []
+    worker = recording_worker(tmp_path, ops)
+    reduction = Reduction("r", FakeModules(), "add", None, 5)
+    for index in range(5):
+        reduction.add_server(RemoteServerInfo("s{}".format(index)))
+    assert combine(worker, reduction) == "result"
+    assert ops == [("merge", "s0", "s1"), ("merge", "s2", "s3"), ("merge", "s0", "s2"), \
+                   ("merge", "s0", "s4"), ("take", "s0", None)]
+
+def test_failed_reductions_are_discarded(tmp_path):
+    """ a failed map call discards the partial results everywhere """
+    ops = []
+    worker = recording_worker(tmp_path, ops)
+    reduction = Reduction("r", FakeModules(), "add", None, 1)
+    reduction.add_server(RemoteServerInfo("s0"))
+    reduction.add_server(RemoteServerInfo("s1"))
+    reduction.call_completed(KeyError("map failed"))
+    with pytest.raises(KeyError):
+        combine(worker, reduction)
+    assert ops == [("discard", "s0", None), ("discard", "s1", None)]
+
+class ReductionOpsTest(tornado.testing.AsyncHTTPTestCase):
+    """ the merge, take and discard ops of /exec/run, the partial results are
+        combined by a worker process """
+
+    REDUCERS = b"def add(left, right):\n    return left + right\n"
+
+    @pytest.fixture(autouse=True)
+    def temporary_directory(self, tmp_path):
+        """ the configuration and the code cache go into a temporary directory """
+        self.tmp_path = tmp_path
+
+    def get_app(self):
+        path = self.tmp_path / "clupy.server.yaml"
+        path.write_text("code_cache_dir: {}\nworker_processes: 1\n".format(\
+            self.tmp_path / "code"))
+        config = ServerConfigure(str(path))
+        self.service = ServerExecutionServiceSingleton(config)
+        digest = wire.digest_chunks([self.REDUCERS])
+        self.service.code_cache.put(digest, self.REDUCERS)
+        self.manifest = json.dumps({"reducers": [digest, False]})
+        return tornado.web.Application([\
+            (r"/exec/run/(.*)", ExecuteFunctionHandler, dict(config=config))])
+
+    def hold(self, outcome):
+        """ the digest of a partial result held in the node's object store """
+        return self.service.objects.hold(encoded(outcome))
+
+    def post_op(self, op, sandbox_id, **fields):
+        """ post a reduction op, return the decoded (succeeded, value) pair """
+        request = {"op": op, "reduction_id": "r", "reduce_module": "reducers", \
+                   "reduce_func": "add"}
+        request.update(fields)
+        response = self.fetch("/exec/run/" + sandbox_id, method="POST", \
+            body=b"".join(wire.encode_request(request)), \
+            headers={wire.MODULES_HEADER: self.manifest})
+        assert response.code == 200
+        return wire.decode_frame(response.body)
+
+    def test_merge_then_take(self):
+        """ a merge pulls the peer's partial result in, take returns the result """
+        self.service.reductions.put("r", self.hold((True, 5)))
+        assert self.post_op("merge", "a", peer=self.get_url("/exec/run/b")) == (True, None)
+        assert self.post_op("take", "a") == (True, 5)
+        succeeded, failure = self.post_op("take", "a")
+        assert not succeeded and isinstance(failure, KeyError)
+
+    def test_merge_combines_in_a_worker(self):
+        """ a partial stored while the peer's one was fetched is reduced with it """
+        self.service.reductions.put("r", self.hold((True, 5)))
+        original_take = self.service.reductions.take
+        refills = [self.hold((True, 7))]
+        def take_and_refill(reduction_id):
+            partial = original_take(reduction_id)
+            if refills:
+                self.service.reductions.put(reduction_id, refills.pop())
+            return partial
+        self.service.reductions.take = take_and_refill
+        assert self.post_op("merge", "a", peer=self.get_url("/exec/run/b")) == (True, None)
+        assert self.post_op("take", "a") == (True, 12)
+
+    def test_failed_peer_partial_fails_the_reduction(self):
+        """ a peer without a partial result makes the final take fail """
+        self.post_op("merge", "a", peer=self.get_url("/exec/run/b"))
+        succeeded, failure = self.post_op("take", "a")
+        assert not succeeded and isinstance(failure, KeyError)
+
+    def test_discard(self):
+        """ discarding forgets the partial result """
+        self.service.reductions.put("r", self.hold((True, 1)))
+        assert self.post_op("discard", "a") == (True, None)
+        assert not self.post_op("take", "a")[0]
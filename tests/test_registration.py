@@ -0,0 +1,73 @@
+""" tests of the master's indexed server registry """
+from datetime import timedelta
+import types
+from clupy.master.registration import RankIndex, ServerRegistrationServiceSingleton
+
+def make_service(server_count):
+    """ a registry of servers whose spare cores grow with their index """
+    config = types.SimpleNamespace(registration_ttl=300, reservation_ttl=300, \
+        default_server_request_count=2, min_free_memory=512)
+    service = ServerRegistrationServiceSingleton.ServerRegistrationService(config)
+    for index in range(server_count):
+        service.register_server("s{}".format(index), \
+            {"cores": str(index + 1), "workers": "64", "free_memory": str(1 << 40)})
+    return service
+
+def age(service, seconds):
+    """ move every heartbeat and lease seconds into the past """
+    for info in service.query_master_info().values():
+        info.updating_time = info.updating_time - timedelta(seconds=seconds)
+        if info.last_reservation_time is not None:
+            info.last_reservation_time = info.last_reservation_time \
+                - timedelta(seconds=seconds)
+
+def test_rank_index_pops_highest_first():
+    """ updated and discarded servers are skipped by their stale heap entries """
+    index = RankIndex()
+    for rank, url in enumerate(["a", "b", "c", "d"]):
+        index.add(url, (True, float(rank), 1))
+    index.add("a", (True, 10.0, 1))
+    index.discard("c")
+    assert len(index) == 3
+    assert [index.pop(), index.pop(), index.pop(), index.pop()] == ["a", "d", "b", None]
+
+def test_rank_index_compacts_stale_entries():
+    """ the heap does not grow with the rank updates of the same servers """
+    index = RankIndex()
+    for update in range(1000):
+        index.add("a", (True, float(update), 1))
+        index.add("b", (True, float(-update), 1))
+    assert len(index._heap) < 100 # pylint: disable=W0212
+    assert index.pop() == "a"
+
+def test_allocates_by_spare_capacity_then_shares_busy_servers():
+    """ the free servers of most spare cores are leased, busy ones are shared """
+    service = make_service(5)
+    _, first = service.allocate_server_resources("c1", 2)
+    assert [url for url, _ in first] == ["s4", "s3"]
+    _, second = service.allocate_server_resources("c2", 4)
+    assert [url for url, _ in second] == ["s2", "s1", "s0", "s4"]
+    assert service.query_master_info()["s4"].client_id == "c1"
+    assert service.allocate_server_resources("c3", 6) == (-1, '')
+
+def test_release_and_renewal():
+    """ only the holder renews or releases a server, released servers are free again """
+    service = make_service(3)
+    service.allocate_server_resources("c1", 2)
+    assert service.retain_server_resources("c2", ["s2"]) == []
+    assert service.retain_server_resources("c1", ["s2", "s1"]) == ["s2", "s1"]
+    service.retain_server_resources("c1", ["s2"], to_free=True)
+    _, servers = service.allocate_server_resources("c2", 1)
+    assert servers[0][0] == "s2"
+
+def test_expired_leases_and_registrations():
+    """ unrenewed leases free their servers, silent servers are unregistered """
+    service = make_service(3)
+    service.allocate_server_resources("c1", 3)
+    age(service, 301)
+    service.register_server("s0")
+    service.maintain_servers()
+    assert list(service.query_master_info().keys()) == ["s0"]
+    _, servers = service.allocate_server_resources("c2", 1)
+    assert servers[0][0] == "s0"
+    assert service.query_master_info()["s0"].client_id == "c2"
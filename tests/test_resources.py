@@ -0,0 +1,115 @@
+""" tests of the resource reports of server nodes and the allocation by spare capacity """
+from concurrent.futures import Future
+import pytest
+import tornado.testing
+import tornado.web
+from clupy.client.batching import AdaptiveBatchSizer, OneExecutionRequestContext
+from clupy.client.execution import RemoteExecutionServiceSingleton, RemoteFunctionContext, \
+    PayloadCompressionStats
+from clupy.client.servers import RemoteServerInfo
+from clupy.master.registration import ServerRegistrationServiceSingleton, \
+    ServerRegistrationInfo, RegistrationHandler
+from clupy.server.registration import node_resources, free_memory
+from clupy.utils.config import ClientConfigure, MasterConfigure, ServerConfigure
+
+def test_spare_capacity():
+    """ the spare cores are the cores running calls less the load and the run queue """
+    info = ServerRegistrationInfo()
+    info.update_resources({"cores": "8", "workers": "6", "load_average": "1.5", \
+                           "run_queue": "2", "free_memory": str(1 << 30)})
+    assert info.capacity() == 2.5
+    assert info.rank(1 << 20) == (True, 2.5, 8)
+    assert info.rank(1 << 31) == (False, 2.5, 8)
+    info.update_resources({"load_average": "9"})
+    assert info.capacity() == 0.0 and info.cores == 8
+
+def test_malformed_reports_are_ignored():
+    """ a malformed report leaves the resources that could not be read """
+    info = ServerRegistrationInfo()
+    info.update_resources({"cores": "many"})
+    assert info.cores == 1 and info.capacity() == 1.0
+
+def make_registrations(tmp_path, reports):
+    """ a master registration service with servers that reported the given resources """
+    path = tmp_path / "clupy.master.yaml"
+    path.write_text("min_free_memory: 100\n")
+    service = ServerRegistrationServiceSingleton.ServerRegistrationService(\
+        MasterConfigure(str(path)))
+    for server, resources in reports:
+        service.register_server(server, resources)
+    return service
+
+def test_servers_with_spare_capacity_are_allocated_first(tmp_path):
+    """ the master leases the servers with the most spare cores, short memory last """
+    service = make_registrations(tmp_path, [
+        ("clupy://busy:7879", {"cores": "4", "workers": "4", "load_average": "3.5"}),
+        ("clupy://idle:7879", {"cores": "4", "workers": "4", "load_average": "0"}),
+        ("clupy://small:7879", {"cores": "16", "workers": "16", "free_memory": "1024"}),
+        ("clupy://half:7879", {"cores": "4", "workers": "4", "load_average": "2"}),
+    ])
+    assert service.allocate_server_resources("a", 2) == \
+        (0, [("clupy://idle:7879", 4.0), ("clupy://half:7879", 2.0)])
+    assert service.allocate_server_resources("b", 2) == \
+        (0, [("clupy://busy:7879", 0.5), ("clupy://small:7879", 16.0)])
+
+class RegistrationHandlerTest(tornado.testing.AsyncHTTPTestCase):
+    """ the master's /register end point takes the resources from the query """
+
+    @pytest.fixture(autouse=True)
+    def temporary_directory(self, tmp_path):
+        """ the configuration files go into a temporary directory """
+        self.tmp_path = tmp_path
+
+    def get_app(self):
+        self.service = make_registrations(self.tmp_path, [])
+        saved = ServerRegistrationServiceSingleton.instance
+        ServerRegistrationServiceSingleton.instance = self.service
+        self.addCleanup(setattr, ServerRegistrationServiceSingleton, "instance", saved)
+        return tornado.web.Application([\
+            (r"/register/(.*)", RegistrationHandler, dict(config=None))])
+
+    def test_heartbeat_reports_resources(self):
+        """ a heartbeat updates the resources of the registration """
+        response = self.fetch("/register/clupy%3A%2F%2Fnode%3A7879?cores=8&workers=2" \
+                              "&run_queue=1&load_average=0.25")
+        assert response.code == 200
+        info = self.service.query_master_info()["clupy://node:7879"]
+        assert (info.cores, info.workers, info.run_queue, info.load_average) == (8, 2, 1, 0.25)
+        assert info.capacity() == 0.75
+
+def test_node_resources(tmp_path):
+    """ the heartbeat of a node reports its cores, workers and run queue """
+    path = tmp_path / "clupy.server.yaml"
+    path.write_text("worker_processes: 1\n")
+    resources = node_resources(ServerConfigure(str(path)))
+    assert resources["workers"] == 1 and resources["run_queue"] == 0
+    assert resources["cores"] >= 1
+    memory = free_memory()
+    assert memory is None or memory > 0
+
+class FakeService(object):
+    """ stands in for the remote execution service owning the worker """
+
+    def __init__(self, config):
+        self.config = config
+
+def test_allocation_weights_break_ties(tmp_path):
+    """ the allocated weights are kept, and favour the server with more spare cores """
+    config = ClientConfigure(str(tmp_path / "missing.yaml"))
+    worker = RemoteExecutionServiceSingleton.RemoteExecutionService.RemoteExecutionWorker(\
+        FakeService(config))
+    worker.carry_out_executions = lambda: None
+    worker.maintain_server_states = lambda: None
+    worker._server_list.append(RemoteServerInfo("clupy://a")) # pylint: disable=W0212
+    allocation = Future()
+    allocation.set_result([("clupy://a", 1.0), ("clupy://b", 3.0)])
+    worker.complete_allocation(allocation)
+    servers = worker._server_list # pylint: disable=W0212
+    assert [(server.server_url, server.weight) for server in servers] \
+        == [("clupy://a", 1.0), ("clupy://b", 3.0)]
+    for server in servers:
+        server.sandbox_id = server.server_url
+    worker._function_list["f"] = RemoteFunctionContext(AdaptiveBatchSizer(0.05, 1), \
+        PayloadCompressionStats(config.network_bandwidth), None)
+    call = OneExecutionRequestContext(None, "f", "f.py", "f", {"x": 1})
+    assert worker.pick_server(call)[0] is servers[1]
@@ -0,0 +1,80 @@
+""" tests of the fair-share scheduling of queued calls """
+import collections
+from clupy.client.scheduler import FairShareScheduler
+
+Call = collections.namedtuple("Call", ["func_key", "priority", "index"])
+
+def serve(scheduler, count):
+    """ the function keys of the next count calls served one at a time """
+    served = []
+    for _ in range(count):
+        func_key = scheduler.next_func_key()
+        served.extend(call.func_key for call in scheduler.take(func_key, 1))
+    return served
+
+def test_equal_weights_alternate():
+    """ two busy functions of equal weight are served in turns """
+    scheduler = FairShareScheduler()
+    for index in range(4):
+        scheduler.push(Call("a", 0, index))
+        scheduler.push(Call("b", 0, index))
+    served = serve(scheduler, 8)
+    assert served.count("a") == served.count("b") == 4
+    assert all(served[index] != served[index + 1] for index in range(7))
+    assert scheduler.empty()
+
+def test_weights_share_in_proportion():
+    """ a function of weight 3 gets three calls served for every call of weight 1 """
+    scheduler = FairShareScheduler()
+    scheduler.set_weight("heavy", 3)
+    for index in range(30):
+        scheduler.push(Call("heavy", 0, index))
+        scheduler.push(Call("light", 0, index))
+    served = serve(scheduler, 20)
+    assert served.count("heavy") == 15
+    assert served.count("light") == 5
+
+def test_priority_comes_first():
+    """ the calls of the highest priority are served first, FIFO within a priority """
+    scheduler = FairShareScheduler()
+    scheduler.push(Call("a", 0, 0))
+    scheduler.push(Call("a", 5, 1))
+    scheduler.push(Call("b", 1, 2))
+    scheduler.push(Call("a", 5, 3))
+    order = []
+    while not scheduler.empty():
+        order.extend(call.index for call in scheduler.take(scheduler.next_func_key(), 1))
+    assert order == [1, 3, 2, 0]
+
+def test_idle_function_gets_no_credit():
+    """ a function queuing again starts at the current virtual time, it does not
+        take over the servers to catch up for the time it was idle """
+    scheduler = FairShareScheduler()
+    for index in range(10):
+        scheduler.push(Call("busy", 0, index))
+    serve(scheduler, 6)
+    for index in range(4):
+        scheduler.push(Call("late", 0, index))
+    served = serve(scheduler, 4)
+    assert served.count("late") == 2
+
+def test_drained_functions():
+    """ drained functions are emptied without affecting the others """
+    scheduler = FairShareScheduler()
+    scheduler.push(Call("a", 0, 0))
+    scheduler.push(Call("b", 0, 1))
+    assert [call.index for call in scheduler.drain("a")] == [0]
+    assert scheduler.queued("a") == 0
+    assert len(scheduler) == 1
+    assert scheduler.next_func_key() == "b"
+
+def test_requeued_calls_go_first_and_are_refunded():
+    """ calls put back are served again ahead of the ones queued since """
+    scheduler = FairShareScheduler()
+    for index in range(3):
+        scheduler.push(Call("a", 0, index))
+    taken = scheduler.take("a", 2)
+    scheduler.push(Call("a", 0, 3))
+    scheduler.requeue(taken)
+    assert len(scheduler) == 4
+    assert [call.index for call in scheduler.take("a", 4)] == [0, 1, 2, 3]
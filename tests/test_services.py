@@ -0,0 +1,161 @@
+""" tests of published services and their micro-batches """
+import argparse
+import json
+import pytest
+import tornado.testing
+import tornado.web
+from tornado import gen
+from tornado.concurrent import Future
+import clupy
+from clupy.client import commands
+from clupy.client.execution import RemoteExecutionServiceSingleton
+from clupy.client.services import resolve_entry_point, endpoint_url
+from clupy.server.code import CodeCache
+from clupy.server.services import installed, ServiceEndpoint, ServiceCallHandler
+from clupy.server.worker import TaskRunner
+from clupy.utils import wire
+
+ENTRY_POINTS = b"def double(inputs):\n    return [value * 2 for value in inputs]\n" \
+               b"def short(inputs):\n    return inputs[1:]\n" \
+               b"def opaque(inputs):\n    return [object() for _ in inputs]\n"
+
+def predict(inputs):
+    """ an entry point defined in the test module """
+    return inputs
+
+def test_installed_packages():
+    """ packages are found by distribution or module name without importing them """
+    assert installed("pytest") and installed("tornado")
+    assert not installed("no_such_package_for_clupy")
+    assert not installed(".relative")
+
+def test_entry_points_are_resolved():
+    """ entry points given as functions or as names are served at module.function """
+    name, func = resolve_entry_point(predict)
+    assert func is predict and name.endswith(".predict")
+    assert resolve_entry_point("json.dumps") == ("json.dumps", json.dumps)
+    with pytest.raises(ValueError):
+        resolve_entry_point("dumps")
+    assert endpoint_url("clupy://node1:7879", 8080, "model.predict") \
+        == "http://node1:8080/model.predict"
+
+PUBLISHING = "import clupy\n" \
+             "clupy.RemoteExecutionServiceSingleton().published_endpoints.append(" \
+             "'http://node1:8080/model.predict')\n"
+
+def test_publishing_holds_the_leases_until_interrupted(tmp_path, monkeypatch, capsys):
+    """ --publish keeps the remote execution service running after the service file
+        published its entry points, and stops it once interrupted """
+    events = []
+    def interrupted():
+        events.append("wait")
+        raise KeyboardInterrupt()
+    stop = clupy.stop_remote_execution
+    monkeypatch.setattr(commands, "wait_until_interrupted", interrupted)
+    monkeypatch.setattr(clupy, "stop_remote_execution", lambda: (events.append("stop"), stop()))
+    service_file = tmp_path / "service.py"
+    service_file.write_text(PUBLISHING, encoding="utf-8")
+    try:
+        commands.ClientCommand(argparse.Namespace(master_url="clupy://localhost:1", \
+            publish=str(service_file))).publish_service()
+    finally:
+        RemoteExecutionServiceSingleton.instance = None
+        RemoteExecutionServiceSingleton.master_url = None
+    assert events == ["wait", "stop"]
+    assert "published: http://node1:8080/model.predict" in capsys.readouterr().out
+
+def run_service(tmp_path, func_name, inputs):
+    """ call a shipped entry point with the inputs of a micro-batch """
+    cache_dir = str(tmp_path / "code")
+    digest = wire.digest_chunks([ENTRY_POINTS])
+    CodeCache(cache_dir).put(digest, ENTRY_POINTS)
+    runner = TaskRunner(cache_dir, "spool", 1 << 26)
+    return runner.run(("service", "sandbox", {"entries": [digest, False]}, "entries", \
+                       func_name, inputs))
+
+def test_entry_points_run_batches(tmp_path):
+    """ the entry point is called once per batch and its outputs are JSON encoded """
+    assert run_service(tmp_path, "double", [1, "a"]) == [(True, "2"), (True, '"aa"')]
+
+def test_entry_point_failures(tmp_path):
+    """ missing outputs fail the whole batch, unserializable ones fail on their own """
+    outcomes = run_service(tmp_path, "short", [1, 2])
+    assert [succeeded for succeeded, _ in outcomes] == [False, False]
+    assert outcomes[0][1].startswith("ValueError")
+    outcomes = run_service(tmp_path, "opaque", [1])
+    assert not outcomes[0][0] and "JSON" in outcomes[0][1]
+
+class FakePool(object):
+    """ a pool of one worker process whose batches complete when the test says so """
+
+    size = 1
+
+    def __init__(self):
+        self.batches = [] # (inputs, Future of the outcomes)
+
+    def run(self, task):
+        """ record the inputs of the batch """
+        future = Future()
+        self.batches.append((task[-1], future))
+        return future
+
+class MicroBatchTest(tornado.testing.AsyncTestCase):
+    """ the requests to an entry point are coalesced into micro-batches """
+
+    @tornado.testing.gen_test
+    def test_requests_queue_up_while_the_worker_is_busy(self):
+        """ the requests arriving while a batch runs go out together in the next one """
+        pool = FakePool()
+        endpoint = ServiceEndpoint(pool, "sandbox", {}, "m", "f", 3, 0.0)
+        first = endpoint.call(1)
+        queued = [endpoint.call(value) for value in (2, 3, 4, 5)]
+        assert [inputs for inputs, _ in pool.batches] == [[1]]
+        pool.batches[0][1].set_result([(True, "1")])
+        assert (yield first) == (True, "1")
+        yield gen.moment
+        assert [inputs for inputs, _ in pool.batches] == [[1], [2, 3, 4]]
+        pool.batches[1][1].set_result([(True, "2"), (True, "3"), (False, "bad")])
+        assert (yield queued[2]) == (False, "bad")
+        yield gen.moment
+        assert [inputs for inputs, _ in pool.batches][2] == [5]
+
+    @tornado.testing.gen_test
+    def test_batches_wait_for_more_requests(self):
+        """ a batch that is not full leaves once its oldest request waited long enough """
+        pool = FakePool()
+        endpoint = ServiceEndpoint(pool, "sandbox", {}, "m", "f", 2, 0.05)
+        endpoint.call(1)
+        assert not pool.batches
+        endpoint.call(2)
+        endpoint.call(3)
+        assert [inputs for inputs, _ in pool.batches] == [[1, 2]]
+        pool.batches[0][1].set_result([(True, "1"), (True, "2")])
+        yield gen.sleep(0.1)
+        assert [inputs for inputs, _ in pool.batches] == [[1, 2], [3]]
+
+class FakeEndpoint(object):
+    """ an entry point echoing the JSON of its inputs, failing for None """
+
+    @staticmethod
+    def call(value):
+        """ the outcome of a call """
+        future = Future()
+        future.set_result((False, "no input") if value is None else (True, json.dumps(value)))
+        return future
+
+class ServiceCallTest(tornado.testing.AsyncHTTPTestCase):
+    """ the HTTP end point of the entry points published on a port """
+
+    def get_app(self):
+        return tornado.web.Application([\
+            (r"/(.*)", ServiceCallHandler, dict(endpoints={"m.echo": FakeEndpoint()}))])
+
+    def test_calls(self):
+        """ JSON inputs are answered with JSON outputs or errors """
+        response = self.fetch("/m.echo", method="POST", body='{"x": [1, 2]}')
+        assert response.code == 200 and json.loads(response.body) == {"x": [1, 2]}
+        assert self.fetch("/m.echo", method="POST", body="{x").code == 400
+        response = self.fetch("/m.echo", method="POST", body="")
+        assert response.code == 500 and json.loads(response.body) == {"error": "no input"}
+        assert self.fetch("/m.other", method="POST", body="1").code == 404
+        assert json.loads(self.fetch("/").body) == ["m.echo"]
@@ -0,0 +1,67 @@
+""" tests of the execution slots servers advertise and the requests clients pipeline """
+import multiprocessing
+import os
+import tempfile
+import tornado.testing
+import tornado.web
+from clupy.client.servers import RemoteServerInfo
+from clupy.server.execution import CreateSandboxHandler
+from clupy.utils import wire
+from clupy.utils.config import ServerConfigure
+
+def server_config(tmp_path, text=""):
+    """ a server configuration loaded from a clupy.server.yaml holding text """
+    path = tmp_path / "clupy.server.yaml"
+    path.write_text(text)
+    return ServerConfigure(str(path))
+
+def test_single_request_until_the_slots_are_known():
+    """ a server takes one request until its sandbox creation reported its slots """
+    server = RemoteServerInfo("clupy://localhost:1")
+    assert server.free_slots(pipeline_depth=3) == 1
+    server.in_flight.append(object())
+    assert server.free_slots(pipeline_depth=3) == 0
+
+def test_slots_and_pipeline_depth():
+    """ a server takes a request per slot plus pipeline_depth queued ones """
+    server = RemoteServerInfo("clupy://localhost:1")
+    server.sandbox_id = "sandbox"
+    server.slot_count = 4
+    assert server.free_slots() == 4
+    assert server.free_slots(pipeline_depth=1) == 5
+    server.in_flight.extend([object()] * 5)
+    assert server.free_slots(pipeline_depth=1) == 0
+
+def test_slots_are_capped_at_the_capacity():
+    """ a server takes no more requests than it admits, its workers and run queue """
+    server = RemoteServerInfo("clupy://localhost:1")
+    server.sandbox_id = "sandbox"
+    server.slot_count = 8
+    server.capacity = 3
+    assert server.free_slots(pipeline_depth=1) == 3
+    server.in_flight.extend([object()] * 3)
+    assert server.free_slots(pipeline_depth=1) == 0
+
+def test_execution_slots_default_to_the_cores(tmp_path):
+    """ servers run as many calls concurrently as they have cores unless configured """
+    assert server_config(tmp_path).execution_slots == multiprocessing.cpu_count()
+    assert server_config(tmp_path, "execution_slots: 3\n").execution_slots == 3
+
+class CreateSandboxTest(tornado.testing.AsyncHTTPTestCase):
+    """ the sandbox creation advertises the execution slots and the capacity """
+
+    def get_app(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".yaml", delete=False) as stream:
+            stream.write("execution_slots: 3\nworker_processes: 1\nrun_queue_depth: 2\n")
+        self.addCleanup(os.remove, stream.name)
+        config = ServerConfigure(stream.name)
+        return tornado.web.Application([\
+            (r"/exec/create/(.*)/(.*)", CreateSandboxHandler, dict(config=config))])
+
+    def test_slots_header(self):
+        """ the X-CluPy-Slots header carries execution_slots next to the sandbox id """
+        response = self.fetch("/exec/create/client/1")
+        assert response.code == 200
+        assert response.headers["X-CluPy-Slots"] == "3"
+        assert response.headers[wire.CAPACITY_HEADER] == "3"
+        assert response.body
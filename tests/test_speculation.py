@@ -0,0 +1,123 @@
+""" tests of the speculative re-execution of straggling batches """
+import time
+from concurrent.futures import Future
+from clupy.client.batching import AdaptiveBatchSizer, InFlightBatch, OneExecutionRequestContext
+from clupy.client.execution import RemoteExecutionServiceSingleton, RemoteFunctionContext, \
+    PayloadCompressionStats, RemoteExecutionFuture
+from clupy.client.servers import RemoteServerInfo
+from clupy.client.speculation import DurationTracker
+from clupy.utils.config import ClientConfigure
+
+class FakeService(object):
+    """ stands in for the remote execution service owning the worker """
+
+    def __init__(self, config):
+        self.config = config
+
+def make_worker(tmp_path):
+    """ a worker driven by hand, recording the batches it dispatches """
+    config = ClientConfigure(str(tmp_path / "missing.yaml"))
+    worker = RemoteExecutionServiceSingleton.RemoteExecutionService.RemoteExecutionWorker(\
+        FakeService(config))
+    worker.dispatched = []
+    def dispatch_batch(batch, server, speculative=False):
+        batch.copies[server] = (time.time(), False)
+        server.in_flight.append(batch)
+        worker.dispatched.append((batch, server, speculative))
+    worker.dispatch_batch = dispatch_batch
+    worker.carry_out_executions = lambda: None
+    worker.maintain_server_states = lambda: None
+    worker._function_list["f"] = RemoteFunctionContext(AdaptiveBatchSizer(0.05, 1000), \
+        PayloadCompressionStats(config.network_bandwidth), None)
+    for _ in range(20):
+        worker._function_list["f"].durations.record(0.1)
+    return worker
+
+def add_server(worker, name):
+    """ add a server with a sandbox and one slot """
+    server = RemoteServerInfo("clupy://" + name)
+    server.sandbox_id = name
+    worker._server_list.append(server)
+    return server
+
+def running_batch(server, started, count=1):
+    """ a batch of count calls of f running on server since started """
+    calls = [OneExecutionRequestContext(RemoteExecutionFuture(None), "f", "f.py", "f", {}) \
+             for _ in range(count)]
+    batch = InFlightBatch(calls)
+    batch.copies[server] = (started, False)
+    server.in_flight.append(batch)
+    return batch
+
+def test_duration_percentile():
+    """ percentiles need min_samples durations """
+    tracker = DurationTracker(window=100, min_samples=5)
+    for value in range(4):
+        tracker.record(value)
+    assert tracker.percentile(90) is None
+    for value in range(4, 100):
+        tracker.record(value)
+    assert tracker.percentile(50) == 50
+    assert tracker.percentile(90) == 90
+
+def test_straggler_is_copied_to_an_idle_server(tmp_path):
+    """ a batch running far longer than its function's percentile gets a second copy """
+    worker = make_worker(tmp_path)
+    busy = add_server(worker, "busy")
+    idle = add_server(worker, "idle")
+    batch = running_batch(busy, time.time() - 10)
+    worker.check_stragglers()
+    assert worker.dispatched == [(batch, idle, True)]
+    assert batch.speculated
+    assert worker.speculation_info()["f"]["launched"] == 1
+    worker.check_stragglers()
+    assert len(worker.dispatched) == 1
+
+def test_timely_batches_are_left_alone(tmp_path):
+    """ batches within the threshold, or without an idle server, are not copied """
+    worker = make_worker(tmp_path)
+    busy = add_server(worker, "busy")
+    add_server(worker, "idle")
+    running_batch(busy, time.time(), count=5)
+    worker.check_stragglers()
+    assert not worker.dispatched
+    lone = make_worker(tmp_path)
+    running_batch(add_server(lone, "busy"), time.time() - 10)
+    lone.check_stragglers()
+    assert not lone.dispatched
+
+def test_first_copy_wins(tmp_path):
+    """ the outcomes of the first copy to return complete the calls, the later copy is ignored """
+    worker = make_worker(tmp_path)
+    busy = add_server(worker, "busy")
+    idle = add_server(worker, "idle")
+    batch = running_batch(busy, time.time() - 10)
+    worker.check_stragglers()
+    winner = Future()
+    winner.set_result([(True, "fast")])
+    worker.complete_batch_execution(winner, batch, idle, True, {})
+    future = batch.calls[0].future_object
+    assert future.completed and future.value == "fast"
+    loser = Future()
+    loser.set_result([(True, "slow")])
+    worker.complete_batch_execution(loser, batch, busy, False, {})
+    assert future.value == "fast"
+    assert worker.speculation_info()["f"] == {"launched": 1, "won": 1, "lost": 0}
+    assert not busy.in_flight and not idle.in_flight
+
+def test_failed_copy_waits_for_the_other(tmp_path):
+    """ a failing copy does not fail the calls while another copy is still running """
+    worker = make_worker(tmp_path)
+    busy = add_server(worker, "busy")
+    idle = add_server(worker, "idle")
+    batch = running_batch(busy, time.time() - 10)
+    worker.check_stragglers()
+    failed = Future()
+    failed.set_exception(IOError("connection reset"))
+    worker.complete_batch_execution(failed, batch, busy, False, {})
+    future = batch.calls[0].future_object
+    assert not future.completed
+    succeeded = Future()
+    succeeded.set_result([(True, 1)])
+    worker.complete_batch_execution(succeeded, batch, idle, True, {})
+    assert future.completed and future.successful
@@ -0,0 +1,175 @@
+""" tests of the large results server nodes spool to disk and clients fetch in ranges """
+import asyncio
+import os
+import threading
+import time
+import pytest
+import tornado.httpserver
+import tornado.ioloop
+import tornado.web
+from clupy import load_result
+from clupy.client.execution import RemoteExecutionFuture, RemoteExecutionServiceSingleton
+from clupy.client.spool import SpooledRemoteResult
+from clupy.server.spool import ResultSpool, SpoolHandler
+from clupy.server.worker import TaskRunner, encode_outcomes
+from clupy.utils import wire
+from clupy.utils.config import ClientConfigure
+
+LARGE = os.urandom(3 << 20)
+
+def test_large_values_are_spooled(tmp_path):
+    """ values reaching the threshold are written to a file and replaced by handles """
+    spool = ResultSpool(str(tmp_path / "spool"), 1000)
+    error = ValueError("failed")
+    outcomes = spool.spool_outcomes("sandbox", [(True, 1), (True, b"x" * 2000), (False, error)])
+    assert outcomes[0] == (True, 1) and outcomes[2] == (False, error)
+    handle = outcomes[1][1]
+    assert isinstance(handle, wire.SpooledResult)
+    assert handle.handle.startswith("sandbox/")
+    with open(os.path.join(spool.spool_dir, handle.handle), "rb") as stream:
+        data = stream.read()
+    assert len(data) == handle.size and wire.digest_chunks([data]) == handle.digest
+    assert wire.decode_frame(data) == b"x" * 2000
+
+def test_small_batches_are_replied(tmp_path):
+    """ a frame of outcomes below the threshold is replied as it is """
+    spool = ResultSpool(str(tmp_path / "spool"), 1000)
+    assert wire.decode_frame(encode_outcomes([(True, 1)], spool, "sandbox")) == [(True, 1)]
+    assert not os.path.exists(spool.spool_dir)
+    outcomes = wire.decode_frame(encode_outcomes([(True, b"y" * 2000)], spool, "sandbox"))
+    assert isinstance(outcomes[0][1], wire.SpooledResult)
+
+def test_sandboxes_spool_with_the_wire_of_the_server(tmp_path):
+    """ the handles of results spooled within a sandbox shipping its own copy of the
+        wire module are SpooledResults of the server's wire """
+    runner = TaskRunner(str(tmp_path / "code"), str(tmp_path / "spool"), 1000)
+    with open(wire.__file__, "rb") as stream:
+        shipped = stream.read()
+    source = b"def big(n):\n    return b'z' * n\n"
+    manifest = {}
+    for name, data in (("clupy.utils.wire", shipped), ("spoolingmod", source)):
+        digest = wire.digest_chunks([data])
+        runner.code_cache.put(digest, data)
+        manifest[name] = [digest, False]
+    meta = {"op": "call", "module_name": "spoolingmod", "func_name": "big", \
+            "file_name": "spoolingmod.py"}
+    payload, _, _ = runner.run_calls("sandbox", manifest, meta, \
+                                     b"".join(wire.encode_frame([{"n": 2000}])), None)
+    [(succeeded, handle)] = wire.decode_frame(payload)
+    assert succeeded and isinstance(handle, wire.SpooledResult)
+    with open(os.path.join(runner.spool.spool_dir, handle.handle), "rb") as stream:
+        assert wire.decode_frame(stream.read()) == b"z" * 2000
+
+def test_unfetched_results_expire(tmp_path):
+    """ spooled results older than the ttl are removed along with empty directories """
+    spool = ResultSpool(str(tmp_path / "spool"), 10, 60)
+    old = spool.spool("old", wire.encode_frame(b"o" * 100))
+    new = spool.spool("new", wire.encode_frame(b"n" * 100))
+    old_path = os.path.join(spool.spool_dir, old.handle)
+    os.utime(old_path, (time.time() - 120, time.time() - 120))
+    spool.expire()
+    assert not os.path.exists(os.path.dirname(old_path))
+    assert os.path.exists(os.path.join(spool.spool_dir, new.handle))
+
+class FlakySpoolHandler(SpoolHandler):
+    """ serves the spool, the first breaks responses break off halfway through """
+
+    breaks = 0
+
+    @classmethod
+    def get_content(cls, abspath, start=None, end=None):
+        chunks = super().get_content(abspath, start, end)
+        if cls.breaks <= 0:
+            return chunks
+        cls.breaks = cls.breaks - 1
+        data = b"".join(chunks)
+        def broken():
+            yield data[:len(data) // 2]
+            raise IOError("connection broke off")
+        return broken()
+
+@pytest.fixture
+def spool_server(tmp_path):
+    """ the ResultSpool of a server node serving it on a thread of its own, and the
+        URL of its spool end point """
+    spool = ResultSpool(str(tmp_path / "spool"), 1 << 20)
+    started = threading.Event()
+    loops = []
+    def serve():
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        io_loop = tornado.ioloop.IOLoop.current()
+        server = tornado.httpserver.HTTPServer(tornado.web.Application([\
+            (r"/exec/spool/(.*)", FlakySpoolHandler, dict(path=spool.spool_dir))]))
+        server.listen(0, "127.0.0.1")
+        port = list(server._sockets.values())[0].getsockname()[1] # pylint: disable=W0212
+        loops.append((io_loop, port))
+        started.set()
+        io_loop.start()
+        server.stop()
+        io_loop.close()
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    started.wait()
+    io_loop, port = loops[0]
+    yield spool, "http://127.0.0.1:{}/exec/spool/".format(port)
+    FlakySpoolHandler.breaks = 0
+    io_loop.add_callback(io_loop.stop)
+    thread.join()
+
+def fetchable(spool, base_url, value, settings=""):
+    """ the SpooledRemoteResult of value spooled by the server """
+    path = os.path.join(os.getcwd(), "clupy.client.yaml")
+    with open(path, "w", encoding="utf-8") as stream:
+        stream.write(settings)
+    handle = spool.spool("sandbox", wire.encode_frame(value))
+    return SpooledRemoteResult(base_url + handle.handle, handle.size, handle.digest, \
+                               ClientConfigure(path)), \
+        os.path.join(spool.spool_dir, handle.handle)
+
+def test_results_are_fetched_in_ranges(spool_server, tmp_path):
+    """ a result is fetched in parallel ranges, checked and removed from the server """
+    spool, base_url = spool_server
+    result, served = fetchable(spool, base_url, LARGE, "result_fetch_parts: 3\n")
+    path = str(tmp_path / "saved" / "result.frame")
+    result.save(path)
+    assert load_result(path) == LARGE
+    parts = result._parts # pylint: disable=W0212
+    assert len(parts) == 3 and all(start == end for start, end in parts)
+    assert not os.path.exists(served)
+    with pytest.raises(RuntimeError, match="expired"):
+        result.save(str(tmp_path / "again.frame"))
+
+def test_broken_ranges_resume(spool_server, tmp_path):
+    """ ranges whose connections broke off are resumed where they stopped """
+    spool, base_url = spool_server
+    result, _ = fetchable(spool, base_url, LARGE, "result_fetch_parts: 2\n")
+    FlakySpoolHandler.breaks = 2
+    assert result.load() == LARGE
+    assert FlakySpoolHandler.breaks == 0
+    assert not os.listdir(ClientConfigure("clupy.client.yaml").result_spool_dir)
+
+def test_corrupt_results_are_rejected(spool_server, tmp_path):
+    """ a fetched result not matching its digest raises RuntimeError """
+    spool, base_url = spool_server
+    result, _ = fetchable(spool, base_url, LARGE)
+    result.digest = wire.digest_chunks([b"other"])
+    with pytest.raises(RuntimeError, match="digest"):
+        result.save(str(tmp_path / "result.frame"))
+
+def test_future_values_are_fetched_lazily(spool_server, tmp_path):
+    """ value fetches a spooled result on first access, save writes it undecoded """
+    spool, base_url = spool_server
+    future = RemoteExecutionFuture(None)
+    result, _ = fetchable(spool, base_url, LARGE)
+    RemoteExecutionServiceSingleton.RemoteExecutionService.RemoteExecutionWorker.\
+        complete_future(future, result, None)
+    assert future.spooled is result
+    path = str(tmp_path / "result.frame")
+    future.save(path)
+    assert load_result(path) == LARGE
+    future = RemoteExecutionFuture(None)
+    RemoteExecutionServiceSingleton.RemoteExecutionService.RemoteExecutionWorker.\
+        complete_future(future, fetchable(spool, base_url, LARGE)[0], None)
+    assert future.value == LARGE and future.spooled is None
+    future.save(path)
+    assert load_result(path) == LARGE
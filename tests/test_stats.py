@@ -0,0 +1,63 @@
+""" tests of the per-call latency breakdown """
+import json
+from clupy.client.batching import OneExecutionRequestContext
+from clupy.client.stats import LatencyHistogram, LatencyStatsSingleton, call_phases, PHASES
+
+def completed_call(enqueue_time=100.0):
+    """ a call that went through every phase, the second of a batch of two """
+    call = OneExecutionRequestContext(None, "f.py:f", "f.py", "f", {})
+    call.enqueue_time = enqueue_time
+    call.record_timing({"dispatch": enqueue_time + 1.0, "serialized": enqueue_time + 1.5, \
+                        "received": enqueue_time + 5.0, "deserialized": enqueue_time + 5.25, \
+                        "remote": [0.5, 1.5]}, 1)
+    call.completion_time = enqueue_time + 5.5
+    return call
+
+def test_histogram_percentiles():
+    """ percentiles are the bounds of the buckets holding them, capped by the maximum """
+    histogram = LatencyHistogram()
+    for _ in range(90):
+        histogram.record(0.001)
+    for _ in range(10):
+        histogram.record(1.0)
+    summary = histogram.summary()
+    assert summary["count"] == 100 and summary["min"] == 0.001 and summary["max"] == 1.0
+    assert 0.001 <= summary["p50"] < 0.0012
+    assert summary["p99"] == 1.0
+    assert sum(count for _, count in summary["buckets"]) == 100
+    assert LatencyHistogram().percentile(50) is None
+
+def test_bucket_bounds_grow_four_times_per_doubling():
+    """ every duration lies below the bound of its bucket, and above the previous one """
+    for duration in (1e-7, 3e-6, 0.02, 7.5):
+        index = LatencyHistogram.bucket_index(duration)
+        assert duration <= LatencyHistogram.bucket_bound(index) * 1.0000001
+        if index:
+            assert duration > LatencyHistogram.bucket_bound(index - 1)
+    assert LatencyHistogram.bucket_bound(4) == 2 * LatencyHistogram.bucket_bound(0)
+
+def test_call_phases():
+    """ the transfer phase excludes the time the server spent on the whole batch """
+    phases = call_phases(completed_call())
+    assert phases == {"queue": 1.0, "serialize": 0.5, "transfer": 1.5, "remote": 1.5, \
+                      "deserialize": 0.25, "total": 5.5}
+
+def test_unreached_phases_are_left_out():
+    """ a call failing before dispatch only has a total """
+    call = OneExecutionRequestContext(None, "f.py:f", "f.py", "f", {})
+    call.completion_time = call.enqueue_time + 2.0
+    assert call_phases(call) == {"total": 2.0}
+
+def test_stats_summary_and_file(tmp_path):
+    """ calls are summarized per function and written out as JSON lines """
+    path = tmp_path / "stats.jsonl"
+    stats = LatencyStatsSingleton.LatencyStats(str(path))
+    stats.record(completed_call(), True)
+    stats.record(completed_call(200.0), False)
+    stats.flush()
+    summary = stats.summary()
+    assert set(summary["f.py:f"]) == set(PHASES)
+    assert summary["f.py:f"]["total"]["count"] == 2
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line["succeeded"] for line in lines] == [True, False]
+    assert lines[1]["enqueue_time"] == 200.0 and lines[1]["remote"] == 1.5
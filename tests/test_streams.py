@@ -0,0 +1,122 @@
+""" tests of streaming the items of remote generator functions """
+import asyncio
+import threading
+import pytest
+from clupy.client.streams import RemoteResultStream
+from clupy.server.streams import StreamRegistry
+from clupy.server.worker import produce_chunk
+from clupy.utils import wire
+
+def messages(*objs):
+    """ the bytes of a stream of messages """
+    return b"".join(b"".join(wire.encode_message(obj)) for obj in objs)
+
+def started_stream():
+    """ a stream recording the credit it grants """
+    stream = RemoteResultStream()
+    grants = []
+    stream.start("stream", grants.append)
+    return stream, grants
+
+def test_message_reader_reassembles_pieces():
+    """ messages are decoded however the received bytes are cut """
+    data = messages(("items", [1, 2]), ("items", list(range(100))), ("end", None))
+    for size in (1, 7, 1000):
+        reader = wire.MessageReader()
+        objs = []
+        for index in range(0, len(data), size):
+            objs.extend(reader.feed(data[index:index + size]))
+        assert objs == [("items", [1, 2]), ("items", list(range(100))), ("end", None)]
+
+def test_items_in_order_with_a_grant_per_chunk():
+    """ the consumer gets every item, a chunk of credit is granted per chunk taken """
+    stream, grants = started_stream()
+    data = messages(("items", [1, 2]), ("items", [3]), ("end", None))
+    stream.data_received(data[:5])
+    stream.data_received(data[5:])
+    assert list(stream) == [1, 2, 3]
+    assert grants == [1, 1]
+    assert stream.failure is None
+
+def test_consumer_blocks_until_items_arrive():
+    """ iterating waits for chunks received on another thread """
+    stream, _ = started_stream()
+    threading.Timer(0.05, stream.data_received, \
+                    (messages(("items", ["late"]), ("end", None)),)).start()
+    assert list(stream) == ["late"]
+
+def test_failures_end_the_stream():
+    """ an error message, or a call failing before the end, is raised to the consumer """
+    stream, _ = started_stream()
+    stream.data_received(messages(("items", [1]), ("error", ValueError("bad item"))))
+    iterator = iter(stream)
+    assert next(iterator) == 1
+    with pytest.raises(ValueError):
+        next(iterator)
+    cut, _ = started_stream()
+    cut.data_received(messages(("items", [1])))
+    cut.finish()
+    with pytest.raises(RuntimeError):
+        list(cut)
+
+def test_close_cancels_the_generator():
+    """ closing a running stream sends a negative grant """
+    stream, grants = started_stream()
+    stream.data_received(messages(("items", [1, 2])))
+    stream.close()
+    assert grants == [-1]
+    assert list(stream) == []
+
+def test_async_iteration():
+    """ streams can be consumed with async for """
+    stream, _ = started_stream()
+    async def consume():
+        asyncio.get_event_loop().call_later(0.01, stream.data_received, \
+            messages(("items", ["a", "b"]), ("end", None)))
+        return [item async for item in stream]
+    assert asyncio.run(consume()) == ["a", "b"]
+
+def test_server_pauses_without_credit():
+    """ the producer waits for credit and is woken by grants or a cancellation """
+    registry = StreamRegistry()
+    stream = registry.open("s", 1)
+    async def produce():
+        await stream.wait_for_credit()
+        stream.credit = stream.credit - 1
+        waiting = asyncio.ensure_future(stream.wait_for_credit())
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+        assert registry.grant("s", 1)
+        await asyncio.wait_for(waiting, 1)
+        stream.credit = 0
+        waiting = asyncio.ensure_future(stream.wait_for_credit())
+        await asyncio.sleep(0.01)
+        stream.cancel()
+        await asyncio.wait_for(waiting, 1)
+    asyncio.run(produce())
+    assert stream.cancelled
+    registry.close("s")
+    assert not registry.grant("s", 1)
+
+def test_chunks_are_cut_by_count_and_end():
+    """ a chunk holds at most chunk_items items, the last one comes with the end """
+    generator = iter(range(5))
+    options = {"stream_id": "s", "chunk_items": 3, "chunk_time": 10.0}
+    data, finished = produce_chunk(generator, options)
+    assert not finished
+    assert wire.MessageReader().feed(data) == [("items", [0, 1, 2])]
+    data, finished = produce_chunk(generator, options)
+    assert finished
+    assert wire.MessageReader().feed(data) == [("items", [3, 4]), ("end", None)]
+
+def test_generator_failures_are_streamed():
+    """ an exception raised by the generator becomes the error message """
+    def failing():
+        yield 1
+        raise KeyError("gone")
+    data, finished = produce_chunk(failing(), \
+        {"stream_id": "s", "chunk_items": 10, "chunk_time": 10.0})
+    assert finished
+    objs = wire.MessageReader().feed(data)
+    assert objs[0] == ("items", [1])
+    assert objs[1][0] == "error" and isinstance(objs[1][1], KeyError)
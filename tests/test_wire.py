@@ -0,0 +1,69 @@
+""" tests of the binary request/response framing """
+import array
+import pickle
+import pytest
+from clupy.utils import wire
+
+def test_round_trip():
+    """ a decoded frame equals the encoded object """
+    obj = {"a": [1, 2.5, "three"], "b": (None, True), "c": b"bytes" * 100}
+    assert wire.decode_frame(b"".join(wire.encode_frame(obj))) == obj
+
+def test_buffers_are_kept_out_of_band():
+    """ contiguous buffers travel as chunks of their own, not copied into the pickle stream """
+    data = bytearray(b"x" * 4096)
+    chunks = wire.encode_frame(pickle_buffer(data))
+    if wire.OUT_OF_BAND:
+        assert len(chunks) == 3
+        assert chunks[2].nbytes == len(data)
+    decoded = wire.decode_frame(b"".join(chunks))
+    assert bytes(decoded) == bytes(data)
+
+def pickle_buffer(data):
+    """ a PickleBuffer of data, or data where pickle has no out-of-band buffers """
+    if wire.OUT_OF_BAND:
+        return pickle.PickleBuffer(data)
+    return data
+
+def test_frame_length():
+    """ the length counts every chunk """
+    chunks = wire.encode_frame(array.array("d", range(100)))
+    assert wire.frame_length(chunks) == len(b"".join(chunks))
+
+def test_malformed_frames_are_rejected():
+    """ short, foreign and truncated frames raise FrameError """
+    frame = b"".join(wire.encode_frame(list(range(100))))
+    with pytest.raises(wire.FrameError):
+        wire.decode_frame(b"CL")
+    with pytest.raises(wire.FrameError):
+        wire.decode_frame(b"XXXX" + frame[4:])
+    with pytest.raises(wire.FrameError):
+        wire.decode_frame(frame[:-10])
+
+def test_unpicklable_outcomes_become_failures():
+    """ an outcome whose value can not be pickled is turned into a failure """
+    succeeded, value = wire.picklable_outcome((True, lambda: None))
+    assert not succeeded
+    assert isinstance(value, RuntimeError)
+    assert wire.picklable_outcome((True, 1)) == (True, 1)
+
+def test_digest():
+    """ equal frames have equal digests """
+    chunks = wire.encode_frame(array.array("d", range(100)))
+    assert wire.digest_chunks(chunks) \
+        == wire.digest_chunks(wire.encode_frame(array.array("d", range(100))))
+    assert wire.digest_chunks(chunks) != wire.digest_chunks(wire.encode_frame([1]))
+
+def test_messages():
+    """ a request splits back into its meta data and payload frames, and a stream
+        of messages is decoded however its bytes are cut """
+    data = b"".join(wire.encode_request({"op": "call"}, [1, 2, 3]))
+    frames = wire.split_messages(data)
+    assert [wire.decode_frame(frame) for frame in frames] == [{"op": "call"}, [1, 2, 3]]
+    reader = wire.MessageReader()
+    objs = []
+    for index in range(0, len(data), 7):
+        objs.extend(reader.feed(data[index:index + 7]))
+    assert objs == [{"op": "call"}, [1, 2, 3]]
+    with pytest.raises(wire.FrameError):
+        wire.split_messages(data[:-1])